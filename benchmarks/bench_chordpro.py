@@ -0,0 +1,149 @@
+"""Benchmark chord/lyric merging on pathological lines.
+
+Usage: PYTHONPATH=src python benchmarks/bench_chordpro.py
+
+Compares parse.chord_and_lyrics with the previous character-at-a-time
+merge, checks they produce identical output, and checks the new merge
+scales linearly with line length. Exits non-zero if it does not.
+"""
+import itertools
+import random
+import re
+import sys
+import timeit
+
+import parse
+
+
+def legacy_chord_and_lyrics(chord_line, lyric_line):
+    """The original character-at-a-time merge, for comparison."""
+    chord_iter = itertools.chain(
+        parse.chord_indicies(chord_line),
+        itertools.repeat((-1, None)),
+    )
+    line_iter = enumerate(
+        itertools.chain(
+            lyric_line,
+            itertools.repeat(None),
+        ),
+    )
+    output = []
+
+    index, chord = next(chord_iter)
+    i, char = next(line_iter)
+    last_char = None
+    while chord or char:
+        if i == index:
+            if chord.startswith('(') and chord.endswith(')'):
+                output.append('{comment:' + chord + '}')
+            else:
+                if output and output[-1][-1] == ']':
+                    output.append(' ')
+                elif char == ' ' and last_char != ' ':
+                    output.append(' ')
+                output.append('[' + chord + ']')
+            skipped = 0
+            while char == ' ' and skipped < len(chord):
+                last_char = char
+                i, char = next(line_iter)
+                skipped += 1
+
+            index, chord = next(chord_iter)
+        else:
+            if char is None:
+                output.append(' ')
+                last_char = ' '
+            else:
+                output.append(char)
+                last_char = char
+            i, char = next(line_iter)
+
+    chordpro = ''.join(output).strip()
+    return re.sub('  +', ' ', chordpro)
+
+
+LYRICS = 'amazing grace how sweet the sound that saved a wretch like me '
+CHORDS = ['A', 'Bm7', 'C#m', 'D/F#', 'Esus4', '|', '(To Chorus)', 'Gadd9']
+
+
+def sparse_line(length):
+    """Long lyric line with a chord every 40 or so characters."""
+    lyrics = (LYRICS * (length // len(LYRICS) + 1))[:length]
+    chords = [' '] * length
+    for i in range(0, length - 10, 40):
+        chord = CHORDS[i % len(CHORDS)]
+        chords[i:i + len(chord)] = chord
+    return ''.join(chords), lyrics
+
+
+def dense_line(length):
+    """A chord on every other character, over a lyric line."""
+    lyrics = (LYRICS * (length // len(LYRICS) + 1))[:length]
+    chords = ' '.join('A' for _ in range(length // 2))
+    return chords, lyrics
+
+
+def padded_line(length):
+    """Chords far past the end of a short lyric line."""
+    chords = ' ' * (length - 5) + 'G/B'
+    return chords, 'word'
+
+
+def spaced_line(length):
+    """Mostly whitespace lyrics, as from badly extracted pdfs."""
+    chords = ' '.join(CHORDS * (length // 40))
+    return chords[:length], ' ' * (length - 4) + 'end'
+
+
+CASES = [sparse_line, dense_line, padded_line, spaced_line]
+SIZES = [1250, 2500, 5000, 10000]
+
+
+def check_identical(cases=2000):
+    rng = random.Random(1)
+    for _ in range(cases):
+        chords = ''.join(
+            rng.choice('ABCDm7#b/()| ') for _ in range(rng.randint(1, 60)))
+        lyrics = ''.join(
+            rng.choice('abc ]  ,-') for _ in range(rng.randint(1, 60)))
+        expected = legacy_chord_and_lyrics(chords, lyrics)
+        if parse.chord_and_lyrics(chords, lyrics) != expected:
+            sys.exit('output differs for {!r} {!r}'.format(chords, lyrics))
+    for case in CASES:
+        chords, lyrics = case(5000)
+        expected = legacy_chord_and_lyrics(chords, lyrics)
+        if parse.chord_and_lyrics(chords, lyrics) != expected:
+            sys.exit('output differs for {}'.format(case.__name__))
+
+
+def best_time(func, *args, number=5):
+    return min(timeit.repeat(lambda: func(*args), number=number, repeat=3))
+
+
+def main():
+    check_identical()
+    print('{:<12} {:>6} {:>10} {:>10}'.format(
+        'case', 'chars', 'legacy ms', 'span ms'))
+    nonlinear = []
+    for case in CASES:
+        times = []
+        for size in SIZES:
+            chords, lyrics = case(size)
+            legacy = best_time(legacy_chord_and_lyrics, chords, lyrics)
+            span = best_time(parse.chord_and_lyrics, chords, lyrics)
+            times.append(span)
+            print('{:<12} {:>6} {:>10.3f} {:>10.3f}'.format(
+                case.__name__, size, legacy / 5 * 1000, span / 5 * 1000))
+        # 8x the input should take about 8x the time, allow for noise
+        growth = times[-1] / times[0]
+        if growth > 8 * 2:
+            nonlinear.append((case.__name__, growth))
+
+    for name, growth in nonlinear:
+        print('{}: 8x input took {:.1f}x time'.format(name, growth))
+    if nonlinear:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark encoding detection for onsong and chordpro files.
+
+Usage: PYTHONPATH=src python benchmarks/bench_encoding.py [DIR]
+
+Compares parse.detect_encoding with running chardet over the whole file,
+over every .onsong/.cho/.txt/.chopro file in DIR (e.g. an OnSong export),
+or a generated corpus of utf8, utf-16 and cp1252 songs. Reports which step
+decided each file, and exits non-zero if any file decodes differently.
+"""
+from collections import Counter
+from pathlib import Path
+import sys
+import time
+
+import chardet
+
+import parse
+
+VERSE = """\
+{comment: Verse %d}
+[G]Amazing grace how [C]sweet the [G]sound
+That saved a wretch like [D]me – café
+[G]I once was lost but [C]now am [G]found
+Was blind but [D]now I [G]see
+"""
+
+# roughly the mix we see: mostly utf8, some utf-16 and windows exports
+MIX = [('utf8', 14), ('utf-16', 3), ('cp1252', 2), ('utf-8-sig', 1)]
+
+
+def legacy_decode(raw):
+    encoding = chardet.detect(raw)['encoding']
+    if 'UTF-16' in encoding:
+        encoding = 'UTF-16'
+    return raw.decode(encoding)
+
+
+def generated_corpus():
+    corpus = []
+    for i in range(10):
+        text = '{title: Song %d}\n{key: G}\n\n' % i
+        text += '\n'.join(VERSE % v for v in range(1, 4 + i))
+        for encoding, count in MIX:
+            corpus.extend([text.encode(encoding)] * count)
+    return corpus
+
+
+def load_corpus(directory):
+    return [
+        path.read_bytes() for path in sorted(Path(directory).rglob('*'))
+        if path.suffix in parse.ONSONG_FILES
+    ]
+
+
+def timed(function, corpus):
+    start = time.perf_counter()
+    results = [function(raw) for raw in corpus]
+    return results, time.perf_counter() - start
+
+
+def main():
+    if len(sys.argv) > 1:
+        corpus = load_corpus(sys.argv[1])
+    else:
+        corpus = generated_corpus()
+    if not corpus:
+        sys.exit('no song files found')
+
+    legacy, legacy_time = timed(legacy_decode, corpus)
+    layered, layered_time = timed(parse.decode_text, corpus)
+    mix = Counter(how for _, how in map(parse.detect_encoding, corpus))
+
+    print('{} files, {:.1f}KB'.format(
+        len(corpus), sum(map(len, corpus)) / 1024))
+    print('decided by: ' + ', '.join(
+        '{} {}'.format(count, how) for how, count in mix.most_common()))
+    print('chardet:  {:8.1f}ms'.format(legacy_time * 1000))
+    print('layered:  {:8.1f}ms  ({:.0f}x faster)'.format(
+        layered_time * 1000, legacy_time / layered_time))
+
+    differ = sum(1 for old, new in zip(legacy, layered) if old != new)
+    if differ:
+        print('FAIL: {} files decode differently'.format(differ))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
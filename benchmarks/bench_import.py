@@ -0,0 +1,95 @@
+"""Benchmark the cold start of a chordpro-only build.
+
+Usage: PYTHONPATH=src python benchmarks/bench_import.py [threshold_ms]
+
+Runs a --debug build of a directory of chordpro files in a fresh
+interpreter with -X importtime, and reports the import cost of each top
+level module. Exits non-zero if any pdf tooling is imported, or if the
+total import time is over the threshold (default 250ms).
+"""
+import os
+from pathlib import Path
+import re
+import subprocess
+import sys
+import tempfile
+
+THRESHOLD_MS = 250
+
+# modules a chordpro-only build should never load
+PDF_MODULES = ('pdfrw', 'pdftitle', 'pdfminer', 'pdfmeta')
+
+SONG = """\
+{title: Song %d}
+{key: G}
+
+{comment: Verse 1}
+[G]Amazing grace how [C]sweet the [G]sound
+That saved a wretch like [D]me
+"""
+
+BUILD = (
+    'import sys, build;'
+    'build.main(build.parser.parse_args(sys.argv[1:]))'
+)
+
+IMPORTTIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def run_build(input_dir, build_dir):
+    """Run a build, returning {module: (self_us, cumulative_us, depth)}."""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', BUILD,
+         str(input_dir), str(build_dir), '--debug', '--no-cache',
+         '--no-manifest'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        env=dict(os.environ), check=True,
+    )
+    modules = {}
+    for line in proc.stderr.decode('utf8').splitlines():
+        match = IMPORTTIME.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            modules[name] = (int(own), int(cumulative), len(indent) // 2)
+    return modules
+
+
+def main():
+    threshold = float(sys.argv[1]) if len(sys.argv) > 1 else THRESHOLD_MS
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_dir = Path(tmp) / 'input'
+        input_dir.mkdir()
+        for i in range(10):
+            (input_dir / '{}-song.cho'.format(i)).write_text(SONG % i)
+        # the first run warms the bytecode cache, the second is measured
+        run_build(input_dir, Path(tmp) / 'build')
+        modules = run_build(input_dir, Path(tmp) / 'build')
+
+    top_level = sorted(
+        ((cumulative, name) for name, (_, cumulative, depth)
+         in modules.items() if depth == 0),
+        reverse=True,
+    )
+    total_ms = sum(cumulative for cumulative, _ in top_level) / 1000
+
+    print('top level imports for a chordpro-only build:')
+    for cumulative, name in top_level[:15]:
+        print('  {:>8.1f}ms  {}'.format(cumulative / 1000, name))
+    print('  {:>8.1f}ms  total ({} modules)'.format(total_ms, len(modules)))
+
+    failed = False
+    loaded = sorted(
+        name for name in modules if name.split('.')[0] in PDF_MODULES)
+    if loaded:
+        print('FAIL: pdf modules imported: {}'.format(', '.join(loaded)))
+        failed = True
+    if total_ms > threshold:
+        print('FAIL: imports took {:.1f}ms, over {:.0f}ms'.format(
+            total_ms, threshold))
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
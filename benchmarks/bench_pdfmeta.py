@@ -0,0 +1,70 @@
+"""Compare pdfmeta.read_info with pdfrw's PdfReader(...).Info.
+
+Usage: PYTHONPATH=src python benchmarks/bench_pdfmeta.py [PDF ...]
+
+Without arguments, synthetic multi-page pdfs are generated.
+"""
+import io
+import sys
+import timeit
+
+from pdfrw import PdfDict, PdfName, PdfReader, PdfString, PdfWriter
+from pdfrw.objects import IndirectPdfDict
+
+import pdfmeta
+
+
+LINE = '(Amazing grace how sweet the sound that saved a wretch like me) Tj\n'
+
+
+def make_pdf(pages):
+    writer = PdfWriter()
+    for i in range(pages):
+        content = PdfDict(stream='BT /F1 12 Tf 72 720 Td\n' + LINE * 40 + 'ET')
+        writer.addpage(PdfDict(
+            Type=PdfName.Page,
+            MediaBox=[0, 0, 612, 792],
+            Contents=content,
+            Resources=PdfDict(Font=PdfDict(F1=PdfDict(
+                Type=PdfName.Font,
+                Subtype=PdfName.Type1,
+                BaseFont=PdfName.Helvetica,
+            ))),
+        ))
+    writer.trailer.Info = IndirectPdfDict(
+        Title=PdfString.encode('Amazing Grace'),
+        Author=PdfString.encode('John Newton'),
+    )
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def bench(name, data, number=20):
+    pdfrw = min(timeit.repeat(
+        lambda: PdfReader(fdata=data).Info, number=number, repeat=3))
+    trailer = min(timeit.repeat(
+        lambda: pdfmeta.read_info(data), number=number, repeat=3))
+    print('{:<30} {:>8} {:>10.3f} {:>10.3f} {:>8.1f}x'.format(
+        name,
+        len(data) // 1024,
+        pdfrw / number * 1000,
+        trailer / number * 1000,
+        pdfrw / trailer,
+    ))
+
+
+def main(paths):
+    print('{:<30} {:>8} {:>10} {:>10} {:>9}'.format(
+        'pdf', 'KiB', 'pdfrw ms', 'trailer ms', 'speedup'))
+    if paths:
+        for path in paths:
+            with open(path, 'rb') as f:
+                bench(path, f.read())
+    else:
+        for pages in (1, 10, 100, 500):
+            bench('{} pages'.format(pages), make_pdf(pages))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
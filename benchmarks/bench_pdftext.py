@@ -0,0 +1,196 @@
+"""Compare pdftext's in-process extraction with pdftotext's, on song pdfs.
+
+Usage: PYTHONPATH=src python benchmarks/bench_pdftext.py [COUNT]
+
+Renders COUNT (default 100) generated songs as pdfs in Helvetica, with
+each chord drawn over the lyric character it belongs to, and the numbers
+of half the chords as raised superscripts, as some publishers do. Each
+pdf's text is extracted both ways, and timed, then parsed, and the parsed
+sections compared with those parsed from the song's own layout text.
+pdftotext is skipped if it is not installed.
+"""
+import io
+import shutil
+import subprocess
+import sys
+import time
+
+from pdfrw import PdfArray, PdfDict, PdfName, PdfWriter
+
+import parse
+import pdftext
+
+import corpus
+
+SIZE = 11
+LEADING = 14
+TOP = 760
+BOTTOM = 60
+LEFT = 72
+
+
+def width(text, size=SIZE):
+    return sum(
+        pdftext.HELVETICA_WIDTHS.get(ord(c), pdftext.DEFAULT_WIDTH)
+        for c in text) * size / 1000
+
+
+def escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def draw(x, y, text):
+    return 'BT /F1 {} Tf {:.2f} {} Td ({}) Tj ET'.format(
+        SIZE, x, y, escape(text))
+
+
+def draw_chord(x, y, chord, superscript):
+    # trailing numbers, like the 7 of Am7, raised and smaller
+    base = chord.rstrip('0123456789')
+    if not superscript or base == chord or '/' in chord:
+        return draw(x, y, chord)
+    return 'BT /F1 {} Tf {:.2f} {} Td ({}) Tj /F1 8 Tf 3 Ts ({}) Tj ET'.format(
+        SIZE, x, y, escape(base), chord[len(base):])
+
+
+def draw_line(y, chords, lyrics, superscript):
+    """Draw a chord line over its lyrics, each chord over its column.
+
+    Where a chord would run into the one before it, the rest of the lyrics
+    are moved along to make room, as typesetters do.
+    """
+    lyrics = lyrics.ljust(len(chords))
+    ops = []
+    shift = 0
+    end = start = 0
+    for position, chord in corpus.chord_positions(chords):
+        x = LEFT + width(lyrics[:position]) + shift
+        if x < end:
+            ops.append(draw(
+                LEFT + width(lyrics[:start]) + shift, y,
+                lyrics[start:position]))
+            start = position
+            shift += end - x
+            x = end
+        superscript = not superscript
+        ops.append(draw_chord(x, y + LEADING, chord, superscript))
+        end = x + width(chord + ' ')
+    ops.append(draw(
+        LEFT + width(lyrics[:start]) + shift, y, lyrics[start:].rstrip()))
+    return ops, superscript
+
+
+def song_pages(song):
+    """The operators drawing each page of a song."""
+    lines = corpus.layout_text(song).split('\n')
+    pages = [[]]
+    y = TOP
+    superscript = False
+    chords = None
+    for line in lines:
+        if chords is None and parse.is_chord_text(line):
+            chords = line
+            continue
+        if chords is not None:
+            # the chord line takes the line above the lyrics
+            y -= LEADING
+        if y < BOTTOM:
+            pages.append([])
+            y = TOP
+        if chords is not None:
+            ops, superscript = draw_line(y, chords, line, superscript)
+            pages[-1].extend(ops)
+            chords = None
+        elif line:
+            pages[-1].append(draw(LEFT, y, line))
+        y -= LEADING
+    return pages
+
+
+def make_pdf(song):
+    font = PdfDict(
+        Type=PdfName.Font,
+        Subtype=PdfName.Type1,
+        BaseFont=PdfName.Helvetica,
+        FirstChar=32,
+        LastChar=126,
+        Widths=PdfArray(pdftext.HELVETICA_WIDTHS[c] for c in range(32, 127)),
+    )
+    writer = PdfWriter()
+    for page in song_pages(song):
+        writer.addpage(PdfDict(
+            Type=PdfName.Page,
+            MediaBox=[0, 0, 612, 792],
+            Contents=PdfDict(stream='\n'.join(page)),
+            Resources=PdfDict(Font=PdfDict(F1=font)),
+        ))
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def pdftotext(data):
+    proc = subprocess.run(
+        parse.PDFTOTEXT, input=data, stdout=subprocess.PIPE, check=True)
+    return proc.stdout.decode('utf8')
+
+
+def in_process(data):
+    return pdftext.extract_text(data, parse.is_chord_text)
+
+
+def sections(text):
+    song = parse.parse_pdf_sheet(
+        parse.new_song(), parse.clean_pdf_text(text), b'')
+    return song['sections']
+
+
+def compare(extract, pdfs, expected):
+    """The time extract takes, and how many songs and lines it gets right."""
+    start = time.perf_counter()
+    texts = [extract(data) for data in pdfs]
+    elapsed = time.perf_counter() - start
+    songs = lines = total = 0
+    for text, want in zip(texts, expected):
+        got = sections(text)
+        songs += got == want
+        for name, section in want.items():
+            want_lines = section.split('\n')
+            got_lines = got.get(name, '').split('\n')
+            total += len(want_lines)
+            lines += sum(a == b for a, b in zip(want_lines, got_lines))
+    return elapsed, songs, lines, total
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    songs = corpus.songs(count)
+    pdfs = [make_pdf(song) for song in songs]
+    expected = [sections(corpus.layout_text(song)) for song in songs]
+
+    extractors = [('pdftext', in_process)]
+    if shutil.which('pdftotext'):
+        extractors.append(('pdftotext', pdftotext))
+    else:
+        print('pdftotext is not installed, so is skipped')
+
+    print('{} songs, {:.0f}KB of pdf'.format(
+        count, sum(map(len, pdfs)) / 1024))
+    print('{:<10} {:>10} {:>10} {:>8} {:>8}'.format(
+        '', 'total', 'per song', 'songs', 'lines'))
+    failed = False
+    for name, extract in extractors:
+        elapsed, right, lines, total = compare(extract, pdfs, expected)
+        print('{:<10} {:>8.0f}ms {:>8.2f}ms {:>7.0f}% {:>7.1f}%'.format(
+            name, elapsed * 1000, elapsed / count * 1000,
+            right / count * 100, lines / total * 100))
+        if name == 'pdftext' and right < count:
+            failed = True
+    if failed:
+        print('FAIL: pdftext did not parse every song as expected')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
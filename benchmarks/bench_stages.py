@@ -0,0 +1,179 @@
+"""Time each parsing stage over a synthetic corpus, against a baseline.
+
+Usage: PYTHONPATH=src python benchmarks/bench_stages.py [--update]
+           [--tolerance PERCENT] [--size SIZE ...]
+
+Each stage is timed over the small, medium and large corpora from
+corpus.py, taking the best of several runs. Times are stored relative to a
+fixed pure Python workload, so a baseline recorded on one machine is still
+meaningful on another. Exits non-zero if any stage is still more than
+--tolerance percent (default 25, or $BENCH_TOLERANCE) slower than
+benchmarks/baseline.json after being retimed. --update records the
+current times as the new baseline instead.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+from pathlib import Path
+import sys
+import tempfile
+import timeit
+
+import build
+import parse
+
+import corpus
+
+BASELINE = Path(__file__).parent / 'baseline.json'
+REPEAT = 5
+RETRIES = 2
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    '--update', default=False, action='store_true',
+    help='record the results as the new baseline',
+)
+parser.add_argument(
+    '--tolerance', type=float,
+    default=float(os.environ.get('BENCH_TOLERANCE', 25)),
+    help='percent slower than the baseline that fails (default: 25)',
+)
+parser.add_argument(
+    '--size', action='append', choices=sorted(corpus.SIZES),
+    help='corpus sizes to run (default: all)',
+)
+
+
+def calibration():
+    """A fixed pure Python workload, to normalise times by."""
+    words = corpus.WORDS * 50
+    for _ in range(20):
+        sorted(word.upper() + str(i) for i, word in enumerate(words))
+
+
+def stage_functions(songs, tmp):
+    """The stages to time, as name: function pairs."""
+    pairs = [line for song in songs['songs']
+             for _, section in song['sections'] for line in section]
+    chord_lines = [chords for chords, _ in pairs]
+    layout_lines = [text.split('\n')[3:] for text in songs['layout']]
+    tokens = [parse.tokenise_chords(line)
+              for lines in layout_lines for line in lines]
+
+    input_dir = tmp / 'input'
+    input_dir.mkdir()
+    for i, data in enumerate(songs['chordpro']):
+        (input_dir / '{:03}-song.cho'.format(i)).write_bytes(data)
+    build_args = build.parser.parse_args([
+        str(input_dir), str(tmp / 'build'), '--debug', '--no-cache',
+        '--no-manifest',
+    ])
+    build_args.build.mkdir()
+
+    def run_build():
+        # without build.main's debug logging
+        with contextlib.redirect_stdout(io.StringIO()):
+            build.build(build_args)
+
+    return {
+        'tokenise_chords': lambda: [
+            parse.tokenise_chords(line) for line in chord_lines],
+        'is_chord_line': lambda: [
+            parse.is_chord_line(line_tokens) for line_tokens in tokens],
+        'chordpro_line': lambda: [
+            parse.chordpro_line(chords, lyrics) for chords, lyrics in pairs],
+        'parse_sections': lambda: [
+            parse.parse_sections(parse.new_song(), parse.lex_lines(lines))
+            for lines in layout_lines],
+        'parse_onsong': lambda: [
+            parse.parse_onsong_bytes(data) for data in songs['onsong']],
+        'build': run_build,
+    }
+
+
+def best_time(function):
+    """The best time of function, and of the calibration workload.
+
+    They are timed alternately, so both see the same machine load.
+    """
+    timer = timeit.Timer(function)
+    unit_timer = timeit.Timer(calibration)
+    number, _ = timer.autorange()
+    unit_number, _ = unit_timer.autorange()
+    times = []
+    unit_times = []
+    for _ in range(REPEAT):
+        times.append(timer.timeit(number) / number)
+        unit_times.append(unit_timer.timeit(unit_number) / unit_number)
+    return min(times), min(unit_times)
+
+
+def run(sizes, baseline, tolerance):
+    """Time every stage, returning {size: {stage: (seconds, relative)}}.
+
+    Stages slower than the baseline are timed again, up to RETRIES times,
+    so a burst of load on the machine does not fail the run.
+    """
+    results = {}
+    for size in sizes:
+        songs = corpus.corpus(size)
+        results[size] = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            functions = stage_functions(songs, Path(tmp))
+            for name, function in functions.items():
+                limit = baseline.get(size, {}).get(name, float('inf'))
+                limit *= 1 + tolerance / 100
+                best = None
+                for _ in range(RETRIES + 1):
+                    seconds, unit = best_time(function)
+                    if best is None or seconds / unit < best[1]:
+                        best = (seconds, seconds / unit)
+                    if best[1] <= limit:
+                        break
+                results[size][name] = best
+    return results
+
+
+def main(args):
+    sizes = args.size or sorted(corpus.SIZES, key=corpus.SIZES.get)
+    try:
+        baseline = json.loads(BASELINE.read_text())
+    except FileNotFoundError:
+        baseline = {}
+    results = run(sizes, {} if args.update else baseline, args.tolerance)
+
+    if args.update:
+        for size, stages in results.items():
+            baseline[size] = {
+                name: relative for name, (_, relative) in stages.items()}
+        BASELINE.write_text(
+            json.dumps(baseline, indent=4, sort_keys=True) + '\n')
+        print('wrote {}'.format(BASELINE))
+
+    regressed = []
+    print('{:<8} {:<16} {:>10} {:>10}'.format(
+        'size', 'stage', 'time', 'change'))
+    for size, stages in results.items():
+        for name, (seconds, relative) in stages.items():
+            expected = baseline.get(size, {}).get(name)
+            if expected:
+                change = (relative / expected - 1) * 100
+                change_text = '{:+.1f}%'.format(change)
+                if change > args.tolerance:
+                    regressed.append('{} {}'.format(size, name))
+            else:
+                change_text = 'new'
+            print('{:<8} {:<16} {:>8.2f}ms {:>10}'.format(
+                size, name, seconds * 1000, change_text))
+
+    if regressed:
+        print('FAIL: more than {:.0f}% slower: {}'.format(
+            args.tolerance, ', '.join(regressed)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,79 @@
+"""Benchmark building transposition tables for a library of songs.
+
+Usage: PYTHONPATH=src python benchmarks/bench_transpose.py [COUNT]
+
+Times transpose.add_transpositions over COUNT (default 500) generated
+songs, cold and with the chord cache warm, and compares it with
+rewriting every chord in every section for each of the 12 keys, which is
+what the tablet would otherwise do on each key change. Also reports how
+much the tables add to the setlist JSON.
+"""
+import json
+import re
+import sys
+import time
+
+import parse
+import transpose
+
+import corpus
+
+
+def parse_songs(count):
+    songs = [
+        parse.parse_onsong_bytes(corpus.onsong_text(song).encode('utf8'))
+        for song in corpus.songs(count)
+    ]
+    parse.add_inferred_keys(songs)
+    return songs
+
+
+def rewrite_sections(songs):
+    """Transpose every chord of every section into each key."""
+    for song in songs:
+        tonic, _ = transpose.parse_key(song['key'])
+        for semitones in range(1, 12):
+            key = transpose.MAJOR_KEYS[(tonic + semitones) % 12]
+            for section in song['sections'].values():
+                re.sub(
+                    r'\[(.*?)\]',
+                    lambda m: '[{}]'.format(transpose.transpose_chord(
+                        m.group(1), semitones, key)),
+                    section)
+
+
+def timed(function, songs):
+    start = time.perf_counter()
+    function(songs)
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    songs = parse_songs(count)
+    before = len(json.dumps(songs))
+
+    transpose.transpose_chord.cache_clear()
+    transpose.transposed_chord.cache_clear()
+    cold = timed(transpose.add_transpositions, songs)
+    warm = timed(transpose.add_transpositions, songs)
+    rewrite = timed(rewrite_sections, songs)
+    after = len(json.dumps(songs))
+
+    chords = sum(
+        len(song['transpositions'][song['key']]) for song in songs)
+    print('{} songs, {} distinct chords per song'.format(
+        count, round(chords / count, 1)))
+    print('tables (cold): {:8.1f}ms  {:6.1f}us/song'.format(
+        cold * 1000, cold / count * 1e6))
+    print('tables (warm): {:8.1f}ms  {:6.1f}us/song'.format(
+        warm * 1000, warm / count * 1e6))
+    print('rewrite:       {:8.1f}ms  {:6.1f}us/song'.format(
+        rewrite * 1000, rewrite / count * 1e6))
+    print('setlist JSON:  +{:.0f}% ({:.1f}KB per song)'.format(
+        (after / before - 1) * 100, (after - before) / count / 1024))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Generate a reproducible synthetic corpus of songs for benchmarks.
+
+Each song is rendered as pdftotext-style layout text, with chord lines
+over lyric lines, as an OnSong file with inline chords, and as chordpro.
+The same seed always gives the same corpus.
+"""
+import random
+
+CHORDS = [
+    'G', 'C', 'D', 'Em', 'Am7', 'D/F#', 'Csus2', 'Bm', 'A7', 'Gmaj7',
+    'F#m7b5', 'Esus4', 'Dadd9', 'Cmaj7', 'Em7', 'G/B', 'A', 'E',
+]
+WORDS = """
+amazing grace how sweet the sound that saved a wretch like me i once was
+lost but now am found blind see praise lord holy mighty king glory forever
+heart soul sing love light hope faith name above all earth heaven
+""".split()
+SECTIONS = [
+    'Verse 1', 'Chorus', 'Verse 2', 'Chorus', 'Bridge', 'Verse 3', 'Chorus',
+    'Ending',
+]
+KEYS = ['G', 'C', 'D', 'A', 'E', 'F', 'Bb', 'Eb']
+
+# number of songs in each corpus size
+SIZES = {'small': 10, 'medium': 50, 'large': 200}
+
+
+def make_line(rng):
+    """A (chords, lyrics) pair, with chords over some word starts."""
+    words = [rng.choice(WORDS) for _ in range(rng.randint(5, 10))]
+    chords = ''
+    position = 0
+    for word in words:
+        # chords need a space between them
+        if rng.random() < 0.4 and (not chords or len(chords) < position):
+            chords = chords.ljust(position) + rng.choice(CHORDS)
+        position += len(word) + 1
+    return chords, ' '.join(words)
+
+
+def make_song(rng, i):
+    sections = []
+    for name in SECTIONS[:rng.randint(3, len(SECTIONS))]:
+        lines = [make_line(rng) for _ in range(rng.randint(2, 6))]
+        sections.append((name, lines))
+    return {
+        'title': 'Song {} {}'.format(i, rng.choice(WORDS).title()),
+        'author': 'Author {}'.format(rng.randint(1, 20)),
+        'key': rng.choice(KEYS),
+        'ccli': str(rng.randint(1000000, 9999999)),
+        'sections': sections,
+    }
+
+
+def inline(chords, lyrics):
+    """Merge a chord line into its lyrics, chordpro style."""
+    out = []
+    end = None
+    for position, chord in reversed(list(chord_positions(chords))):
+        lyrics = lyrics.ljust(position)
+        out.append('[' + chord + ']' + lyrics[position:end])
+        end = position
+    return lyrics[:end] + ''.join(reversed(out))
+
+
+def chord_positions(chords):
+    position = 0
+    for token in chords.split(' '):
+        if token:
+            yield position, token
+        position += len(token) + 1
+
+
+def layout_text(song):
+    lines = [
+        '{}      Key - {}'.format(song['title'], song['key']),
+        '{}      Tempo - 72 | Time - 4/4'.format(song['author']),
+        '',
+    ]
+    for name, section in song['sections']:
+        lines.append(name)
+        for chords, lyrics in section:
+            lines.extend([chords, lyrics])
+        lines.append('')
+    lines.extend([
+        'CCLI Song # {}'.format(song['ccli']),
+        '© Public Domain',
+        'For use solely with the SongSelect Terms of Use.',
+        'CCLI License # 123456',
+    ])
+    return '\n'.join(lines) + '\n'
+
+
+def onsong_text(song):
+    lines = [song['title'], song['author'], 'Key: ' + song['key'], '']
+    for name, section in song['sections']:
+        lines.append(name + ':')
+        lines.extend(inline(chords, lyrics) for chords, lyrics in section)
+        lines.append('')
+    lines.append('CCLI Song # {}'.format(song['ccli']))
+    return '\n'.join(lines) + '\n'
+
+
+def chordpro_text(song):
+    lines = [
+        '{title: ' + song['title'] + '}',
+        '{artist: ' + song['author'] + '}',
+        '{key: ' + song['key'] + '}',
+        '',
+    ]
+    for name, section in song['sections']:
+        lines.append('{comment: ' + name + '}')
+        lines.extend(inline(chords, lyrics) for chords, lyrics in section)
+        lines.append('')
+    return '\n'.join(lines) + '\n'
+
+
+def songs(count, seed=0):
+    rng = random.Random(seed)
+    return [make_song(rng, i) for i in range(count)]
+
+
+def corpus(size, seed=0):
+    """The layout, onsong and chordpro texts of a corpus size's songs."""
+    generated = songs(SIZES[size], seed)
+    return {
+        'songs': generated,
+        'layout': [layout_text(song) for song in generated],
+        'onsong': [onsong_text(song).encode('utf8') for song in generated],
+        'chordpro': [
+            chordpro_text(song).encode('utf8') for song in generated],
+    }
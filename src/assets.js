@@ -0,0 +1,29 @@
+// Decodes song pdfs from the embedded assets container built by assets.py.
+// Each entry is base64 decoded and decompressed only when it is needed.
+// Browsers without DecompressionStream decompress it with inflate.js.
+
+import { inflate } from './inflate'
+
+function decodeBase64 (text, size) {
+  const raw = window.atob(text)
+  const bytes = new Uint8Array(size)
+  for (let i = 0; i < size; i += 1) {
+    bytes[i] = raw.charCodeAt(i)
+  }
+  return bytes
+}
+
+function loadAsset (container, id) {
+  const [offset, length, size] = container.toc[id]
+  const compressed = decodeBase64(container.data.substr(offset, length), size)
+  if (typeof DecompressionStream === 'undefined') {
+    return Promise.resolve().then(() => inflate(compressed))
+  }
+  const stream = new Blob([compressed]).stream()
+    .pipeThrough(new DecompressionStream(container.codec))
+  return new Response(stream).arrayBuffer().then(b => new Uint8Array(b))
+}
+
+export {
+  loadAsset
+}
@@ -0,0 +1,62 @@
+"""A compact container for the fallback pdfs embedded in the html page.
+
+Each distinct pdf is compressed with zlib, and the results concatenated into
+one blob that is base64 encoded as it is written out, one pdf at a time. A
+table of contents, written after the data, maps each song id to its pdf's
+slice of the base64 text. Every entry is padded to a multiple of 3 bytes,
+so that its slice decodes on its own, and the page only has to decode and
+decompress a song's pdf when that song is shown.
+
+zlib is used rather than lzma because browsers can decompress it natively,
+with DecompressionStream('deflate'), and older ones with the small inflate
+in inflate.js.
+"""
+import base64
+import hashlib
+import zlib
+
+
+CODEC = 'deflate'
+# bytes encoded at a time, a multiple of 3 so the chunks join up
+CHUNK_SIZE = 48 * 1024
+
+
+def pack(pdfs, toc):
+    """Compress and base64 encode an iterable of (song_id, pdf bytes),
+    yielding the data a chunk at a time.
+
+    Only one pdf is compressed at a time, and toc is filled in as the data
+    is yielded, with {song_id: [offset, length, size]}, where offset and
+    length index the base64 data, and size is the length of the compressed
+    pdf once decoded.
+    """
+    seen = {}
+    offset = 0
+
+    for song_id, pdf in pdfs:
+        digest = hashlib.sha256(pdf).digest()
+        if digest not in seen:
+            compressed = zlib.compress(pdf, 9)
+            # pad to a base64 boundary, so each entry decodes independently
+            entry = compressed + b'\0' * (-len(compressed) % 3)
+            length = len(entry) // 3 * 4
+            seen[digest] = [offset, length, len(compressed)]
+            offset += length
+            for i in range(0, len(entry), CHUNK_SIZE):
+                chunk = entry[i:i + CHUNK_SIZE]
+                yield base64.b64encode(chunk).decode('ascii')
+        toc[song_id] = seen[digest]
+
+
+def container(pdfs):
+    """Pack pdfs into a whole container dict, as the page reads it."""
+    toc = {}
+    data = ''.join(pack(pdfs, toc))
+    return {'codec': CODEC, 'data': data, 'toc': toc}
+
+
+def unpack(container, song_id):
+    """Extract a song's pdf from a container, as the page does."""
+    offset, length, size = container['toc'][song_id]
+    compressed = base64.b64decode(container['data'][offset:offset + length])
+    return zlib.decompress(compressed[:size])
@@ -0,0 +1,157 @@
+"""Build every set in an mbox or Maildir archive across a process pool.
+
+Each message is extracted, parsed and built into its own directory under
+OUTPUT, named after its Message-Id, so a term's worth of sets only pays the
+interpreter and import startup once per worker rather than once per set.
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import email.parser
+import io
+import mailbox
+import os
+from pathlib import Path
+import re
+import time
+
+import build
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    'archive', type=Path, help='mbox file or Maildir directory of sets')
+parser.add_argument('output', type=Path,
+                    help='directory to build each set in')
+parser.add_argument(
+    '--jobs', '-j', type=int, default=os.cpu_count(),
+    help='number of sets to build at once (default: number of cpus)',
+)
+parser.add_argument(
+    'options', nargs=argparse.REMAINDER,
+    help='options passed to build for each set, e.g. --template',
+)
+
+
+def open_archive(path):
+    if path.is_dir():
+        return mailbox.Maildir(str(path), factory=None, create=False)
+    return mailbox.mbox(str(path), factory=None, create=False)
+
+
+def set_name(message_id, key):
+    """A directory name for a message, from its Message-Id."""
+    name = (message_id or '').strip().strip('<>')
+    name = re.sub(r'[^\w.@+-]+', '_', name).strip('._')
+    return name or 'message-{}'.format(key)
+
+
+def message_name(data, key):
+    """A directory name for the raw email in data."""
+    headers = email.parser.BytesHeaderParser().parsebytes(data)
+    return set_name(headers['Message-Id'], key)
+
+
+def read_messages(archive):
+    """Yield (name, bytes) for each message, with unique names."""
+    box = open_archive(archive)
+    names = set()
+    try:
+        for key in box.keys():
+            data = box.get_bytes(key)
+            name = base = message_name(data, key)
+            count = 1
+            while name in names:
+                count += 1
+                name = '{}-{}'.format(base, count)
+            names.add(name)
+            yield name, data
+    finally:
+        box.close()
+
+
+def build_message(name, data, build_dir, options):
+    """Build one set into build_dir, returning a summary dict rather than
+    raising."""
+    start = time.perf_counter()
+    result = {'name': name, 'songs': 0, 'error': None}
+    try:
+        set_args = build.parser.parse_args(
+            [name, str(build_dir)] + options)
+        set_args.build.mkdir(parents=True, exist_ok=True)
+        build.start_deadline(set_args)
+        build_dir = None if set_args.in_memory else set_args.build
+        raw_setlist = build.extract_message(io.BytesIO(data), build_dir)
+        cache = build.get_cache(set_args)
+        parsed = [
+            build.parse_attachment(filename, payload, cache)
+            for filename, payload in raw_setlist['attachments']
+        ]
+        # keep the workers' song listings out of the summary
+        with contextlib.redirect_stdout(io.StringIO()):
+            setlist = build.build_setlist(
+                set_args, raw_setlist, parsed, build.get_library(set_args))
+        result['songs'] = len(setlist['songs'])
+    except (Exception, SystemExit) as e:
+        result['error'] = str(e) or type(e).__name__
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def shared_cache(options, output):
+    """Add a cache shared by all sets to the build options, if unset.
+
+    Songs are often repeated across sets, so are only parsed once.
+    """
+    if any(option.startswith('--cache') or option == '--no-cache'
+           for option in options):
+        return options
+    return options + ['--cache', str(output / '.cache')]
+
+
+def build_archive(args):
+    """Build every message in args.archive, returning a list of results."""
+    if args.jobs <= 1:
+        return [
+            build_message(name, data, args.output / name, args.options)
+            for name, data in read_messages(args.archive)
+        ]
+    with concurrent.futures.ProcessPoolExecutor(args.jobs) as executor:
+        futures = [
+            executor.submit(
+                build_message, name, data, args.output / name, args.options)
+            for name, data in read_messages(args.archive)
+        ]
+        return [future.result() for future in futures]
+
+
+def print_summary(results, seconds):
+    for result in results:
+        if result['error']:
+            status = 'FAILED: {}'.format(result['error'])
+        else:
+            status = '{} songs'.format(result['songs'])
+        print('{:>8.0f}ms  {}  {}'.format(
+            result['seconds'] * 1000, result['name'], status))
+
+    failed = sum(1 for result in results if result['error'])
+    total = sum(result['seconds'] for result in results)
+    print('built {} sets, {} failed, in {:.1f}s ({:.1f}s of work)'.format(
+        len(results) - failed, failed, seconds, total))
+
+
+def main(args):
+    if not args.archive.exists():
+        parser.error('{} does not exist'.format(args.archive))
+    args.options = shared_cache(args.options, args.output)
+    args.output.mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    results = build_archive(args)
+    print_summary(results, time.perf_counter() - start)
+    return 1 if any(result['error'] for result in results) else 0
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    raise SystemExit(main(args))
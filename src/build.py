@@ -1,14 +1,23 @@
 import argparse
+import base64
 import sys
-import email
 import html.parser
 import logging
 import json
 import os
 from pathlib import Path
 import shutil
+import time
 
+from cache import ParseCache
+import deadline
+from library import Library
+from manifest import MISS, Manifest
+import mime
 import parse
+import profiling
+import render
+import tracing
 
 
 logging.basicConfig()
@@ -27,6 +36,53 @@ parser.add_argument(
     '--debug', '-d', default=False, action='store_true',
     help='just output song data, do not build site',
 )
+parser.add_argument(
+    '--in-memory', default=False, action='store_true',
+    help='parse attachments in memory, without writing them to BUILD',
+)
+parser.add_argument(
+    '--cache', type=Path, default=None,
+    help='directory to cache parsed songs in (default: BUILD/.cache)',
+)
+parser.add_argument(
+    '--no-cache', dest='use_cache', default=True, action='store_false',
+    help='do not use the parsed song cache',
+)
+parser.add_argument(
+    '--no-manifest', dest='use_manifest', default=True, action='store_false',
+    help='reparse every file in an input directory, even if unchanged',
+)
+parser.add_argument(
+    '--watch', default=False, action='store_true',
+    help='rebuild whenever a file in the input directory changes',
+)
+parser.add_argument(
+    '--poll', type=float, default=0.1,
+    help='seconds between checking for changes in --watch mode',
+)
+parser.add_argument(
+    '--jobs', '-j', type=int, default=0,
+    help='parse asynchronously, converting up to JOBS pdfs at once',
+)
+parser.add_argument(
+    '--profile', default=False, action='store_true',
+    help='profile parsing each song, without the cache, writing the stats '
+         'to BUILD/.profile',
+)
+parser.add_argument(
+    '--trace', type=Path, default=None,
+    help='write a Chrome trace of each build stage to TRACE',
+)
+parser.add_argument(
+    '--library', type=Path, default=None,
+    help='song library to save every parsed song in, and to add songs '
+         'referenced by CCLI number in the email from',
+)
+parser.add_argument(
+    '--deadline', type=deadline.parse_duration, default=None,
+    help='time budget for the build, e.g. 10s, after which optional steps '
+         'like guessing pdf titles and inferring keys are skipped',
+)
 
 
 class ExtractTextParser(html.parser.HTMLParser):
@@ -64,32 +120,59 @@ def valid_html_part(text):
     return True
 
 
-def extract_email(email_path, build_dir):
-    with email_path.open('rb') as fp:
-        msg = email.message_from_binary_file(fp)
+# attachments worth decoding, the rest are skipped unread
+SONG_ATTACHMENTS = parse.PDF_FILES + parse.ONSONG_FILES
+
+
+def extract_email(email_path, build_dir=None, on_attachment=None):
+    with tracing.span('extract_email', filename=str(email_path),
+                      bytes=email_path.stat().st_size):
+        with email_path.open('rb') as fp:
+            return extract_message(fp, build_dir, on_attachment)
+
 
+def extract_message(fp, build_dir=None, on_attachment=None):
+    """Extract the text and song attachments from the email in file fp.
+
+    The email is streamed, and only parts that are text or songs are
+    decoded. Attachments are returned as (filename, bytes), and also
+    written to build_dir as they are decoded if it is given.
+    """
     text = []
     html = []
-    paths = []
-
-    for part in msg.walk():
-        # multipart/* are just containers
-        if part.get_content_maintype() == 'multipart':
-            continue
+    attachments = []
 
+    msg, parts = mime.parse(fp)
+    for part in parts:
         filename = part.get_filename()
         part_type = part.get_content_type()
         if filename:  # attachment
-            payload = part.get_payload(decode=True)
+            if os.path.splitext(filename)[1] not in SONG_ATTACHMENTS:
+                continue
             if part_type in ('text/html', 'text/plain'):
-                if not valid_html_part(payload.decode('utf8')):
+                payload = part.decode()
+                if not valid_html_part(payload.decode('utf8', 'replace')):
                     continue
-            
-            path = build_dir / filename
-            path.write_bytes(payload)
-            paths.append(path)
-        else:
-            payload = part.get_payload(decode=True).decode('utf8').strip()
+                if build_dir:
+                    (build_dir / filename).write_bytes(payload)
+            elif build_dir:
+                # decoded straight to disk, then read back whole to parse
+                path = build_dir / filename
+                with path.open('wb') as out:
+                    part.decode(out)
+                payload = path.read_bytes()
+            else:
+                payload = part.decode()
+
+            attachments.append((filename, payload))
+            if on_attachment:
+                on_attachment(filename, payload)
+        elif part_type in ('text/plain', 'text/html'):
+            charset = part.get_content_charset() or 'utf8'
+            try:
+                payload = part.decode().decode(charset, 'replace').strip()
+            except LookupError:
+                payload = part.decode().decode('utf8', 'replace').strip()
             if not payload:
                 continue
             if part_type == 'text/plain':
@@ -97,9 +180,8 @@ def extract_email(email_path, build_dir):
                 if 'sent from my ' in lines[-1].lower():
                     lines = lines[0:-1]
                 text.append('\n'.join(lines).strip())
-            elif part_type == 'text/html':
-                if valid_html_part(payload):
-                    html.append(payload)
+            elif valid_html_part(payload):
+                html.append(payload)
 
     return {
         'id': msg['Message-Id'],
@@ -109,7 +191,7 @@ def extract_email(email_path, build_dir):
         'date': msg['Date'],
         'html': html,
         'text': text,
-        'paths': paths,
+        'attachments': attachments,
     }
 
 
@@ -125,33 +207,62 @@ def get_chordpro(song):
         yield ''
 
 
-def build_site(args, setlist):
-    pdfdata = {}
+def copy_if_changed(src, dst):
+    """Copy src to dst, unless dst is already an identical copy."""
+    src_stat = os.stat(src)
+    try:
+        dst_stat = os.stat(dst)
+    except FileNotFoundError:
+        pass
+    else:
+        if (src_stat.st_size, src_stat.st_mtime_ns) == (
+                dst_stat.st_size, dst_stat.st_mtime_ns):
+            return
+    shutil.copy2(src, dst)
+
+
+def publish(path, write):
+    """Call write with a temporary path, then atomically move it to path, so
+    that readers never see a partially written file."""
+    tmp = path.with_name('.' + path.name + '.tmp')
+    write(tmp)
+    os.replace(str(tmp), str(path))
 
+
+def build_site(args, setlist):
+    # the pdfs are taken out of the setlist json, and are only decoded and
+    # compressed one at a time as the page is written
+    pdfs = {}
     for id, song in setlist['songs'].items():
         data = song.pop('pdf', None)
         if data:
-            pdfdata[id] = data
-    setlist_json = json.dumps(setlist, indent=4)
-    pdfdata_json = json.dumps(pdfdata, indent=4)
+            pdfs[id] = data
+
+    def write_setlist(path):
+        with path.open('w') as fp:
+            json.dump(setlist, fp, indent=4)
 
-    (args.build / 'setlist.json').write_text(setlist_json)
-    template = args.template.read_text()
-    output = template.replace('SETLIST', setlist_json)
-    output = output.replace('PDFDATA', pdfdata_json)
-    output = output.replace('TITLE', setlist['title'])
-    (args.build / 'index.html').write_text(output)
+    with tracing.span('render', songs=len(setlist['songs']), pdfs=len(pdfs)):
+        publish(args.build / 'setlist.json', write_setlist)
+        parts = render.split_template(args.template.read_text())
+        publish(
+            args.build / 'index.html',
+            lambda path: render.render(parts, path, setlist, (
+                (id, base64.b64decode(data)) for id, data in pdfs.items())),
+        )
 
     for songid, song in setlist['songs'].items():
         if song['file'].endswith('.pdf'):
-            text = '\n'.join(get_chordpro(song))
-            fname = song['file'][:-4] + '.txt'
-            (args.build / fname).write_text(text)
-    #inline = args.inline.read_text()
-    #output = inline.replace('SETLIST', json.dumps(setlist, indent=4))
-    #output = output.replace('PDFDATA', pdfdata_json)
-    #output = output.replace('TITLE', setlist['title'])
-    (args.build / 'inline.html').write_text(output)
+            with tracing.span('write_chordpro', filename=song['file'],
+                              song=songid):
+                text = '\n'.join(get_chordpro(song))
+                fname = song['file'][:-4] + '.txt'
+                (args.build / fname).write_text(text)
+    index = str(args.build / 'index.html')
+    publish(
+        args.build / 'inline.html',
+        lambda path: shutil.copyfile(index, str(path)),
+    )
     files = [
         'node_modules/@bundled-es-modules/pdfjs-dist/build/pdf.worker.js',
         'node_modules/drag-drop-touch-polyfill/DragDropTouch.js',
@@ -159,8 +270,9 @@ def build_site(args, setlist):
         'dist/main.css',
         'dist/main.js',
     ]
-    for f in files:
-        shutil.copy(f, str(args.build / Path(f).name))
+    with tracing.span('copy_assets', files=len(files)):
+        for f in files:
+            copy_if_changed(f, str(args.build / Path(f).name))
 
     for song in setlist["songs"].values():
         print(f'{song["title"]} ({song["ccli"]})')
@@ -181,52 +293,251 @@ VALID_SONG_FILES = [
     ".pdf",
 ]
 
-def main(args):
-    if args.debug:
-        logger.setLevel(logging.DEBUG)
 
-    args.build.mkdir(parents=True, exist_ok=True)
+def list_directory(input_dir):
+    return sorted(
+        path for path in input_dir.iterdir()
+        if path.suffix in VALID_SONG_FILES
+    )
 
-    if args.input.is_dir():
-        paths = []
-        for path in args.input.iterdir():
-            dst = args.build / path.name
-            if dst.suffix not in VALID_SONG_FILES:
-                continue
+
+def load_directory(input_dir, build_dir=None, on_attachment=None):
+    attachments = []
+    for path in list_directory(input_dir):
+        data = path.read_bytes()
+        if build_dir:
+            dst = build_dir / path.name
             if not dst.exists():
-                shutil.copy(path, dst)
+                dst.write_bytes(data)
                 logger.debug('copied {} to {}'.format(str(path), str(dst)))
-            paths.append(dst)
+        attachments.append((path.name, data))
+        if on_attachment:
+            on_attachment(path.name, data)
+
+    return {'attachments': attachments}
+
 
-        paths.sort()
-        raw_setlist = {'paths': paths}
+def load_input(args, on_attachment=None):
+    build_dir = None if args.in_memory else args.build
+    if args.input.is_dir():
+        return load_directory(args.input, build_dir, on_attachment)
     else:
-        raw_setlist = extract_email(args.input, args.build)
+        return extract_email(args.input, build_dir, on_attachment)
+
+
+def parse_attachment(filename, data, cache=None):
+    with tracing.span('parse', filename=filename, bytes=len(data)) as span:
+        suffix = Path(filename).suffix
+        if cache:
+            song = cache.get(data, suffix)
+            if song:
+                span.set(cached=True, **song_attrs(song))
+                return song
+
+        song = profiling.run(filename, parse.parse_bytes, filename, data)
+        span.set(**song_attrs(song))
+
+        if cache and song:
+            deadline.defer(cache_song, cache, data, suffix, song)
+        return song
+
+
+def cache_song(cache, data, suffix, song):
+    # a song missing a skipped step would stay that way in the cache
+    if not deadline.is_degraded(song):
+        cache.put(data, suffix, song)
+
+
+def song_attrs(song):
+    """Attributes of a parsed song worth recording in a trace span."""
+    if song is None:
+        return {}
+    return {
+        'type': song['type'],
+        'song': song['ccli'] or song['title'],
+        'sections': len(song['sections']),
+    }
+
+
+async def parse_attachment_async(filename, data, limit, cache=None):
+    import asyncio
+    with tracing.span('parse', filename=filename, bytes=len(data)) as span:
+        suffix = Path(filename).suffix
+        if cache:
+            song = cache.get(data, suffix)
+            if song:
+                span.set(cached=True, **song_attrs(song))
+                return song
+
+        if suffix in parse.PDF_FILES:
+            song = await parse.parse_pdf_bytes_async(data, limit)
+        else:
+            song = await asyncio.to_thread(parse.parse_bytes, filename, data)
+        span.set(**song_attrs(song))
+
+        if cache and song:
+            deadline.defer(cache_song, cache, data, suffix, song)
+        return song
+
+
+def get_cache(args):
+    if not args.use_cache:
+        return None
+    return ParseCache(args.cache or args.build / '.cache')
+
+
+def load_songs(args, cache=None):
+    raw_setlist = load_input(args)
+    parsed = [
+        parse_attachment(filename, data, cache)
+        for filename, data in raw_setlist['attachments']
+    ]
+    return raw_setlist, parsed
+
+
+async def load_songs_async(args, cache=None):
+    """Load and parse the input, starting each parse as soon as its
+    attachment has been extracted, so that extraction and pdf conversions
+    overlap."""
+    import asyncio
+    loop = asyncio.get_running_loop()
+    limit = asyncio.Semaphore(args.jobs)
+    tasks = []
+
+    def schedule(filename, data):
+        tasks.append(loop.create_task(
+            parse_attachment_async(filename, data, limit, cache)))
+
+    def on_attachment(filename, data):
+        loop.call_soon_threadsafe(schedule, filename, data)
+
+    raw_setlist = await asyncio.to_thread(load_input, args, on_attachment)
+    parsed = await asyncio.gather(*tasks)
+    return raw_setlist, parsed
+
+
+def load_songs_incremental(args, manifest, cache=None):
+    """Load a directory of songs, only reading and parsing the files that
+    have changed since the last build."""
+    attachments = []
+    parsed = []
+    changed = 0
+    for path in list_directory(args.input):
+        stat = path.stat()
+        song = manifest.get(path.name, stat)
+        data = None
+        if song is MISS:
+            data = path.read_bytes()
+            song = manifest.get(path.name, stat, data)
+        if song is MISS:
+            changed += 1
+            song = parse_attachment(path.name, data, cache)
+            deadline.defer(
+                update_manifest, manifest, path.name, stat, data, song)
+            if not args.in_memory:
+                (args.build / path.name).write_bytes(data)
+        attachments.append((path.name, data))
+        parsed.append(song)
+
+    deadline.run_deferred()
+    manifest.save()
+    logger.debug('parsed {} changed files of {}'.format(changed, len(parsed)))
+    return {'attachments': attachments}, parsed
+
+
+def update_manifest(manifest, name, stat, data, song):
+    # like the cache, so the song is parsed again next time
+    if not deadline.is_degraded(song):
+        manifest.update(name, stat, data, song)
+
+
+def add_song(songs, order, song, filename, i):
+    song_id = get_song_id(song, i)
+    song['id'] = song_id
+    song['file'] = filename
+    if not song['title']:
+        song['title'] = cleanup_filename(Path(filename).stem)
+    if song_id in songs:
+        # ok, songs has been attached twice, possible pdf and onsong/chordpro
+        if song['type'] == 'onsong':
+            songs[song_id] = song
+    else:
+        order.append(song_id)
+        songs[song_id] = song
+
+
+def get_library(args):
+    if not args.library:
+        return None
+    return Library(args.library)
+
+
+def start_deadline(args):
+    if args.deadline is None:
+        deadline.stop()
+    else:
+        deadline.start(args.deadline)
+
+
+def build(args, cache=None, manifest=None, library=None):
+    start_deadline(args)
+    with tracing.span('load_songs', input=str(args.input)) as span:
+        if manifest:
+            raw_setlist, parsed = load_songs_incremental(
+                args, manifest, cache)
+        elif args.jobs and not args.profile:
+            # asyncio is slow to import, and only needed with --jobs
+            import asyncio
+            raw_setlist, parsed = asyncio.run(load_songs_async(args, cache))
+        else:
+            raw_setlist, parsed = load_songs(args, cache)
+        span.set(files=len(parsed))
+    if cache:
+        print(cache.stats())
+    return build_setlist(args, raw_setlist, parsed, library)
+
+
+def add_library_songs(library, raw_setlist, songs, order):
+    """Add songs from library that the email mentions by CCLI number but
+    did not attach."""
+    texts = [raw_setlist.get('text'), raw_setlist.get('html')]
+    for song in library.referenced(texts, exclude=songs):
+        order.append(song['id'])
+        songs[song['id']] = song
+
+
+def build_setlist(args, raw_setlist, parsed, library=None):
+    """Build the setlist site from the parsed songs of raw_setlist."""
+    # the optional steps of parsing, now every song has been parsed
+    deadline.run_deferred()
 
     songs = {}
     order = []
 
-    for i, path in enumerate(raw_setlist['paths']):
-        song = None
-        song_type = None
-        if path.suffix == '.pdf':
-            song = parse.parse_pdf(path, args.build)
-        elif path.suffix in ('.onsong', '.cho', '.txt', '.chopro'):
-            song = parse.parse_onsong(path)
+    attachments = raw_setlist['attachments']
+    for i, ((filename, _), song) in enumerate(zip(attachments, parsed)):
         if song:
-            song_id = get_song_id(song, i)
-            song['id'] = song_id
-            song['file'] = path.name
-            if not song['title']:
-                song['title'] = cleanup_filename(path.stem)
-            parse.add_inferred_key(song)
-            if song_id in songs:
-                # ok, songs has been attached twice, possible pdf and onsong/chordpro
-                if song['type'] == 'onsong':
-                    songs[song_id] = song
-            else:
-                order.append(song_id)
-                songs[song_id] = song
+            add_song(songs, order, song, filename, i)
+    if library:
+        with tracing.span('library', songs=len(songs)):
+            add_library_songs(library, raw_setlist, songs, order)
+    song_list = list(songs.values())
+    with tracing.span('infer_keys', songs=len(songs)):
+        inferred = deadline.optional(
+            'infer_keys', parse.infer_song_keys, song_list)
+        if inferred is not None:
+            parse.set_inferred_keys(song_list, inferred)
+    if library:
+        library.put(song_list)
+    with tracing.span('transpose', songs=len(songs)):
+        # deferred like parse's import of keys, which pulls in numpy
+        import transpose
+        tables = deadline.optional(
+            'transpose', transpose.transposition_tables, song_list)
+        if tables is not None:
+            transpose.set_transpositions(song_list, tables)
+    logger.debug(parse.chord_cache_info())
+    logger.debug(parse.encoding_info())
 
     setlist = {
         'title': raw_setlist.get('subject', os.path.basename(args.input)),
@@ -236,6 +547,11 @@ def main(args):
         'songs': songs,
         'order': order,
     }
+    if deadline.end is not None:
+        setlist['degraded'] = deadline.report()
+        for step in setlist['degraded']:
+            logger.warning('skipped {} for {} ({})'.format(
+                step['step'], step['song'] or 'the set', step['reason']))
 
     if len(songs.items()) == 0:
         sys.exit("Could not find any songs")
@@ -244,7 +560,69 @@ def main(args):
         for id, song in songs.items():
             parse.print_song(song)
     else:
-        build_site(args, setlist)
+        with tracing.span('build_site'):
+            build_site(args, setlist)
+    return setlist
+
+
+def snapshot(input_dir):
+    return {
+        path.name: (stat.st_mtime_ns, stat.st_size)
+        for path, stat in ((p, p.stat()) for p in list_directory(input_dir))
+    }
+
+
+def watch(args, cache=None, manifest=None, library=None):
+    """Poll the input directory, rebuilding whenever anything changes."""
+    last = None
+    while True:
+        current = snapshot(args.input)
+        if current != last:
+            last = current
+            start = time.perf_counter()
+            try:
+                build(args, cache, manifest, library)
+            except (Exception, SystemExit) as e:
+                logger.error('build failed: {}'.format(e))
+            else:
+                print('built {} in {:.0f}ms'.format(
+                    args.build, (time.perf_counter() - start) * 1000))
+        time.sleep(args.poll)
+
+
+def get_manifest(args):
+    if not args.use_manifest or not args.input.is_dir():
+        return None
+    return Manifest(args.build / '.manifest.json')
+
+
+def main(args):
+    if args.debug:
+        logger.setLevel(logging.DEBUG)
+
+    args.build.mkdir(parents=True, exist_ok=True)
+
+    if args.trace:
+        tracing.enable()
+    if args.profile:
+        # every song must actually be parsed to be profiled
+        args.use_cache = args.use_manifest = False
+        profiling.enable(args.build / '.profile')
+    try:
+        cache = get_cache(args)
+        manifest = get_manifest(args)
+        library = get_library(args)
+        if args.watch:
+            if not args.input.is_dir():
+                parser.error('--watch needs an input directory')
+            watch(args, cache, manifest, library)
+        else:
+            build(args, cache, manifest, library)
+            if args.profile:
+                profiling.report()
+    finally:
+        if args.trace:
+            tracing.write(args.trace)
 
 
 if __name__ == '__main__':
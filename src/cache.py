@@ -0,0 +1,53 @@
+"""A persistent cache of parsed songs.
+
+Songs are keyed by a hash of the song file's bytes, its type and the parser
+version, so the same attachment sent again on an email thread is never
+re-parsed.
+"""
+from collections import OrderedDict
+import hashlib
+import json
+import os
+
+import parse
+
+
+class ParseCache:
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, data, suffix):
+        digest = hashlib.sha256()
+        digest.update('{}:{}:'.format(parse.VERSION, suffix).encode('utf8'))
+        digest.update(data)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return self.directory / key[:2] / (key + '.json')
+
+    def get(self, data, suffix):
+        """Return the cached song for this file content, or None."""
+        path = self.path(self.key(data, suffix))
+        try:
+            song = json.loads(path.read_text())
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        song['sections'] = OrderedDict(song['sections'])
+        return song
+
+    def put(self, data, suffix, song):
+        path = self.path(self.key(data, suffix))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write then rename, so a concurrent reader never sees partial json
+        tmp = path.with_suffix('.tmp{}'.format(os.getpid()))
+        tmp.write_text(json.dumps(song))
+        os.replace(str(tmp), str(path))
+
+    def stats(self):
+        return 'parse cache: {} hits, {} misses'.format(self.hits, self.misses)
@@ -0,0 +1,141 @@
+"""An opt-in time budget for a build, kept to by skipping optional steps.
+
+Mandatory steps, extracting and parsing each song, always run. Optional
+ones, like guessing a pdf's title with pdftitle, are deferred until the
+mandatory steps are done:
+
+    deadline.defer(guess_pdf_title, song, data)
+
+then each runs with optional() only while the budget lasts, and within its
+own timeout from TIMEOUTS. Optional steps run in a daemon thread, which is
+abandoned if it times out, so must return their result rather than change
+anything themselves. Every skipped step is recorded, for the setlist.
+
+Without a deadline, deferred and optional steps simply run at once.
+"""
+import re
+import threading
+import time
+
+
+# seconds each step may take, whatever the budget
+TIMEOUTS = {
+    'pdftitle': 2.0,
+    'pdftotext': 10.0,
+    'infer_keys': 5.0,
+    'transpose': 5.0,
+}
+
+DURATION = re.compile(r'(\d+(?:\.\d*)?|\.\d+)\s*(ms|s|m)?')
+UNITS = {'ms': 0.001, 's': 1, 'm': 60, None: 1}
+
+end = None
+deferred = []
+skipped = []
+
+
+def parse_duration(text):
+    """Seconds from a duration like 10s, 500ms, 2m or 1.5."""
+    match = DURATION.fullmatch(text.strip())
+    if not match:
+        raise ValueError('invalid duration: {!r}'.format(text))
+    return float(match.group(1)) * UNITS[match.group(2)]
+
+
+def start(seconds):
+    """Start a budget of seconds for the build."""
+    global end
+    end = time.monotonic() + seconds
+    deferred.clear()
+    skipped.clear()
+
+
+def stop():
+    global end
+    end = None
+    deferred.clear()
+    skipped.clear()
+
+
+def remaining():
+    """Seconds left in the budget, or None if there is no deadline."""
+    if end is None:
+        return None
+    return max(0.0, end - time.monotonic())
+
+
+def timeout(name):
+    """The timeout of step name, or None if there is no deadline."""
+    if end is None:
+        return None
+    return TIMEOUTS.get(name)
+
+
+def skip(name, song=None, reason='deadline'):
+    """Record that step name, of song or the whole build, was skipped."""
+    skipped.append((name, song, reason))
+
+
+def is_degraded(song):
+    return any(skipped_song is song for _, skipped_song, _ in skipped)
+
+
+def defer(function, *args):
+    """Call function(*args) once the mandatory steps are done, or now if
+    there is no deadline."""
+    if end is None:
+        function(*args)
+    else:
+        deferred.append((function, args))
+
+
+def run_deferred():
+    """Call the deferred functions, in the order they were deferred."""
+    while deferred:
+        function, args = deferred.pop(0)
+        function(*args)
+
+
+def optional(name, function, *args, song=None):
+    """Return function(*args), or None if step name is skipped as the
+    budget has run out, or it takes longer than the time left or its
+    timeout."""
+    if end is None:
+        return function(*args)
+    limit = remaining()
+    if not limit:
+        skip(name, song)
+        return None
+    if name in TIMEOUTS:
+        limit = min(limit, TIMEOUTS[name])
+
+    outcome = []
+
+    def run():
+        try:
+            outcome.append((True, function(*args)))
+        except BaseException as e:
+            outcome.append((False, e))
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    thread.join(limit)
+    if not outcome:
+        skip(name, song, 'timeout')
+        return None
+    ok, result = outcome[0]
+    if not ok:
+        raise result
+    return result
+
+
+def report():
+    """The skipped steps, with the id of their song, if any."""
+    return [
+        {
+            'step': name,
+            'song': song.get('id') if song is not None else None,
+            'reason': reason,
+        }
+        for name, song, reason in skipped
+    ]
@@ -68,7 +68,27 @@ const useSwipe = (handler, element, tolerance = 100) => {
   useEventListener('touchend', compute, element)
 }
 
+// becomes true the first time the element scrolls into view
+const useVisible = (ref) => {
+  const [visible, setVisible] = useState(false)
+
+  useEffect(() => {
+    if (visible || !ref.current) return
+    const observer = new IntersectionObserver(entries => {
+      if (entries.some(e => e.isIntersecting)) {
+        setVisible(true)
+        observer.disconnect()
+      }
+    })
+    observer.observe(ref.current)
+    return () => observer.disconnect()
+  }, [ref, visible])
+
+  return visible
+}
+
 export {
   useEventListener,
-  useSwipe
+  useSwipe,
+  useVisible
 }
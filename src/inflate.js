@@ -0,0 +1,186 @@
+// A small zlib inflate, for browsers without DecompressionStream, like
+// Safari before 16.4. It is only used for the embedded pdfs, so favours
+// size over speed.
+
+const LENGTH_BASE = [
+  3, 4, 5, 6, 7, 8, 9, 10, 11, 13, 15, 17, 19, 23, 27, 31,
+  35, 43, 51, 59, 67, 83, 99, 115, 131, 163, 195, 227, 258
+]
+const LENGTH_EXTRA = [
+  0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2,
+  3, 3, 3, 3, 4, 4, 4, 4, 5, 5, 5, 5, 0
+]
+const DIST_BASE = [
+  1, 2, 3, 4, 5, 7, 9, 13, 17, 25, 33, 49, 65, 97, 129, 193,
+  257, 385, 513, 769, 1025, 1537, 2049, 3073, 4097, 6145,
+  8193, 12289, 16385, 24577
+]
+const DIST_EXTRA = [
+  0, 0, 0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 6, 6,
+  7, 7, 8, 8, 9, 9, 10, 10, 11, 11, 12, 12, 13, 13
+]
+// the order code length code lengths are stored in
+const CLEN_ORDER = [
+  16, 17, 18, 0, 8, 7, 9, 6, 10, 5, 11, 4, 12, 3, 13, 2, 14, 1, 15
+]
+
+// a canonical huffman code, as the count of codes of each length, and the
+// symbols in code order
+function huffman (lengths) {
+  const counts = new Uint16Array(16)
+  for (const length of lengths) {
+    counts[length] += 1
+  }
+  counts[0] = 0
+  const offsets = new Uint16Array(16)
+  for (let i = 1; i < 16; i += 1) {
+    offsets[i] = offsets[i - 1] + counts[i - 1]
+  }
+  const symbols = new Uint16Array(lengths.length)
+  lengths.forEach((length, symbol) => {
+    if (length) {
+      symbols[offsets[length]++] = symbol
+    }
+  })
+  return { counts, symbols }
+}
+
+let FIXED = null
+
+function fixedCodes () {
+  if (!FIXED) {
+    const lengths = new Uint8Array(288)
+    lengths.fill(8, 0, 144)
+    lengths.fill(9, 144, 256)
+    lengths.fill(7, 256, 280)
+    lengths.fill(8, 280, 288)
+    FIXED = [huffman(lengths), huffman(new Uint8Array(30).fill(5))]
+  }
+  return FIXED
+}
+
+function inflate (data) {
+  let pos = 2 // skip the zlib header
+  let bit = 0
+  let out = new Uint8Array(data.length * 4)
+  let size = 0
+
+  function bits (n) {
+    let value = 0
+    for (let i = 0; i < n; i += 1) {
+      if (pos >= data.length) {
+        throw new Error('inflate: unexpected end of data')
+      }
+      value |= ((data[pos] >> bit) & 1) << i
+      bit += 1
+      if (bit === 8) {
+        bit = 0
+        pos += 1
+      }
+    }
+    return value
+  }
+
+  function decode ({ counts, symbols }) {
+    let code = 0
+    let first = 0
+    let index = 0
+    for (let length = 1; length < 16; length += 1) {
+      code |= bits(1)
+      const count = counts[length]
+      if (code - first < count) {
+        return symbols[index + code - first]
+      }
+      index += count
+      first = (first + count) << 1
+      code <<= 1
+    }
+    throw new Error('inflate: invalid code')
+  }
+
+  function push (byte) {
+    if (size === out.length) {
+      const bigger = new Uint8Array(out.length * 2)
+      bigger.set(out)
+      out = bigger
+    }
+    out[size++] = byte
+  }
+
+  function dynamicCodes () {
+    const nlit = bits(5) + 257
+    const ndist = bits(5) + 1
+    const nclen = bits(4) + 4
+    const clens = new Uint8Array(19)
+    for (let i = 0; i < nclen; i += 1) {
+      clens[CLEN_ORDER[i]] = bits(3)
+    }
+    const clen = huffman(clens)
+    const lengths = new Uint8Array(nlit + ndist)
+    let i = 0
+    while (i < nlit + ndist) {
+      const symbol = decode(clen)
+      if (symbol < 16) {
+        lengths[i++] = symbol
+      } else {
+        let repeat = 0
+        let length = 0
+        if (symbol === 16) {
+          length = lengths[i - 1]
+          repeat = 3 + bits(2)
+        } else if (symbol === 17) {
+          repeat = 3 + bits(3)
+        } else {
+          repeat = 11 + bits(7)
+        }
+        lengths.fill(length, i, i + repeat)
+        i += repeat
+      }
+    }
+    return [huffman(lengths.subarray(0, nlit)), huffman(lengths.subarray(nlit))]
+  }
+
+  let last = 0
+  while (!last) {
+    last = bits(1)
+    const type = bits(2)
+    if (type === 0) {
+      // stored: aligned to a byte, with its length and its complement
+      if (bit) {
+        bit = 0
+        pos += 1
+      }
+      const length = data[pos] | (data[pos + 1] << 8)
+      pos += 4
+      for (let i = 0; i < length; i += 1) {
+        push(data[pos++])
+      }
+      continue
+    }
+    if (type === 3) {
+      throw new Error('inflate: invalid block type')
+    }
+    const [lit, dist] = type === 1 ? fixedCodes() : dynamicCodes()
+    for (;;) {
+      const symbol = decode(lit)
+      if (symbol < 256) {
+        push(symbol)
+      } else if (symbol === 256) {
+        break
+      } else {
+        const s = symbol - 257
+        const length = LENGTH_BASE[s] + bits(LENGTH_EXTRA[s])
+        const d = decode(dist)
+        const distance = DIST_BASE[d] + bits(DIST_EXTRA[d])
+        for (let i = 0; i < length; i += 1) {
+          push(out[size - distance])
+        }
+      }
+    }
+  }
+  return out.subarray(0, size)
+}
+
+export {
+  inflate
+}
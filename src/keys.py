@@ -0,0 +1,161 @@
+"""Infer the key of songs from their chords.
+
+Each chord is encoded as a vector of the 12 pitch classes it contains, and
+each song as the sum of its chords' vectors. Every song is then correlated
+against all 24 major and minor key profiles in one matrix operation, so a
+whole set, or library, of songs is scored at once.
+
+numpy is only imported to score keys, so that transpose can use the note
+names and pitch classes here without loading it.
+"""
+import functools
+import re
+
+
+NOTES = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11, 'H': 11}
+ACCIDENTALS = {'#': 1, '♯': 1, 'b': -1, '♭': -1}
+
+MAJOR_KEYS = 'C Db D Eb E F F# G Ab A Bb B'.split()
+MINOR_KEYS = 'Cm C#m Dm Ebm Em Fm F#m Gm G#m Am Bbm Bm'.split()
+KEYS = MAJOR_KEYS + MINOR_KEYS
+
+# Krumhansl-Kessler key profiles, starting from the tonic
+MAJOR_PROFILE = [
+    6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88,
+]
+MINOR_PROFILE = [
+    6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17,
+]
+
+# semitones above the root for each scale degree used in chord names
+DEGREES = {2: 2, 4: 5, 5: 7, 6: 9, 7: 10, 9: 2, 11: 5, 13: 9}
+MINOR_THIRDS = ('m', 'min', 'MIN', 'Min', 'mM')
+MAJOR_SEVENTHS = ('M', 'maj', 'MAJ', 'Maj', 'mM')
+ROOT_WEIGHT = 2.0
+
+
+@functools.lru_cache(maxsize=None)
+def key_profiles():
+    """The 24 x 12 matrix of key profiles, rows in the order of KEYS."""
+    import numpy as np
+    profiles = [np.roll(MAJOR_PROFILE, i) for i in range(12)]
+    profiles += [np.roll(MINOR_PROFILE, i) for i in range(12)]
+    return normalise(np.array(profiles))
+
+
+def normalise(matrix):
+    """Centre and scale each row, so a dot product is a correlation."""
+    import numpy as np
+    centred = matrix - matrix.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(centred, axis=1, keepdims=True)
+    return np.divide(
+        centred, norms, out=np.zeros_like(centred), where=norms != 0)
+
+
+def pitch_class(note):
+    """The pitch class of a note name like Ab or F♯, or None."""
+    if not note or note[0] not in NOTES:
+        return None
+    return (NOTES[note[0]] + sum(ACCIDENTALS[a] for a in note[1:])) % 12
+
+
+@functools.lru_cache(maxsize=1024)
+def chord_vector(chord):
+    """Encode a parse.Chord as a 12-element pitch class vector."""
+    import numpy as np
+    vector = np.zeros(12)
+    root = pitch_class(chord.note)
+    if root is None:
+        return vector
+
+    third = 3 if chord.third in MINOR_THIRDS else 4
+    fifth = 7
+    intervals = set()
+    fifth_mod = chord.fifth or ''
+    if fifth_mod.lower() == 'aug' or fifth_mod == '+':
+        fifth = 8
+    elif fifth_mod.lower() == 'dim' or fifth_mod in ('°', 'ø'):
+        third, fifth = 3, 6
+        if fifth_mod == 'ø':
+            intervals.add(10)
+
+    number = chord.number and int(re.sub(r'\D', '', chord.number))
+    if number == 5:
+        # power chord
+        third = None
+    elif number:
+        if number >= 7:
+            intervals.add(11 if chord.third in MAJOR_SEVENTHS else 10)
+        if number != 7:
+            intervals.add(DEGREES.get(number, 0))
+
+    if chord.subtraction:
+        third = None
+
+    if chord.altered:
+        degree = DEGREES.get(int(chord.altered[1:]), 0)
+        shift = 1 if chord.altered[0] in '#♯+' else -1
+        if degree == 7:
+            fifth = 7 + shift
+        else:
+            intervals.add((degree + shift) % 12)
+
+    if chord.suspension:
+        digits = re.sub(r'\D', '', chord.suspension)
+        third = 2 if digits == '2' else 5
+
+    if chord.addition:
+        degree = int(re.sub(r'\D', '', chord.addition))
+        intervals.add(DEGREES.get(degree, 0))
+
+    intervals.add(fifth)
+    if third is not None:
+        intervals.add(third)
+    for interval in intervals:
+        vector[(root + interval) % 12] = 1
+    vector[root] = ROOT_WEIGHT
+
+    bass = pitch_class(chord.bass and chord.bass[1:])
+    if bass is not None:
+        vector[bass] = max(vector[bass], 1)
+
+    vector.setflags(write=False)
+    return vector
+
+
+def infer_keys(songs):
+    """Infer the key of each song from a list of songs' chords.
+
+    Each song is a list of parse.Chord tuples. Returns a (key, confidence)
+    pair per song, where confidence is the correlation of the song's pitch
+    classes with the key's profile, or (None, 0.0) if it has no chords.
+    """
+    if not songs:
+        return []
+    import numpy as np
+
+    # count each distinct chord per song, then combine with the chord
+    # vectors to get a songs x pitch class matrix in one go
+    index = {}
+    rows, cols = [], []
+    for row, chords in enumerate(songs):
+        for chord in chords:
+            rows.append(row)
+            cols.append(index.setdefault(chord, len(index)))
+
+    counts = np.zeros((len(songs), max(len(index), 1)))
+    np.add.at(counts, (np.array(rows, int), np.array(cols, int)), 1)
+    vectors = np.array([chord_vector(c) for c in index] or [np.zeros(12)])
+
+    pitch_classes = normalise(counts @ vectors)
+    scores = pitch_classes @ key_profiles().T
+    best = scores.argmax(axis=1)
+
+    results = []
+    for row, key_index in enumerate(best):
+        if not pitch_classes[row].any():
+            results.append((None, 0.0))
+        else:
+            confidence = float(scores[row, key_index])
+            results.append((KEYS[key_index], round(confidence, 3)))
+    return results
@@ -0,0 +1,173 @@
+"""A persistent library of every song we have parsed, in SQLite.
+
+Songs are stored by their CCLI number, with their title, author and lyrics
+indexed with FTS5, so past songs can be searched, and a set that mentions a
+CCLI number in its email text can include that song without it being
+attached. Songs without a CCLI number are not kept, as their ids, from
+their titles or places in a set, are not unique.
+
+Search the library from the command line with:
+
+    python src/library.py library.db --key G grace
+"""
+import argparse
+from collections import OrderedDict
+import json
+from pathlib import Path
+import re
+import sqlite3
+import sys
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    id TEXT PRIMARY KEY,
+    ccli TEXT,
+    title TEXT,
+    key TEXT,
+    song TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS songs_ccli ON songs (ccli);
+CREATE INDEX IF NOT EXISTS songs_key ON songs (key);
+CREATE VIRTUAL TABLE IF NOT EXISTS songs_text USING fts5 (
+    title, author, lyrics, tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# e.g. "CCLI 22025", "CCLI Song # 22025" or "ccli no. 22025"
+CCLI_REFERENCE = re.compile(
+    r'\bCCLI(?:\s+song)?\s*(?:#|no\.?|number)?\s*:?\s*(\d{3,8})\b', re.I)
+CHORD = re.compile(r'\[[^\]]*\]')
+
+
+def song_lyrics(song):
+    """The lyrics of song, without chords or section names."""
+    lines = []
+    for section in song['sections'].values():
+        for line in CHORD.sub('', section).splitlines():
+            line = ' '.join(line.split())
+            if line:
+                lines.append(line)
+    return '\n'.join(lines)
+
+
+def fts_query(text):
+    """Quote each word of text, so it is searched for literally."""
+    return ' '.join(
+        '"{}"'.format(word.replace('"', '""')) for word in text.split())
+
+
+def load_song(row):
+    song = json.loads(row)
+    song['sections'] = OrderedDict(song['sections'])
+    return song
+
+
+class Library:
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(str(path), timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def put(self, songs):
+        """Add or update the songs that have CCLI numbers."""
+        with self.db:
+            for song in songs:
+                if not song['ccli']:
+                    continue
+                self.db.execute(
+                    'DELETE FROM songs_text WHERE rowid = '
+                    '(SELECT rowid FROM songs WHERE id = ?)', (song['ccli'],))
+                self.db.execute(
+                    'INSERT OR REPLACE INTO songs'
+                    ' (id, ccli, title, key, song, updated)'
+                    ' VALUES (?, ?, ?, ?, ?, ?)',
+                    (song['ccli'], song['ccli'], song['title'], song['key'],
+                     json.dumps(song), time.time()))
+                self.db.execute(
+                    'INSERT INTO songs_text (rowid, title, author, lyrics)'
+                    ' VALUES (last_insert_rowid(), ?, ?, ?)',
+                    (song['title'], song['author'], song_lyrics(song)))
+
+    def get(self, ccli):
+        """The song with CCLI number ccli, or None."""
+        row = self.db.execute(
+            'SELECT song FROM songs WHERE ccli = ? ORDER BY updated DESC',
+            (str(ccli),)).fetchone()
+        return load_song(row[0]) if row else None
+
+    def search(self, text=None, key=None, limit=20):
+        """Songs whose title, author or lyrics contain all the words of
+        text, in key if given, most recently saved first.
+
+        Ranking by relevance would score every match, which is too slow
+        for common words across thousands of songs.
+        """
+        where = []
+        params = []
+        if text:
+            # search the index first, newest rows first, so common words
+            # stop at limit
+            query = ('SELECT songs.song FROM songs_text CROSS JOIN songs'
+                     ' ON songs.rowid = songs_text.rowid')
+            order = 'songs_text.rowid'
+            where.append('songs_text MATCH ?')
+            params.append(fts_query(text))
+        else:
+            query = 'SELECT songs.song FROM songs'
+            order = 'songs.rowid'
+        if key:
+            where.append('songs.key = ?')
+            params.append(key)
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += ' ORDER BY {} DESC LIMIT ?'.format(order)
+        params.append(limit)
+        return [load_song(row[0]) for row in self.db.execute(query, params)]
+
+    def referenced(self, texts, exclude=()):
+        """Known songs whose CCLI numbers are mentioned in texts, in order,
+        skipping any whose ids are in exclude."""
+        songs = []
+        seen = set(exclude)
+        for text in texts:
+            for ccli in CCLI_REFERENCE.findall(text or ''):
+                if ccli in seen:
+                    continue
+                seen.add(ccli)
+                song = self.get(ccli)
+                if song:
+                    songs.append(song)
+        return songs
+
+
+parser = argparse.ArgumentParser(description='search the song library')
+parser.add_argument('library', type=Path, help='library database')
+parser.add_argument('text', nargs='*', help='words to search for')
+parser.add_argument('--key', help='only songs in KEY')
+parser.add_argument('--limit', type=int, default=20)
+
+
+def main(args):
+    if not args.library.exists():
+        parser.error('{} does not exist'.format(args.library))
+    library = Library(args.library)
+    start = time.perf_counter()
+    songs = library.search(' '.join(args.text), args.key, args.limit)
+    elapsed = time.perf_counter() - start
+    for song in songs:
+        print('{:<10} {:<4} {}'.format(
+            song['ccli'] or '', song['key'] or '', song['title']))
+    print('{} songs in {:.2f}ms'.format(len(songs), elapsed * 1000),
+          file=sys.stderr)
+    library.close()
+
+
+if __name__ == '__main__':
+    main(parser.parse_args())
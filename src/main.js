@@ -2,8 +2,9 @@ import { h, render, Fragment } from 'preact'
 import { useState, useCallback, useRef, useEffect } from 'preact/hooks'
 import { tokenise, TOKENS } from './chordpro'
 import { map, copy, scrollToInternal, toggleFullScreen, toggleWakeLock } from './platform'
-import { transposeChord, calculateTranspose, NOTES_ALL } from './music'
+import { transposeChord, calculateTranspose, chordTable, keyChoices } from './music'
 import Pdf from './pdf'
+import { loadAsset } from './assets'
 
 
 
@@ -141,14 +142,21 @@ function Index ({ setlist, order, setOrder }) {
 function Song ({ song }) {
   const songRef = useRef(null)
   const [transposedKey, setTransposedKey] = useState(song.key)
+  const loadPdf = useCallback(() => loadAsset(PDFDATA, song.id), [song.id])
 
-  var transposeMap = null
+  var transpose = null
   console.log("song.key: " + song.key)
   console.log("transposedKey: " + transposedKey)
   if (song.key != transposedKey) {
     console.log("transpose to " + transposedKey)
-    transposeMap = calculateTranspose(song.key, transposedKey)
-    console.log(transposeMap)
+    if (song.transpositions) {
+      // look the chords up in the table built with the song
+      const table = chordTable(song.transpositions, song.key, transposedKey)
+      transpose = chord => table[chord] || chord
+    } else {
+      const transposeMap = calculateTranspose(song.key, transposedKey)
+      transpose = chord => transposeChord(chord, transposeMap)
+    }
   }
   let cls = 'song'
   let showInfo = true
@@ -181,11 +189,11 @@ function Song ({ song }) {
   if (song.type === 'pdf-failed') {
     cls = 'pdf'
     showInfo = false
-    children = <Pdf data={PDFDATA[song.id]} />
+    children = <Pdf load={loadPdf} />
   } else {
     children = (
       <div class="lyric-container" ref={songRef}>
-      {map(song.sections, (name, section) => <Section name={name} section={section} transposeMap={transposeMap} resize={resize} />)}
+      {map(song.sections, (name, section) => <Section name={name} section={section} transpose={transpose} resize={resize} />)}
       </div>
     )
   }
@@ -216,7 +224,7 @@ function SongTitle ({ song, transposedKey, setKey, showInfo }) {
     if (song['key']) {
       nodes.push(
         <select class='key' value={transposedKey} onChange={setter}>
-          {NOTES_ALL.map(n => <option class={n == song['key'] ? "default" : ""}value={n}>{n}</option>)}
+          {(song.transpositions ? Object.keys(song.transpositions) : keyChoices(song['key'])).map(n => <option class={n == song['key'] ? "default" : ""}value={n}>{n}</option>)}
         </select>
       )
       nodes.push(' | ')
@@ -243,7 +251,7 @@ function SongTitle ({ song, transposedKey, setKey, showInfo }) {
   )
 }
 
-function Section ({ name, section, transposeMap, resize }) {
+function Section ({ name, section, transpose, resize }) {
   const [collapsed, setCollapsed] = useState(false)
   const [chords, setChords] = useState(true)
   const className = (collapsed ? 'collapsed ' : ' ') + (chords ? ' ' : 'hide-chords')
@@ -277,7 +285,7 @@ function Section ({ name, section, transposeMap, resize }) {
         <span class='expand toggle' onpointerdown={toggleCollapsed}> <i class='icon-angle-down' /></span>
         &nbsp;{showChords}
       </header>
-      {lines.map((l) => <Line line={l} transposeMap={transposeMap} />)}
+      {lines.map((l) => <Line line={l} transpose={transpose} />)}
     </section>
   )
 }
@@ -290,7 +298,7 @@ TOKEN_CLASS[TOKENS.HYPHEN] = 'hyphen'
 
 const RAISED_TOKENS = [TOKENS.CHORD, TOKENS.COMMENT]
 
-function Line ({ line, transposeMap }) {
+function Line ({ line, transpose }) {
   // split on [chords] or {directives}, removing undefineds
   var nodes = []
   const [line_type, tokens] = line
@@ -302,9 +310,9 @@ function Line ({ line, transposeMap }) {
 
     switch (current.type) {
       case TOKENS.CHORD:
-        if (transposeMap && value !== '|') {
+        if (transpose && value !== '|') {
           try {
-            value = transposeChord(value, transposeMap)
+            value = transpose(value)
           }
           catch (err) {
             console.error(err)
@@ -375,10 +383,8 @@ function SetAlight (original_setlist, element) {
 }
 
 const SETLIST = JSON.parse(document.getElementById('setlist').innerHTML)
+// pdfs are decoded lazily, see assets.js
 const PDFDATA = JSON.parse(document.getElementById('pdfdata').innerHTML)
-for (const id of Object.keys(PDFDATA)) {
-  PDFDATA[id] = window.atob(PDFDATA[id])
-}
 
 const app = document.getElementById('app')
 SetAlight(SETLIST, app)
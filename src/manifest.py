@@ -0,0 +1,144 @@
+"""A build manifest, recording each input file's hash, mtime and parsed song.
+
+Rebuilding a directory only needs to reparse files that are new or have
+changed since the last build. Files whose mtime and size are unchanged are
+not even read, and files that were touched but have the same content are
+not reparsed.
+
+The manifest itself only holds each input's mtime, size and hash. The songs,
+which can carry whole pdfs, are kept in a file each by their hash beside it,
+so a build only writes the songs that changed, and only rewrites the
+manifest if anything did.
+"""
+from collections import OrderedDict
+import copy
+import hashlib
+import json
+import os
+import shutil
+
+import parse
+
+# what get returns for an input that has to be parsed again, as a parsed
+# input can be None when it is not a song
+MISS = object()
+# what is stored for an input that is not a song, so it is not parsed again
+NOT_A_SONG = {'not_a_song': True}
+
+
+class Manifest:
+
+    def __init__(self, path):
+        self.path = path
+        self.directory = path.with_suffix('')
+        self.inputs = {}
+        self.seen = set()
+        # songs loaded or written, by hash, and hashes no longer needed
+        self.songs = {}
+        self.stale = set()
+        self.changed = False
+        try:
+            manifest = json.loads(path.read_text())
+        except (OSError, ValueError):
+            manifest = {}
+        if manifest.get('version') == parse.VERSION:
+            self.inputs = manifest['inputs']
+        else:
+            shutil.rmtree(str(self.directory), ignore_errors=True)
+
+    def get(self, name, stat, data=None):
+        """Get the song for an unchanged input, or MISS if it has changed.
+
+        If data is given, the input only needs the same content, otherwise
+        it must have the same mtime and size.
+        """
+        self.seen.add(name)
+        entry = self.inputs.get(name)
+        if entry is None:
+            return MISS
+        if data is None:
+            if (entry['mtime'], entry['size']) != (
+                    stat.st_mtime_ns, stat.st_size):
+                return MISS
+        elif entry['hash'] != hashlib.sha256(data).hexdigest():
+            return MISS
+
+        song = self.load_song(entry['hash'])
+        if song is MISS:
+            return MISS
+        if (entry['mtime'], entry['size']) != (
+                stat.st_mtime_ns, stat.st_size):
+            entry['mtime'] = stat.st_mtime_ns
+            entry['size'] = stat.st_size
+            self.changed = True
+        return self.copy_song(song)
+
+    def update(self, name, stat, data, song):
+        self.seen.add(name)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.song_path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(NOT_A_SONG if song is None else song))
+        os.replace(str(tmp), str(path))
+        self.songs[digest] = self.copy_song(song)
+        old = self.inputs.get(name)
+        if old is not None:
+            self.stale.add(old['hash'])
+        self.inputs[name] = {
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'hash': digest,
+        }
+        self.changed = True
+
+    def song_path(self, digest):
+        return self.directory / digest[:2] / (digest + '.json')
+
+    def load_song(self, digest):
+        """The song with hash digest, None if it is not a song, or MISS if
+        it is missing."""
+        if digest not in self.songs:
+            try:
+                song = json.loads(self.song_path(digest).read_text())
+            except (OSError, ValueError):
+                return MISS
+            if not isinstance(song, dict):
+                return MISS
+            if song == NOT_A_SONG:
+                song = None
+            self.songs[digest] = self.copy_song(song)
+        return self.songs[digest]
+
+    def copy_song(self, song):
+        if song is None:
+            return None
+        song = copy.deepcopy(song)
+        song['sections'] = OrderedDict(song['sections'])
+        return song
+
+    def save(self):
+        # forget inputs that have been removed
+        for name in self.inputs.keys() - self.seen:
+            self.stale.add(self.inputs.pop(name)['hash'])
+            self.changed = True
+        self.seen = set()
+
+        self.stale -= {entry['hash'] for entry in self.inputs.values()}
+        for digest in self.stale:
+            self.songs.pop(digest, None)
+            try:
+                self.song_path(digest).unlink()
+            except OSError:
+                pass
+        self.stale = set()
+
+        if not self.changed:
+            return
+        self.changed = False
+        tmp = self.path.with_suffix('.tmp')
+        tmp.write_text(json.dumps({
+            'version': parse.VERSION,
+            'inputs': self.inputs,
+        }))
+        os.replace(str(tmp), str(self.path))
@@ -0,0 +1,206 @@
+"""Stream the parts of a MIME message without loading it into memory.
+
+Only the headers of each part are parsed up front. A part's body is decoded
+a line at a time if it is asked for, and skipped over otherwise, so large
+attachments we don't want, like photos, are never held in memory.
+
+email.feedparser can't do this, whatever the policy: it collects every
+part's lines and joins them into its payload before the part can be looked
+at, so a photo is held whole even if it is thrown away.
+"""
+import binascii
+import email.parser
+import io
+import re
+
+
+# longest line to read at once, for bodies without line breaks, which
+# must be longer than any boundary (at most 70 characters)
+LINE_LIMIT = 64 * 1024
+
+HEADER_PARSER = email.parser.BytesHeaderParser()
+NOT_BASE64 = re.compile(rb'[^A-Za-z0-9+/=]')
+
+
+class Reader:
+    """Read lines from a binary file, with one line of pushback."""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.pending = None
+        # whether the last line read was the rest of a longer line
+        self.continued = False
+        self.at_start = True
+
+    def readline(self):
+        if self.pending is not None:
+            line, self.pending = self.pending, None
+        else:
+            line = self.fp.readline(LINE_LIMIT)
+        self.continued = not self.at_start
+        self.at_start = line.endswith(b'\n')
+        return line
+
+    def unread(self, line):
+        self.pending = line
+        self.at_start = not self.continued
+
+
+def delimiter(line, boundaries):
+    """The boundary that line delimits, and whether it closes it."""
+    if not line.startswith(b'--'):
+        return None, False
+    line = line.rstrip()
+    if line[2:] in boundaries:
+        return line[2:], False
+    if line.endswith(b'--') and line[2:-2] in boundaries:
+        return line[2:-2], True
+    return None, False
+
+
+class Part:
+    """A leaf part of a message, whose body has not been read yet."""
+
+    def __init__(self, headers, reader, boundaries):
+        self.headers = headers
+        self.reader = reader
+        self.boundaries = boundaries
+        self.done = False
+
+    def get_filename(self):
+        return self.headers.get_filename()
+
+    def get_content_type(self):
+        return self.headers.get_content_type()
+
+    def get_content_charset(self):
+        return self.headers.get_content_charset()
+
+    def lines(self):
+        """The raw lines of the body, up to the next boundary."""
+        reader = self.reader
+        while not self.done:
+            line = reader.readline()
+            if not line:
+                self.done = True
+            elif not reader.continued and delimiter(
+                    line, self.boundaries)[0]:
+                reader.unread(line)
+                self.done = True
+            else:
+                yield line
+
+    def skip(self):
+        for _ in self.lines():
+            pass
+
+    def decode(self, tee=None):
+        """Decode the body, and return it, or if tee is given, write each
+        chunk to tee as it is decoded, without keeping it."""
+        if tee is not None:
+            self.decode_to(tee.write)
+            return None
+        out = io.BytesIO()
+        self.decode_to(out.write)
+        return out.getvalue()
+
+    def decode_to(self, write):
+        encoding = self.headers.get(
+            'Content-Transfer-Encoding', '7bit').strip().lower()
+        if encoding == 'base64':
+            self.decode_base64(write)
+        else:
+            if encoding == 'quoted-printable':
+                decode = binascii.a2b_qp
+            else:
+                decode = bytes
+            # the line break before a boundary belongs to the boundary
+            previous = b''
+            for line in self.lines():
+                write(decode(previous))
+                previous = line
+            if self.boundaries:
+                previous = re.sub(rb'\r?\n\Z', b'', previous)
+            write(decode(previous))
+
+    def decode_base64(self, write):
+        pending = b''
+        for line in self.lines():
+            pending += NOT_BASE64.sub(b'', line)
+            end = len(pending) // 4 * 4
+            if end:
+                write(decode_base64(pending[:end]))
+                pending = pending[end:]
+        if pending.rstrip(b'='):
+            write(decode_base64(pending + b'=' * (-len(pending) % 4)))
+
+
+def decode_base64(data):
+    try:
+        return binascii.a2b_base64(data)
+    except binascii.Error:
+        # like email, ignore badly padded data rather than failing
+        return b''
+
+
+def read_headers(reader, boundaries):
+    lines = []
+    while True:
+        line = reader.readline()
+        if not line or (
+                line in (b'\n', b'\r\n') and not reader.continued):
+            break
+        if not reader.continued and delimiter(line, boundaries)[0]:
+            # a part with no body
+            reader.unread(line)
+            break
+        lines.append(line)
+    return HEADER_PARSER.parsebytes(b''.join(lines))
+
+
+def skip_to(reader, boundaries):
+    """Skip lines up to a delimiter, returning (boundary, closing)."""
+    while True:
+        line = reader.readline()
+        if not line:
+            return None, False
+        if not reader.continued:
+            boundary, closing = delimiter(line, boundaries)
+            if boundary:
+                return boundary, closing
+
+
+def walk(reader, headers, boundaries):
+    """Yield each leaf Part of the entity with headers, in order."""
+    boundary = headers.get_boundary()
+    if headers.get_content_maintype() == 'multipart' and boundary:
+        boundary = boundary.encode('ascii', 'replace')
+        inner = boundaries + (boundary,)
+        found, closing = skip_to(reader, inner)
+        while found == boundary and not closing:
+            part_headers = read_headers(reader, inner)
+            yield from walk(reader, part_headers, inner)
+            found, closing = skip_to(reader, inner)
+        if found == boundary:
+            # skip the epilogue, up to any enclosing boundary
+            found, closing = skip_to(reader, boundaries)
+        if found:
+            reader.unread(b'--' + found + (b'--' if closing else b''))
+    elif headers.get_content_type() == 'message/rfc822':
+        yield from walk(reader, read_headers(reader, boundaries), boundaries)
+    else:
+        part = Part(headers, reader, boundaries)
+        yield part
+        part.skip()
+
+
+def parse(fp):
+    """Parse the message in the binary file fp.
+
+    Returns the message's headers, as an email.message.Message, and an
+    iterator over its leaf Parts. Each part's body must be decoded before
+    moving on to the next, or it is skipped.
+    """
+    reader = Reader(fp)
+    headers = read_headers(reader, ())
+    return headers, walk(reader, headers, ())
@@ -1,6 +1,7 @@
 const NOTES_SHARP = 'A A# B C C# D D# E F F# G G#'.split(' ')
 const NOTES_FLAT = 'A Bb B C Db D Eb E F Gb G Ab'.split(' ')
 const NOTES_ALL = 'A A# Bb B C C# Db D D# Eb E F F# Gb G G# Ab'.split(' ')
+const MINOR_ALL = 'Am A#m Bbm Bm Cm C#m Dm D#m Ebm Em Fm F#m Gm G#m Abm'.split(' ')
 const SHARP_KEYS = 'C Am G Em D Bm A F#m E C#m B G#m F# D#m C# A#m'.split(' ')
 const FLAT_KEYS = 'F Dm Bb Gm Eb Cm Ab Fm Db Bbm Gb Ebm Cb Abm'.split(' ')
 
@@ -11,8 +12,9 @@ function calculateTranspose (src, dst) {
   }
   const src_notes = FLAT_KEYS.includes(src) ? NOTES_FLAT : NOTES_SHARP
   const dst_notes = FLAT_KEYS.includes(dst) ? NOTES_FLAT : NOTES_SHARP
-  const src_index = src_notes.indexOf(src)
-  const dst_index = dst_notes.indexOf(dst)
+  // inferred keys may be minor, e.g. Am, so just use the tonic
+  const src_index = src_notes.indexOf(src.replace(/m$/, ''))
+  const dst_index = dst_notes.indexOf(dst.replace(/m$/, ''))
   const amount = dst_index - src_index
   let transpose = {}
   for (let i = 0; i < src_notes.length; i += 1) {
@@ -34,8 +36,25 @@ function transposeChord (chord, transpose) {
   return prefix + transpose[note] + rest + (bass ? '/' + transpose[bass] : '') + suffix
 }
 
+// a map of each of a song's chords in key src to the same chord in key dst,
+// from the table of its chords in every key built by transpose.py
+function chordTable (transpositions, src, dst) {
+  const table = {}
+  const to = transpositions[dst]
+  transpositions[src].forEach((chord, i) => { table[chord] = to[i] })
+  return table
+}
+
+// the keys a song in key can be transposed to: minor keys, like inferred
+// keys can be, stay minor
+function keyChoices (key) {
+  return key && key.endsWith('m') ? MINOR_ALL : NOTES_ALL
+}
+
 export {
   transposeChord,
   calculateTranspose,
+  chordTable,
+  keyChoices,
   NOTES_ALL
 }
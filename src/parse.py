@@ -1,12 +1,29 @@
 import base64
-from collections import OrderedDict, defaultdict
+import codecs
+from collections import Counter, OrderedDict, namedtuple
+import functools
+import io
 import itertools
+import os
 import re
 import subprocess
+import sys
+import threading
 
-import chardet
-from pdfrw import PdfReader
-import pdftitle
+import deadline
+import tracing
+
+# chardet, pdftitle, pdfmeta and pdftext (and so pdfrw) and keys (and so
+# numpy) are imported where they are used, so that only the code paths that
+# need them pay to load them.
+
+
+# bump this whenever the parsed song output changes, to invalidate any
+# cached songs
+VERSION = 5
+
+PDF_FILES = ('.pdf',)
+ONSONG_FILES = ('.onsong', '.cho', '.txt', '.chopro')
 
 
 class RE:
@@ -60,6 +77,22 @@ class RE:
         [ ]+                # spaces, discard
     """, re.VERBOSE)
 
+    # a single token in a chord line, as split by iter_chord_tokens
+    CHORD_TOKEN = re.compile(r"""
+        [\ \t\n\r]*              # leading spaces, discard
+        (
+            \||                 # bar lines
+            (?:
+                [^|\ \t\n\r(\[{]+|   # anything but separators and brackets
+                \([^)]*\)?|      # bracketed, to end of line if unclosed
+                \[[^\]]*\]?|
+                \{[^}]*\}?
+            )+
+        )
+    """, re.VERBOSE)
+    # adjacent capitals, which may be chords that have been joined, e.g. AB
+    CAPITALS = re.compile(r'[A-Z][A-Z]')
+
     # CHORDPRO directive
     DIRECTIVE = re.compile(r'{(?P<directive>\w+):(?P<value>.*)}')
 
@@ -84,47 +117,81 @@ KEY_CHORDS = {
     'G#': 'G# A#m B#m C# D# Fm',
 }
 
-CHORD_KEYS = defaultdict(list)
+Chord = namedtuple(
+    'Chord', sorted(RE.CHORD.groupindex, key=RE.CHORD.groupindex.get))
+
+# a set only has a few dozen distinct chord spellings, so bound the cache to
+# comfortably hold a whole library's worth, plus the non-chord words that
+# get checked when classifying lines.
+CHORD_CACHE_SIZE = 4096
+
 
-for key, chords in KEY_CHORDS.items():
-    for chord in chords.split(' '):
-        CHORD_KEYS[chord].append(key)
+@functools.lru_cache(maxsize=CHORD_CACHE_SIZE)
+def _classify_chord(token):
+    match = RE.CHORD.match(token)
+    if match:
+        return Chord(**match.groupdict())
+    return None
 
 
-def search(regex, text):
-    """Helper for regex searching."""
-    match = regex.search(text)
-    search.match = match
-    return match
+def classify_chord(token):
+    """Parse token as a chord, returning its Chord components, or None.
+
+    Results are cached, keyed on the interned token, so repeated chords are
+    only matched against RE.CHORD once.
+    """
+    return _classify_chord(sys.intern(token))
+
+
+def chord_cache_info():
+    """Report the chord classification cache's hit rate."""
+    info = _classify_chord.cache_info()
+    total = info.hits + info.misses
+    rate = info.hits / total if total else 0.0
+    return 'chord cache: {} hits, {} misses, {:.1%} hit rate'.format(
+        info.hits, info.misses, rate)
+
+
+def song_chords(song):
+    """The parsed chords of every chord in song's sections."""
+    chords = []
+    for section in song['sections'].values():
+        for token in re.findall(r'\[(.*?)\]', section):
+            chord = classify_chord(token)
+            if chord and chord.note:
+                chords.append(chord)
+    return chords
 
 
 def infer_key(chords):
-    counts = defaultdict(int)
-    for c in chords:
-        if search(RE.CHORD, c):
-            d = search.match.groupdict()
-            if d['note']:
-                simple = d['note'] + (d.get('third') or '')
-                if simple in CHORD_KEYS:
-                    for key in CHORD_KEYS[c]:
-                        counts[key] += 1
-
-    if counts:
-        result = list(sorted(counts.items(), key=lambda i: i[1]))
-        return result[-1][0]
-    else:
-        return None
+    """Infer the key from a list of chord names."""
+    import keys
+    classified = [classify_chord(c) for c in chords]
+    key, _ = keys.infer_keys([[c for c in classified if c]])[0]
+    return key
+
+
+def infer_song_keys(songs):
+    """Infer the keys of all songs at once, as (key, confidence) pairs."""
+    import keys
+    return keys.infer_keys([song_chords(song) for song in songs])
+
+
+def add_inferred_keys(songs):
+    songs = list(songs)
+    set_inferred_keys(songs, infer_song_keys(songs))
+
+
+def set_inferred_keys(songs, inferred):
+    for song, (inferred_key, confidence) in zip(songs, inferred):
+        song['inferred_key'] = inferred_key
+        song['inferred_key_confidence'] = confidence
+        if not song['key']:
+            song['key'] = inferred_key
 
 
 def add_inferred_key(song):
-    seen = []
-    for section in song['sections'].values():
-        chords = re.findall(r'\[(.*?)\]', section)
-        seen.extend(chords)
-    inferred_key = infer_key(seen)
-    song['inferred_key'] = inferred_key
-    if not song['key']:
-        song['key'] = inferred_key
+    add_inferred_keys([song])
 
 
 def clean_encoding(contents):
@@ -134,44 +201,49 @@ def clean_encoding(contents):
     return contents
 
 
-def strip_brackets(l):
-    if not l:
-        return l
-    if l[0] == '(' and l[-1] == ')':
-        return l[1:-1].replace('\\', '')
-    else:
-        return l.replace('\\', '')
-
-
-def convert_pdf(song, path, output):
-    """Parse and convert a pdf into text, including metadata.
+# read the pdf from stdin and write the text to stdout
+PDFTOTEXT = [
+    'pdftotext', '-layout', '-enc', 'UTF-8', '-eol', 'unix', '-nopgbrk',
+    '-', '-',
+]
 
-    Deals with various common conversion errors."""
 
-    meta = PdfReader(str(path)).Info
+def read_pdf_metadata(song, data):
+    """Populate song with author/creator/producer/title from the pdf."""
+    import pdfmeta
+    with tracing.span('pdfmeta', bytes=len(data)):
+        meta = pdfmeta.read_info(data)
     if meta:
-        song['author'] = strip_brackets(meta.Author)
-        song['creator'] = strip_brackets(meta.Creator)
-        song['producer'] = strip_brackets(meta.Producer)
-        if meta.Title:
+        song['author'] = meta.get('Author')
+        song['creator'] = meta.get('Creator')
+        song['producer'] = meta.get('Producer')
+        if meta.get('Title'):
             # explicit title in metadata, use that. Fairly rare.
-            song['title'] = strip_brackets(meta.Title.strip())
+            song['title'] = meta['Title'].strip()
     else:
         # multiline titles get mangles when converting to text, so we use
         # a library that uses heuristics to guess the title.
-        # It is slow, though
-        try:
-            title = pdftitle.get_title_from_file(str(path)).strip()
-        except Exception:
-            pass
-        else:
-            song['title'] = re.sub(r'([a-z])([A-Z])', r'\1 \2', title)
+        # It is slow, though, so is optional under a deadline
+        deadline.defer(guess_pdf_title, song, data)
 
-    cmd = ['pdftotext', '-layout', '-enc', 'UTF-8', '-eol', 'unix', '-nopgbrk']
-    subprocess.run(cmd + [str(path), output])
-    with open(output, 'r') as f:
-        contents = f.read()
-    # fix various issues
+
+def guess_pdf_title(song, data):
+    title = deadline.optional('pdftitle', pdf_title, data, song=song)
+    if title is not None:
+        song['title'] = re.sub(r'([a-z])([A-Z])', r'\1 \2', title)
+
+
+def pdf_title(data):
+    import pdftitle
+    try:
+        with tracing.span('pdftitle', bytes=len(data)):
+            return pdftitle.get_title_from_io(io.BytesIO(data)).strip()
+    except Exception:
+        return None
+
+
+def clean_pdf_text(contents):
+    """Fix various common pdftotext conversion errors."""
     contents = clean_encoding(contents)
     # TODO: we probably enforce ASCII, stripping unicode?
     # sometimes a chord like D(4) is extracted as D(4 which is hard to parse
@@ -179,60 +251,143 @@ def convert_pdf(song, path, output):
     return contents
 
 
-def tokenise_chords(chord_line):
-    """Tokenise a chord line into separate items.
+def is_chord_text(text):
+    return is_chord_line(tokenise_chords(text))
+
+
+def extract_pdf_text(data):
+    """Extract the text of a pdf in process, or None if it cannot be.
+
+    Chord lines are laid out over their lyrics by the glyphs' positions,
+    rather than pdftotext's estimate of their columns.
+    """
+    import pdftext
+    with tracing.span('pdftext', bytes=len(data)):
+        try:
+            text = pdftext.extract_text(data, is_chord_text)
+        except pdftext.PdfTextError:
+            return None
+    return text if text.strip() else None
+
+
+def convert_pdf(song, data):
+    """Parse and convert a pdf into text, including metadata.
+
+    The text is extracted in process, falling back to piping the pdf
+    through pdftotext, so nothing touches the filesystem.
+    Deals with various common conversion errors."""
+    read_pdf_metadata(song, data)
+    text = extract_pdf_text(data)
+    if text is None:
+        with tracing.span('pdftotext', bytes=len(data)):
+            try:
+                proc = subprocess.run(
+                    PDFTOTEXT, input=data, stdout=subprocess.PIPE,
+                    timeout=deadline.timeout('pdftotext'))
+            except subprocess.TimeoutExpired:
+                # the song fails, and so keeps its pdf to show instead
+                deadline.skip('pdftotext', song, 'timeout')
+                return ''
+        text = proc.stdout.decode('utf8')
+    return clean_pdf_text(text)
+
+
+async def convert_pdf_async(song, data):
+    """Async version of convert_pdf.
+
+    The text is extracted in a thread, and pdftotext, if it is needed,
+    runs as an async subprocess, while the metadata is read in another
+    thread.
+    """
+    import asyncio
+    metadata = asyncio.create_task(
+        asyncio.to_thread(read_pdf_metadata, song, data))
+    text = await asyncio.to_thread(extract_pdf_text, data)
+    if text is None:
+        with tracing.span('pdftotext', bytes=len(data)):
+            proc = await asyncio.create_subprocess_exec(
+                *PDFTOTEXT, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            try:
+                stdout, _ = await asyncio.wait_for(
+                    proc.communicate(data), deadline.timeout('pdftotext'))
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                deadline.skip('pdftotext', song, 'timeout')
+                stdout = b''
+        text = stdout.decode('utf8')
+    await metadata
+    return clean_pdf_text(text)
+
+
+BRACKETS = {
+    '(': ')',
+    '[': ']',
+    '{': '}',
+}
+
+
+def iter_chord_tokens(chord_line):
+    """Tokenise a chord line in a single pass, yielding (offset, token).
 
     Valid tokens are: chords, |, and bracketed directives e.g. (To Chorus).
     """
-    chords = []
-    chord = []
+    for match in RE.CHORD_TOKEN.finditer(chord_line):
+        token = match.group(1)
+        start = match.start(1)
+        if token.isascii() and not RE.CAPITALS.search(token):
+            # fast path, nothing to split
+            yield start, token
+        else:
+            for offset, split in split_chord_token(token):
+                yield start + offset, split
+
+
+def split_chord_token(token):
+    """Split chords in token that have been joined, e.g. AB."""
+    start = None  # offset of the current token, if any
     closer = None
-    brackets = {
-        '(': ')',
-        '[': ']',
-        '{': '}',
-    }
+    # track whether the current token is all letters and upper case, so we
+    # can split without rescanning it
+    alpha = upper = lower = False
 
-    for c in chord_line:
+    for i, c in enumerate(token):
         if closer:
             if c == closer:
                 closer = None
-            chord.append(c)
-        elif c in brackets:
-            chord.append(c)
-            closer = brackets[c]
-        elif c in '| \t\n\r':
-            if chord:
-                chords.append(''.join(chord))
-            if c == '|':
-                chords.append('|')
-            chord = []
+        elif c in BRACKETS:
+            if start is None:
+                start = i
+            closer = BRACKETS[c]
+            alpha = False
         else:
-            if chord:
-                all = ''.join(chord + [c])
-                if all.isalpha() and all.isupper():
-                    chords.append(''.join(chord))
-                    chord = []
-            chord.append(c)
+            c_alpha = c.isalpha()
+            c_upper = c.isupper()
+            c_lower = not c_upper and (c.islower() or c.istitle())
+            if start is None:
+                start = i
+                alpha, upper, lower = c_alpha, c_upper, c_lower
+            elif (alpha and c_alpha and not (lower or c_lower)
+                    and (upper or c_upper)):
+                yield start, token[start:i]
+                start = i
+                alpha, upper, lower = c_alpha, c_upper, c_lower
+            else:
+                alpha = alpha and c_alpha
+                upper = upper or c_upper
+                lower = lower or c_lower
 
-    if chord:
-        chords.append(''.join(chord))
+    yield start, token[start:]
 
-    return chords
+
+def tokenise_chords(chord_line):
+    """Tokenise a chord line into separate items."""
+    return [token for _, token in iter_chord_tokens(chord_line)]
 
 
 def chord_indicies(chord_line):
     """Find the indicies of all chords, bars and comments in the chord line."""
-    i = 0
-    for chord in tokenise_chords(chord_line):
-        search_index = chord_line[i:].find(chord)
-        if search_index == -1:
-            raise Exception(
-                'could not find {} in {}'.format(chord, chord_line)
-            )
-        chord_index = i + search_index
-        yield chord_index, chord
-        i = chord_index + len(chord)
+    return iter_chord_tokens(chord_line)
 
 
 def is_chord_line(tokens, comments=True):
@@ -245,7 +400,7 @@ def is_chord_line(tokens, comments=True):
         elif comments and t[0] == '(' and t[-1] == ')':
             # directions like (To Pre-Chorus) that appear in chord lines
             chords += 1
-        elif RE.CHORD.match(t):
+        elif classify_chord(t):
             chords += 1
         else:
             not_chords += 1
@@ -253,6 +408,57 @@ def is_chord_line(tokens, comments=True):
     return chords > not_chords
 
 
+def lex_lines(lines, layout=True):
+    """Classify each of lines exactly once, yielding a token for each.
+
+    Layout text, as converted from pdfs, has chord lines over lyric lines,
+    page numbers, and superscripts pushed onto lines of their own. OnSong
+    and chordpro text instead has chords inline, and {directives}, which
+    are sections if their value is a section's name. lines can be any
+    iterator, which is only advanced as tokens are taken.
+
+    Each token is a (kind, line, text, name, chords) tuple, kept a plain
+    tuple as one is made for every line. kind is one of blank, ccli, page,
+    section, chord, superscript, directive or lyric, and text the part of
+    the line that matters for its kind, e.g. the section's name, the CCLI
+    number, or the line without trailing space. name is the directive's
+    name, if the line is one, and chords a layout line's chord tokens.
+    """
+    for line in lines:
+        stripped = line.strip()
+        if not stripped:
+            yield 'blank', line, '', None, None
+            continue
+        directive = None
+        if not layout and '{' in line:
+            directive = RE.DIRECTIVE.search(line)
+        ccli = RE.CCLI.search(line)
+        if ccli:
+            # even in a directive, like {comment: CCLI Song # 22025}
+            name = directive and directive.group('directive')
+            yield 'ccli', line, ccli.group(1), name, None
+        elif directive:
+            value = directive.group('value').strip()
+            kind = 'section' if RE.SECTION.search(value) else 'directive'
+            yield kind, line, value, directive.group('directive'), None
+        elif layout and RE.PAGE.search(stripped):
+            yield 'page', line, stripped, None, None
+        elif RE.SECTION.search(line):
+            yield 'section', line, stripped, None, None
+        elif not layout:
+            yield 'lyric', line, line.rstrip(), None, None
+        else:
+            chords = tokenise_chords(line)
+            if is_chord_line(chords):
+                yield 'chord', line, line.rstrip(), None, chords
+            elif stripped.isdigit():
+                # superscript chord markings pushed onto their own line
+                # above by pdftotext
+                yield 'superscript', line, line, None, None
+            else:
+                yield 'lyric', line, line.rstrip(), None, chords
+
+
 def chordpro_line(chord_line, lyric_line):
     """Merge separate chord and lyric lines into one chordpro line.
 
@@ -279,50 +485,48 @@ def chordpro_line(chord_line, lyric_line):
 
 
 def chord_and_lyrics(chord_line, lyric_line):
-    chord_iter = itertools.chain(
-        chord_indicies(chord_line),
-        itertools.repeat((-1, None)),
-    )
-    line_iter = enumerate(
-        itertools.chain(
-            lyric_line,
-            itertools.repeat(None),
-        ),
-    )
-    output = []
+    """Merge chords into the lyric line.
 
-    index, chord = next(chord_iter)
-    i, char = next(line_iter)
-    last_char = None
-    while chord or char:
-        if i == index:
-            if chord.startswith('(') and chord.endswith(')'):
-                output.append('{comment:' + chord + '}')
+    The lyrics between chords are copied a span at a time, so this is linear
+    in the length of the lines, however many chords there are.
+    """
+    output = []
+    append = output.append
+    end = len(lyric_line)
+    pos = 0  # current position in the lyric line
+    last_char = None  # last lyric character output
+
+    for index, chord in iter_chord_tokens(chord_line):
+        if index > pos:
+            # copy the lyrics up to the chord, padding if the chord line is
+            # longer than the lyric line
+            if index <= end:
+                span = lyric_line[pos:index]
             else:
-                if output and output[-1][-1] == ']':
-                    # ensure a space between chords
-                    output.append(' ')
-                elif char == ' ' and last_char != ' ':
-                    # ensure there is a space in the lyric line to 'attach'
-                    # to
-                    output.append(' ')
-                output.append('[' + chord + ']')
+                span = lyric_line[pos:] + ' ' * (index - max(pos, end))
+            append(span)
+            last_char = span[-1]
+            pos = index
+
+        char = lyric_line[pos] if pos < end else None
+        if chord[0] == '(' and chord[-1] == ')':
+            append('{comment:' + chord + '}')
+        else:
+            if output and output[-1][-1] == ']':
+                # ensure a space between chords
+                append(' ')
+            elif char == ' ' and last_char != ' ':
+                # ensure there is a space in the lyric line to 'attach' to
+                append(' ')
+            append('[' + chord + ']')
+
+        if char == ' ':
             # skip up to the chord's length of spaces in the lyric line
-            skipped = 0
-            while char == ' ' and skipped < len(chord):
-                last_char = char
-                i, char = next(line_iter)
-                skipped += 1
+            spaces = lyric_line[pos:pos + len(chord)]
+            pos += len(spaces) - len(spaces.lstrip(' '))
+            last_char = ' '
 
-            index, chord = next(chord_iter)
-        else:
-            if char is None:
-                output.append(' ')
-                last_char = ' '
-            else:
-                output.append(char)
-                last_char = char
-            i, char = next(line_iter)
+    output.append(lyric_line[pos:])
 
     # condense spaces
     chordpro = ''.join(output).strip()
@@ -415,81 +619,117 @@ def parse_header(song, header):
         song['blurb'] = '\n'.join(header[2:])
 
 
-def parse_pdf(path, build_dir):
+def parse_bytes(filename, data):
+    """Parse the contents of a song file, using filename to pick a parser.
+
+    Returns None if filename is not a kind of file we can parse.
+    """
+    suffix = os.path.splitext(filename)[1]
+    if suffix in PDF_FILES:
+        return parse_pdf_bytes(data)
+    elif suffix in ONSONG_FILES:
+        return parse_onsong_bytes(data)
+    else:
+        return None
+
+
+def parse_pdf(path):
+    return parse_pdf_bytes(path.read_bytes())
+
+
+def parse_pdf_bytes(data):
     """Parse a pdf intro plain text.
 
     Right now this is simple and a bit brittle. It converts the pdf to text
-    using pdttotext from the poppler project, then attempts to parse that
-    textual output into a semantic song data.
-
-    In the future, it could parse the pdf directly.
+    with pdftext, or pdftotext from the poppler project if that fails, then
+    attempts to parse that textual output into a semantic song data.
     """
 
     song = new_song()
     song['type'] = 'pdf'
-    sheet = convert_pdf(song, path, str(build_dir / (path.stem + '.raw')))
+    sheet = convert_pdf(song, data)
+    return parse_pdf_sheet(song, sheet, data)
 
-    sheet_lines = sheet.split('\n')
-    # skip any leading blank lines
-    for i, line in enumerate(sheet_lines):
-        if line.strip():
-            break
 
-    lines = sheet_lines[i:]
+async def parse_pdf_bytes_async(data, limit):
+    """Async version of parse_pdf_bytes.
+
+    limit is a semaphore bounding how many conversions run at once.
+    """
+    song = new_song()
+    song['type'] = 'pdf'
+    async with limit:
+        sheet = await convert_pdf_async(song, data)
+    return parse_pdf_sheet(song, sheet, data)
+
+
+def parse_pdf_sheet(song, sheet, data):
+    """Parse the converted text of a pdf into song."""
+    tokens = lex_lines(sheet.split('\n'))
+    # skip any leading blank lines
+    tokens = itertools.dropwhile(lambda token: token[0] == 'blank', tokens)
 
     failed = False
     header = []
-    for i, line in enumerate(lines[:10]):
-        if RE.SECTION.search(line):
+    # the tokens parse_sections starts from: the whole sheet if there is
+    # no discernable header
+    seen = []
+    for token in itertools.islice(tokens, 10):
+        kind, line, _, _, chords = token
+        if kind == 'section':
+            seen = [token]
             break
-        elif is_chord_line(tokenise_chords(line), comments=False):
+        elif kind == 'chord' and is_chord_line(chords, comments=False):
+            seen = [token]
             break
-        elif search(RE.CCLI, line):
+        elif kind == 'ccli':
             failed = True
-            parse_legal(song, lines[i:])
+            seen = [token] + list(tokens)
+            parse_legal(song, [each[1] for each in seen])
             break
         else:
+            seen.append(token)
             header.append(line)
-    else:
-        # no discernable header, so go from start
-        i = 0
 
     if header:
         parse_header(song, header)
 
-    parse_sections(song, iter(lines[i:]))
+    with tracing.span('parse_sections'):
+        parse_sections(song, itertools.chain(seen, tokens))
 
     if failed or not song['sections']:
         song['type'] = 'pdf-failed'
-        song['pdf'] = base64.b64encode(path.read_bytes()).decode('utf8')
+        song['pdf'] = base64.b64encode(data).decode('utf8')
 
     return song
 
 
 def parse_legal(song, lines):
     lines = list(lines)
-    if search(RE.CCLI, lines[0]):
-        song['ccli'] = search.match.groups()[0]
+    match = RE.CCLI.search(lines[0])
+    if match:
+        song['ccli'] = match.group(1)
     song['legal'] += '\n'.join(l.strip() for l in lines)
 
 
-def parse_sections(song, line_iter):
+def parse_sections(song, tokens):
+    """Parse the sections of song from the lex_lines tokens of layout text.
+    """
+    sections = OrderedDict()
     section_name = None
     section_lines = []
     chord_line = None
     superscript_line = None
+    ccli = None
 
-    for line in line_iter:
-        if not line.strip():  # skip blank lines
+    for kind, line, text, _, _ in tokens:
+        if kind == 'blank' or kind == 'page':
             continue
-        ccli = RE.CCLI.search(line)
-        if ccli:
+        if kind == 'ccli':
+            ccli = line
             break
-        if RE.PAGE.search(line.strip()):
-            continue
 
-        tokens = tokenise_chords(line)
-        if RE.SECTION.search(line):
+        if kind == 'section':
             if chord_line:
                 section_lines.append((chord_line, None))
             if section_lines:
@@ -500,29 +740,26 @@ def parse_sections(song, line_iter):
                     else:
                         # some lyrics, assume V1
                         section_name = 'VERSE 1'
-                song['sections'][section_name] = section_lines
+                sections[section_name] = section_lines
             chord_line = None
-            section_name = line.strip()
+            section_name = text
             section_lines = []
-        elif is_chord_line(tokens):
+        elif kind == 'chord':
             if chord_line is not None:
                 section_lines.append((chord_line, None))
             if superscript_line is not None:
                 chord_line = fix_superscript_line(
                     superscript_line,
-                    line.rstrip(),
+                    text,
                 )
                 superscript_line = None
             else:
-                chord_line = line.rstrip()
+                chord_line = text
+        elif kind == 'superscript':
+            superscript_line = line
         else:
-            # handle case where superscript chord markings get pushed onto
-            # their own line above by pdftotext
-            if line.strip().isdigit():
-                superscript_line = line
-            else:
-                section_lines.append((chord_line, line.rstrip()))
-                chord_line = None
+            section_lines.append((chord_line, text))
+            chord_line = None
 
     # handle dangling chord line
     if chord_line:
@@ -532,20 +769,16 @@ def parse_sections(song, line_iter):
         if section_name is None:
             # no section names at all. It happens.
             section_name = 'VERSE 1'
-        song['sections'][section_name] = section_lines
+        sections[section_name] = section_lines
 
     # did we reached the CCLI number
     if ccli is not None:
-        parse_legal(song, [line] + list(line_iter))
+        parse_legal(song, [ccli] + [token[1] for token in tokens])
 
     # convert into chordpro
-    for name, section_lines in song['sections'].items():
-        for chords, _ in section_lines:
-            if not chords:
-                continue
+    for name, section_lines in sections.items():
         song['sections'][name] = '\n'.join(
-            chordpro_line(c, l) for c, l in section_lines
-        )
+            chordpro_line(c, l) for c, l in section_lines)
 
 
 def new_song():
@@ -601,12 +834,77 @@ META = {
 
 
 def parse_onsong(path):
-    raw = path.read_bytes()
-    meta = chardet.detect(raw)
-    encoding = meta['encoding']
-    if 'UTF-16' in encoding:
-        encoding = 'UTF-16'  # this encoding strips any BOM
-    text = clean_encoding(raw.decode(encoding))
+    return parse_onsong_bytes(path.read_bytes())
+
+
+# checked in order, as the utf-32-le BOM starts with the utf-16-le one. The
+# decoders for these encodings all strip the BOM.
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# how much of a file chardet looks at, as it is slow on large files
+CHARDET_SAMPLE = 32 * 1024
+
+# how many files each detect_encoding step has decided, counted under the
+# lock as files are decoded in threads by build's async loader
+ENCODING_COUNTS = Counter()
+ENCODING_LOCK = threading.Lock()
+
+
+def detect_encoding(raw):
+    """Detect the encoding of raw, returning (encoding, how).
+
+    Tries, in order, a BOM, a strict utf8 decode, and then chardet on the
+    start of the file. how records which of 'bom', 'utf8' or 'chardet'
+    decided.
+    """
+    for bom, encoding in BOMS:
+        if raw.startswith(bom):
+            return encoding, 'bom'
+    try:
+        raw.decode('utf8')
+    except UnicodeDecodeError:
+        pass
+    else:
+        return 'utf8', 'utf8'
+
+    import chardet
+    encoding = chardet.detect(raw[:CHARDET_SAMPLE])['encoding']
+    if not encoding or encoding == 'ascii':
+        # the sample was ascii, but the file was not utf8, so it is most
+        # likely windows' default encoding
+        encoding = 'cp1252'
+    return encoding, 'chardet'
+
+
+def decode_text(raw):
+    encoding, how = detect_encoding(raw)
+    with ENCODING_LOCK:
+        ENCODING_COUNTS[how] += 1
+    # chardet only saw a sample, so may have been wrong about the rest
+    errors = 'replace' if how == 'chardet' else 'strict'
+    return raw.decode(encoding, errors)
+
+
+def encoding_info():
+    """Report how many files each step of detect_encoding decided."""
+    return 'encodings: ' + ', '.join(
+        '{} by {}'.format(ENCODING_COUNTS[how], how)
+        for how in ('bom', 'utf8', 'chardet'))
+
+
+def parse_onsong_bytes(raw):
+    with tracing.span('parse_onsong', bytes=len(raw)):
+        return _parse_onsong_bytes(raw)
+
+
+def _parse_onsong_bytes(raw):
+    text = clean_encoding(decode_text(raw))
 
     # fix lack of support for ||: and :||
     text = text.replace('||:', '|').replace(':||', '|')
@@ -619,19 +917,23 @@ def parse_onsong(path):
     section_lines = []
 
     line_iter = iter(text.splitlines())
+    tokens = lex_lines(line_iter, layout=False)
 
     # parse header
-    for line in line_iter:
-        if search(RE.DIRECTIVE, line):
-            meta = META.get(search.match.group('directive'))
+    for kind, line, text, name, _ in tokens:
+        if name is not None:  # a directive
+            meta = META.get(name)
 
             if meta:
                 current = song[meta]
-                value = search.match.group('value').strip()
+                value = text
+                if kind == 'ccli':
+                    # text is the CCLI number, not the directive's value
+                    value = RE.DIRECTIVE.search(line).group('value').strip()
 
                 # try detect if there is no header
-                if RE.SECTION.search(value):
-                    section = value.strip()
+                if kind == 'section':
+                    section = value
                     break
 
                 if current:
@@ -644,45 +946,43 @@ def parse_onsong(path):
                     section = line.strip()
                     break
 
-        elif search(RE.KEY, line):
-            song['key'] = search.match.group('key').strip()
-        elif line.strip():
+        elif kind == 'blank':
+            break
+        else:
+            key = RE.KEY.search(line)
+            if key:
+                song['key'] = key.group('key').strip()
+                continue
+            line = line.strip()
             if song['title'] is None:
-                song['title'] = line.strip()
+                song['title'] = line
             elif song['author'] is None:
-                song['author'] = line.strip()
+                song['author'] = line
             else:
-                song['blurb'] += line.strip()
-        else:
-            break
-
-    for line in line_iter:
-        if not line.strip(): 
-            continue
-
-        if search(RE.DIRECTIVE, line):
-            directive = search.match.group('directive')
-            if directive == 'comment':
-                section_search = search.match.group('value').strip()
-        else:
-            section_search = line
+                song['blurb'] += line
 
-        if RE.SECTION.search(section_search):
+    for kind, line, text, name, _ in tokens:
+        # only {comment} directives name sections in the body
+        if kind == 'section' and name in (None, 'comment'):
             if section is not None and section_lines:
                 song['sections'][section] = '\n'.join(section_lines)
-            section = section_search.strip()
+            section = text
             section_lines = []
-        elif search(RE.CCLI, line):
-            song['ccli'] = search.match.groups()[0]
+        elif kind == 'ccli':
+            song['ccli'] = text
+            # the lexer has taken no further than the ccli line
             song['legal'] = '\n'.join(line_iter)
             break
-        else:  # normal line
+        elif kind != 'blank':  # normal line
             if section is None:
                 section = 'VERSE {}'.format(verse_counter)
                 verse_counter += 1
-            if '|' in line:
-                line = re.sub(r'(^|[^\[])\|([^]]|$)', '[|]', line)
-            section_lines.append(line.rstrip())
+            if kind != 'lyric':
+                # other directives are kept as they are
+                text = line.rstrip()
+            if '|' in text:
+                text = re.sub(r'(^|[^\[])\|([^]]|$)', '[|]', text)
+            section_lines.append(text)
 
     if section is not None and section_lines:
         song['sections'][section] = '\n'.join(section_lines)
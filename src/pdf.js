@@ -1,14 +1,17 @@
 import { h } from 'preact'
 import { useState, useEffect, useRef, useMemo, useCallback } from 'preact/hooks'
 import PdfJsLib from '@bundled-es-modules/pdfjs-dist/build/pdf'
-import { useEventListener } from './hooks'
+import { useEventListener, useVisible } from './hooks'
 
 const WORKER_SRC = 'pdf.worker.js'
 PdfJsLib.GlobalWorkerOptions.workerSrc = WORKER_SRC
 
-const Pdf = ({ data, onDocumentComplete, page, scale }) => {
+// load returns a promise of the pdf data, and is only called once the pdf
+// is scrolled into view
+const Pdf = ({ load, onDocumentComplete, page, scale }) => {
   const containerRef = useRef(null)
-  const [, numPages] = usePdf({ containerRef, data, page, scale })
+  const visible = useVisible(containerRef)
+  const [, numPages] = usePdf({ containerRef, load, visible, page, scale })
 
   useEffect(() => {
     onDocumentComplete(numPages)
@@ -21,14 +24,16 @@ Pdf.defaultProps = {
   onDocumentComplete: () => {}
 }
 
-export const usePdf = ({ containerRef, data, page = 1, scale = 1 }) => {
+export const usePdf = ({ containerRef, load, visible, page = 1, scale = 1 }) => {
   const [pdf, setPdf] = useState()
   const [width, setWidth] = useState(window.innerWidth)
 
   useEffect(() => {
-    const config = { data: data }
-    PdfJsLib.getDocument(config).promise.then(setPdf)
-  }, [data])
+    if (!visible) return
+    load()
+      .then(data => PdfJsLib.getDocument({ data: data }).promise)
+      .then(setPdf)
+  }, [load, visible])
 
   // handle changes
   useEffect(() => {
@@ -0,0 +1,305 @@
+"""Read a pdf's Info dictionary without parsing the whole document.
+
+Only the trailer, the cross-reference table and the Info object itself are
+read, which is much cheaper than building a full pdfrw.PdfReader. Files that
+use cross-reference streams, where the Info dict may be inside a compressed
+object stream, or are encrypted, fall back to pdfrw, which is only imported
+if it is needed.
+"""
+import mmap
+import re
+
+
+class PdfMetaError(Exception):
+    pass
+
+
+class RE:
+    STARTXREF = re.compile(rb'startxref\s+(\d+)')
+    SUBSECTION = re.compile(rb'\s*(\d+)\s+(\d+)\s*')
+    DELIMITER = re.compile(rb'[\s()<>\[\]{}/%]')
+    NUMBER = re.compile(rb'[+-]?(?:\d+\.?\d*|\.\d+)')
+    REF = re.compile(rb'\s+(\d+)\s+R(?![^\s()<>\[\]{}/%])')
+    WHITESPACE = re.compile(rb'(?:\s|%[^\r\n]*)*')
+
+
+ESCAPES = {
+    ord('n'): b'\n',
+    ord('r'): b'\r',
+    ord('t'): b'\t',
+    ord('b'): b'\b',
+    ord('f'): b'\f',
+    ord('('): b'(',
+    ord(')'): b')',
+    ord('\\'): b'\\',
+}
+
+
+class Name(str):
+    pass
+
+
+class Ref:
+    """An indirect reference, e.g. 12 0 R."""
+
+    def __init__(self, num, gen):
+        self.num = num
+        self.gen = gen
+
+
+class Parser:
+    """A minimal parser for the pdf object syntax used by Info dicts."""
+
+    def __init__(self, data, pos):
+        self.data = data
+        self.pos = pos
+
+    def skip_whitespace(self):
+        self.pos = RE.WHITESPACE.match(self.data, self.pos).end()
+
+    def expect(self, token):
+        self.skip_whitespace()
+        if self.data[self.pos:self.pos + len(token)] != token:
+            raise PdfMetaError(
+                'expected {!r} at {}'.format(token, self.pos))
+        self.pos += len(token)
+
+    def parse(self):
+        self.skip_whitespace()
+        data = self.data
+        c = data[self.pos:self.pos + 2]
+        if c == b'<<':
+            return self.parse_dict()
+        elif c[:1] == b'<':
+            return self.parse_hex_string()
+        elif c[:1] == b'(':
+            return self.parse_string()
+        elif c[:1] == b'/':
+            return self.parse_name()
+        elif c[:1] == b'[':
+            return self.parse_array()
+
+        number = RE.NUMBER.match(data, self.pos)
+        if number:
+            self.pos = number.end()
+            ref = RE.REF.match(data, self.pos)
+            if ref and number.group().isdigit():
+                self.pos = ref.end()
+                return Ref(int(number.group()), int(ref.group(1)))
+            return number.group().decode('ascii')
+
+        # keywords: true, false, null
+        end = RE.DELIMITER.search(data, self.pos + 1)
+        end = end.start() if end else len(data)
+        keyword = data[self.pos:end]
+        if not keyword:
+            raise PdfMetaError('unexpected token at {}'.format(self.pos))
+        self.pos = end
+        return {b'true': True, b'false': False}.get(keyword)
+
+    def parse_dict(self):
+        self.expect(b'<<')
+        result = {}
+        while True:
+            self.skip_whitespace()
+            if self.data[self.pos:self.pos + 2] == b'>>':
+                self.pos += 2
+                return result
+            key = self.parse()
+            if not isinstance(key, Name):
+                raise PdfMetaError('bad dict key at {}'.format(self.pos))
+            result[key] = self.parse()
+
+    def parse_array(self):
+        self.expect(b'[')
+        result = []
+        while True:
+            self.skip_whitespace()
+            if self.data[self.pos:self.pos + 1] == b']':
+                self.pos += 1
+                return result
+            result.append(self.parse())
+
+    def parse_name(self):
+        end = RE.DELIMITER.search(self.data, self.pos + 1)
+        end = end.start() if end else len(self.data)
+        name = self.data[self.pos + 1:end]
+        self.pos = end
+        return Name(re.sub(
+            rb'#([0-9a-fA-F]{2})',
+            lambda m: bytes([int(m.group(1), 16)]),
+            name,
+        ).decode('latin-1'))
+
+    def parse_hex_string(self):
+        end = self.data.find(b'>', self.pos)
+        if end == -1:
+            raise PdfMetaError('unterminated hex string')
+        digits = re.sub(rb'\s', b'', self.data[self.pos + 1:end])
+        if len(digits) % 2:
+            digits += b'0'
+        self.pos = end + 1
+        return bytes.fromhex(digits.decode('ascii'))
+
+    def parse_string(self):
+        data = self.data
+        out = bytearray()
+        depth = 0
+        pos = self.pos + 1
+        while pos < len(data):
+            c = data[pos]
+            pos += 1
+            if c == 0x5c:  # backslash
+                n = data[pos]
+                pos += 1
+                if n in ESCAPES:
+                    out += ESCAPES[n]
+                elif 0x30 <= n <= 0x37:  # octal
+                    digits = bytes([n])
+                    while len(digits) < 3 and 0x30 <= data[pos] <= 0x37:
+                        digits += bytes([data[pos]])
+                        pos += 1
+                    out.append(int(digits, 8) & 0xff)
+                elif n == 0x0d:  # line continuation
+                    if data[pos] == 0x0a:
+                        pos += 1
+                elif n != 0x0a:
+                    out.append(n)
+            elif c == 0x28:  # (
+                depth += 1
+                out.append(c)
+            elif c == 0x29:  # )
+                if depth == 0:
+                    self.pos = pos
+                    return bytes(out)
+                depth -= 1
+                out.append(c)
+            else:
+                out.append(c)
+        raise PdfMetaError('unterminated string')
+
+
+def decode_text(value):
+    """Decode a pdf text string, which is either UTF-16 or PDFDocEncoding."""
+    if value[:2] == b'\xfe\xff':
+        return value[2:].decode('utf-16-be', 'replace')
+    elif value[:3] == b'\xef\xbb\xbf':
+        return value[3:].decode('utf8', 'replace')
+    # PDFDocEncoding is latin-1 for all practical purposes
+    return value.decode('latin-1')
+
+
+def find_object(data, xref, num, gen):
+    """Find the offset of the 'num gen obj' definition in data."""
+    if data[xref:xref + 4] == b'xref':
+        pos = xref + 4
+        while True:
+            subsection = RE.SUBSECTION.match(data, pos)
+            if not subsection:
+                break
+            start, count = map(int, subsection.groups())
+            pos = subsection.end()
+            if start <= num < start + count:
+                entry = pos + (num - start) * 20
+                offset, _, kind = data[entry:entry + 18].split()
+                if kind == b'n':
+                    return int(offset)
+                return None
+            pos += count * 20
+
+    # not in the latest table, e.g. an incremental update, so search
+    # for the last definition instead.
+    matches = list(re.finditer(
+        rb'(?<!\d)%d\s+%d\s+obj\b' % (num, gen), data))
+    if matches:
+        return matches[-1].start()
+    return None
+
+
+def read_object(data, xref, ref):
+    offset = find_object(data, xref, ref.num, ref.gen)
+    if offset is None:
+        raise PdfMetaError('object {} {} not found'.format(ref.num, ref.gen))
+    parser = Parser(data, offset)
+    parser.expect(str(ref.num).encode('ascii'))
+    parser.expect(str(ref.gen).encode('ascii'))
+    parser.expect(b'obj')
+    return parser.parse()
+
+
+def read_trailer_info(data):
+    """Read the Info dict from the trailer, or raise PdfMetaError if we
+    cannot without parsing the whole file."""
+    match = None
+    for match in RE.STARTXREF.finditer(data, max(0, len(data) - 2048)):
+        pass
+    if match is None:
+        raise PdfMetaError('no startxref')
+    xref = int(match.group(1))
+
+    if data[xref:xref + 4] != b'xref':
+        # cross-reference stream, possibly with compressed objects
+        raise PdfMetaError('xref stream')
+
+    trailer = data.find(b'trailer', xref)
+    if trailer == -1:
+        raise PdfMetaError('no trailer')
+    parser = Parser(data, trailer + len(b'trailer'))
+    trailer_dict = parser.parse()
+    if not isinstance(trailer_dict, dict):
+        raise PdfMetaError('trailer is not a dict')
+    if 'Encrypt' in trailer_dict:
+        raise PdfMetaError('encrypted')
+
+    info_ref = trailer_dict.get('Info')
+    if info_ref is None:
+        if 'Prev' in trailer_dict:
+            # Info could be in an earlier revision's trailer
+            raise PdfMetaError('no Info in latest trailer')
+        return None
+    if not isinstance(info_ref, Ref):
+        raise PdfMetaError('Info is not a reference')
+    info = read_object(data, xref, info_ref)
+    if not isinstance(info, dict):
+        raise PdfMetaError('Info is not a dict')
+
+    result = {}
+    for key, value in info.items():
+        if isinstance(value, Ref):
+            value = read_object(data, xref, value)
+        if isinstance(value, bytes):
+            result[key] = decode_text(value)
+        elif isinstance(value, str):
+            result[key] = value
+    return result
+
+
+def read_pdfrw_info(data):
+    # pdfrw is slow to import, and only needed for the awkward cases
+    from pdfrw import PdfReader
+    info = PdfReader(fdata=data).Info
+    if info is None:
+        return None
+    result = {}
+    for key, value in info.items():
+        if hasattr(value, 'decode'):
+            value = value.decode()
+        result[key[1:]] = str(value)
+    return result
+
+
+def read_info(data):
+    """Read the Info dict of the pdf in data, which may be bytes or an mmap.
+
+    Returns a dict of str, or None if there is no Info dict.
+    """
+    try:
+        return read_trailer_info(data)
+    except (PdfMetaError, ValueError, IndexError, AttributeError):
+        return read_pdfrw_info(bytes(data))
+
+
+def read_info_file(path):
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return read_info(data)
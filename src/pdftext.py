@@ -0,0 +1,544 @@
+"""Extract the layout text of a pdf in process, from its content streams.
+
+Each page's content stream is interpreted just enough to find where every
+glyph is drawn: the text showing operators, the text and graphics state
+that position them, and the fonts' widths and encodings. Glyphs are
+grouped into lines by baseline, so superscripts stay with their chord, and
+the gaps between glyphs become spaces. A chord line over a lyric line is
+laid out so each chord starts at the column of the lyric character under
+it, by x position, which is what the parser needs to merge them.
+
+The output is like pdftotext -layout's, which parse.convert_pdf falls back
+to for anything that cannot be read here, e.g. streams with filters other
+than FlateDecode.
+"""
+import bisect
+import re
+
+import pdfmeta
+
+# pdfrw is imported where it is used, as it is slow to import
+
+
+class PdfTextError(Exception):
+    pass
+
+
+class RE:
+    TOKEN = re.compile(
+        rb'(?:\s|%[^\r\n]*)*(?:'
+        rb'(?P<number>[+-]?(?:\d+\.?\d*|\.\d+))|'
+        rb'(?P<name>/[^\s()<>\[\]{}/%]*)|'
+        rb'(?P<operator>[^\s()<>\[\]{}/%]+)|'
+        rb'(?P<other>.))',
+        re.S,
+    )
+    INLINE_IMAGE_END = re.compile(rb'\sEI(?=\s|$)')
+    BFCHAR = re.compile(rb'beginbfchar(.*?)endbfchar', re.S)
+    BFRANGE = re.compile(rb'beginbfrange(.*?)endbfrange', re.S)
+    HEX_PAIR = re.compile(rb'<([0-9a-fA-F\s]*)>\s*<([0-9a-fA-F\s]*)>')
+    HEX_RANGE = re.compile(
+        rb'<([0-9a-fA-F\s]*)>\s*<([0-9a-fA-F\s]*)>\s*'
+        rb'(?:<([0-9a-fA-F\s]*)>|\[([^\]]*)\])')
+    HEX = re.compile(rb'<([0-9a-fA-F\s]*)>')
+
+
+# widths of the printable ascii characters in Helvetica, for the standard
+# fonts that are used without a Widths array
+HELVETICA_WIDTHS = dict(zip(range(32, 127), [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333,
+    278, 278, 556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278,
+    584, 584, 584, 556, 1015, 667, 667, 722, 722, 667, 611, 778, 722, 278,
+    500, 667, 556, 833, 722, 778, 667, 778, 722, 667, 611, 722, 667, 944,
+    667, 667, 611, 278, 278, 278, 469, 556, 333, 556, 556, 500, 556, 556,
+    278, 556, 556, 222, 222, 500, 222, 833, 556, 556, 556, 556, 333, 500,
+    278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]))
+DEFAULT_WIDTH = 500
+
+ENCODINGS = {
+    '/WinAnsiEncoding': 'cp1252',
+    '/MacRomanEncoding': 'mac_roman',
+}
+
+# glyph names commonly found in Differences arrays, beyond the single
+# letter names and uniXXXX
+GLYPH_NAMES = {
+    'space': ' ', 'exclam': '!', 'quotedbl': '"', 'numbersign': '#',
+    'dollar': '$', 'percent': '%', 'ampersand': '&', 'quotesingle': "'",
+    'quoteright': '’', 'quoteleft': '‘', 'parenleft': '(',
+    'parenright': ')', 'asterisk': '*', 'plus': '+', 'comma': ',',
+    'hyphen': '-', 'period': '.', 'slash': '/', 'colon': ':',
+    'semicolon': ';', 'less': '<', 'equal': '=', 'greater': '>',
+    'question': '?', 'at': '@', 'bracketleft': '[', 'backslash': '\\',
+    'bracketright': ']', 'underscore': '_', 'bar': '|', 'braceleft': '{',
+    'braceright': '}', 'zero': '0', 'one': '1', 'two': '2', 'three': '3',
+    'four': '4', 'five': '5', 'six': '6', 'seven': '7', 'eight': '8',
+    'nine': '9', 'endash': '–', 'emdash': '—', 'copyright': '©',
+    'bullet': '•', 'quotedblleft': '“', 'quotedblright': '”',
+    'numbersign.alt': '#', 'sharp': '♯', 'flat': '♭', 'fi': 'fi',
+    'fl': 'fl', 'degree': '°', 'oslash': 'ø',
+}
+
+# a gap wider than this fraction of the font size is a space
+SPACE_GAP = 0.15
+# the width of a space, as a fraction of the font size, when turning gaps
+# into runs of spaces
+SPACE_WIDTH = 0.28
+# glyphs within this fraction of the font size of a line's baseline are on
+# the line, which keeps superscripts with their chords
+BASELINE = 0.5
+# a gap between lines of more than this many font sizes is a blank line
+BLANK_LINE = 1.8
+
+IDENTITY = (1, 0, 0, 1, 0, 0)
+
+# how deeply form xobjects may draw each other
+MAX_DEPTH = 8
+
+
+def multiply(m, n):
+    a, b, c, d, e, f = m
+    p, q, r, s, t, u = n
+    return (
+        a * p + b * r, a * q + b * s,
+        c * p + d * r, c * q + d * s,
+        e * p + f * r + t, e * q + f * s + u,
+    )
+
+
+def stream_bytes(obj):
+    """The decoded contents of a pdfrw stream object."""
+    from pdfrw.uncompress import uncompress
+    if obj.Filter is not None:
+        uncompress([obj], leave_raw=True)
+        if obj.Filter is not None:
+            raise PdfTextError(
+                'cannot decode {} streams'.format(obj.Filter))
+    stream = obj.stream or b''
+    if isinstance(stream, str):
+        stream = stream.encode('latin-1')
+    return stream
+
+
+def utf16(digits):
+    data = bytes.fromhex(re.sub(rb'\s', b'', digits).decode('ascii'))
+    return data.decode('utf-16-be', 'replace')
+
+
+def hex_code(digits):
+    return int(re.sub(rb'\s', b'', digits) or b'0', 16)
+
+
+def parse_cmap(data):
+    """The code to text mapping of a ToUnicode CMap."""
+    mapping = {}
+    for block in RE.BFCHAR.findall(data):
+        for code, text in RE.HEX_PAIR.findall(block):
+            mapping[hex_code(code)] = utf16(text)
+    for block in RE.BFRANGE.findall(data):
+        for start, end, text, texts in RE.HEX_RANGE.findall(block):
+            start, end = hex_code(start), hex_code(end)
+            if texts:
+                for code, each in zip(
+                        range(start, end + 1), RE.HEX.findall(texts)):
+                    mapping[code] = utf16(each)
+            else:
+                # the last character is incremented along the range
+                first = utf16(text)
+                for code in range(start, end + 1):
+                    mapping[code] = first[:-1] + chr(
+                        ord(first[-1:] or '\0') + code - start)
+    return mapping
+
+
+def glyph_text(name):
+    name = name.lstrip('/')
+    if len(name) == 1:
+        return name
+    if name.startswith('uni') and len(name) == 7:
+        try:
+            return chr(int(name[3:], 16))
+        except ValueError:
+            pass
+    return GLYPH_NAMES.get(name.split('.')[0], '')
+
+
+class Font:
+    """A font's widths and encoding, enough to place and read its glyphs."""
+
+    def __init__(self, font):
+        self.two_byte = font.Subtype == '/Type0'
+        self.widths = {}
+        self.space = None
+        base = str(font.BaseFont or '')
+        if self.two_byte:
+            descendant = (font.DescendantFonts or [None])[0]
+            self.default_width = float(descendant and descendant.DW or 1000)
+            self.read_cid_widths(descendant and descendant.W or [])
+        else:
+            first = int(font.FirstChar or 0)
+            for code, width in enumerate(font.Widths or (), first):
+                self.widths[code] = float(width)
+            descriptor = font.FontDescriptor
+            missing = descriptor and descriptor.MissingWidth
+            if font.Widths is None and 'Courier' in base:
+                self.default_width = 600
+            elif font.Widths is None and (
+                    'Helvetica' in base or 'Arial' in base):
+                self.widths = dict(HELVETICA_WIDTHS)
+                self.default_width = DEFAULT_WIDTH
+            else:
+                self.default_width = float(missing or DEFAULT_WIDTH)
+            if font.Subtype == '/Type3' and font.FontMatrix:
+                scale = float(font.FontMatrix[0]) * 1000
+                self.widths = {
+                    code: width * scale
+                    for code, width in self.widths.items()}
+            self.space = 32
+
+        self.text = {}
+        if font.ToUnicode is not None:
+            self.text = parse_cmap(stream_bytes(font.ToUnicode))
+        self.codec = 'latin-1'
+        encoding = font.Encoding
+        if encoding is not None and not self.two_byte:
+            if hasattr(encoding, 'keys'):
+                self.codec = ENCODINGS.get(
+                    encoding.BaseEncoding, self.codec)
+                self.read_differences(encoding.Differences or ())
+            else:
+                self.codec = ENCODINGS.get(encoding, self.codec)
+
+    def read_cid_widths(self, widths):
+        # [first [w1 w2 ...]] or [first last w]
+        widths = list(widths)
+        i = 0
+        while i + 1 < len(widths):
+            first = int(widths[i])
+            if isinstance(widths[i + 1], list):
+                for code, width in enumerate(widths[i + 1], first):
+                    self.widths[code] = float(width)
+                i += 2
+            else:
+                last = int(widths[i + 1])
+                for code in range(first, last + 1):
+                    self.widths[code] = float(widths[i + 2])
+                i += 3
+
+    def read_differences(self, differences):
+        code = 0
+        for item in differences:
+            if str(item).startswith('/'):
+                text = glyph_text(str(item))
+                if text and code not in self.text:
+                    self.text[code] = text
+                code += 1
+            else:
+                code = int(item)
+
+    def decode(self, string):
+        """Yield the (code, text, width) of each glyph in string."""
+        if self.two_byte:
+            codes = [
+                string[i] << 8 | string[i + 1]
+                for i in range(0, len(string) - 1, 2)]
+        else:
+            codes = string
+        for code in codes:
+            text = self.text.get(code)
+            if text is None:
+                text = '' if self.two_byte else bytes(
+                    [code]).decode(self.codec, 'replace')
+            yield code, text, self.widths.get(code, self.default_width)
+
+
+class Interpreter:
+    """Runs a page's content stream, collecting positioned glyphs.
+
+    Each glyph is an (x, y, end, text, size) tuple in page space.
+    """
+
+    def __init__(self, fonts=None):
+        self.glyphs = []
+        self.fonts = {} if fonts is None else fonts
+        self.ctm = IDENTITY
+        self.tm = self.tlm = IDENTITY
+        self.font = None
+        self.size = 1
+        # character and word spacing, horizontal scale, leading and rise
+        self.tc = self.tw = self.tl = self.rise = 0
+        self.th = 1
+        self.stack = []
+
+    def get_font(self, resources, name):
+        fonts = resources and resources.Font
+        font = fonts and fonts[name]
+        if font is None:
+            return None
+        key = id(font)
+        if key not in self.fonts:
+            self.fonts[key] = Font(font)
+        return self.fonts[key]
+
+    def run(self, resources, stream, depth=0):
+        operands = []
+        pos = 0
+        while True:
+            match = RE.TOKEN.match(stream, pos)
+            if not match or match.end() == pos:
+                break
+            pos = match.end()
+            number = match.group('number')
+            if number is not None:
+                operands.append(float(number))
+                continue
+            if match.group('name') is not None:
+                operands.append(match.group('name')[1:].decode('latin-1'))
+                continue
+            operator = match.group('operator')
+            if operator is None:
+                other = match.group('other')
+                if other in (b'(', b'<', b'['):
+                    parser = pdfmeta.Parser(stream, match.start('other'))
+                    operands.append(parser.parse())
+                    pos = parser.pos
+                continue
+            if operator == b'BI':
+                # skip inline images, whose data may look like anything
+                end = RE.INLINE_IMAGE_END.search(stream, pos)
+                pos = end.end() if end else len(stream)
+            else:
+                self.do(operator, operands, resources, depth)
+            operands = []
+
+    def do(self, operator, operands, resources, depth):
+        if operator == b'Tj' or operator == b'TJ':
+            self.show(operands[-1] if operands else b'')
+        elif operator == b'Td' or operator == b'TD':
+            tx, ty = operands[-2:]
+            if operator == b'TD':
+                self.tl = -ty
+            self.tm = self.tlm = multiply((1, 0, 0, 1, tx, ty), self.tlm)
+        elif operator == b'Tm':
+            self.tm = self.tlm = tuple(operands[-6:])
+        elif operator == b'T*':
+            self.next_line()
+        elif operator == b"'":
+            self.next_line()
+            self.show(operands[-1])
+        elif operator == b'"':
+            self.tw, self.tc = operands[-3:-1]
+            self.next_line()
+            self.show(operands[-1])
+        elif operator == b'Tf':
+            self.font = self.get_font(resources, '/' + operands[-2])
+            self.size = operands[-1]
+        elif operator == b'BT':
+            self.tm = self.tlm = IDENTITY
+        elif operator == b'Tc':
+            self.tc = operands[-1]
+        elif operator == b'Tw':
+            self.tw = operands[-1]
+        elif operator == b'Tz':
+            self.th = operands[-1] / 100
+        elif operator == b'TL':
+            self.tl = operands[-1]
+        elif operator == b'Ts':
+            self.rise = operands[-1]
+        elif operator == b'cm':
+            self.ctm = multiply(tuple(operands[-6:]), self.ctm)
+        elif operator == b'q':
+            self.stack.append(self.state())
+        elif operator == b'Q':
+            if self.stack:
+                self.restore(self.stack.pop())
+        elif operator == b'Do' and depth < MAX_DEPTH:
+            self.draw(resources, '/' + operands[-1], depth)
+
+    def state(self):
+        return (self.ctm, self.font, self.size, self.tc, self.tw, self.tl,
+                self.rise, self.th)
+
+    def restore(self, state):
+        (self.ctm, self.font, self.size, self.tc, self.tw, self.tl,
+         self.rise, self.th) = state
+
+    def next_line(self):
+        self.tm = self.tlm = multiply((1, 0, 0, 1, 0, -self.tl), self.tlm)
+
+    def draw(self, resources, name, depth):
+        xobjects = resources and resources.XObject
+        xobject = xobjects and xobjects[name]
+        if xobject is None or xobject.Subtype != '/Form':
+            return
+        saved = self.state(), self.tm, self.tlm
+        matrix = xobject.Matrix
+        if matrix:
+            self.ctm = multiply(tuple(map(float, matrix)), self.ctm)
+        self.run(
+            xobject.Resources or resources, stream_bytes(xobject), depth + 1)
+        state, self.tm, self.tlm = saved
+        self.restore(state)
+
+    def show(self, string):
+        if isinstance(string, list):
+            for item in string:
+                if isinstance(item, bytes):
+                    self.show(item)
+                else:
+                    # adjustments are in thousandths of text space units
+                    self.advance(-float(item) / 1000 * self.size * self.th)
+            return
+        font = self.font
+        if font is None or not isinstance(string, bytes):
+            return
+        size = self.size
+        th = self.th
+        space = font.space
+        # the glyphs are moved along the text matrix's x axis, which is
+        # the rendering matrix's too
+        a, b, c, d, e, f = multiply(self.tm, self.ctm)
+        x0 = e + c * self.rise
+        y0 = f + d * self.rise
+        glyph_size = size * (c * c + d * d) ** 0.5
+        append = self.glyphs.append
+        tx = 0
+        for code, text, width in font.decode(string):
+            advance = width / 1000 * size
+            if text:
+                x = x0 + tx * a
+                append((x, y0 + tx * b, x + advance * th * a, text,
+                        glyph_size))
+            advance += self.tc
+            if code == space:
+                advance += self.tw
+            tx += advance * th
+        self.advance(tx)
+
+    def advance(self, tx):
+        a, b, c, d, e, f = self.tm
+        self.tm = (a, b, c, d, e + tx * a, f + tx * b)
+
+
+def page_glyphs(page, fonts):
+    """The glyphs drawn on a pdfrw page."""
+    contents = page.Contents
+    if contents is None:
+        return []
+    if not isinstance(contents, list):
+        contents = [contents]
+    stream = b'\n'.join(stream_bytes(content) for content in contents)
+    interpreter = Interpreter(fonts)
+    interpreter.run(page.inheritable.Resources, stream)
+    return interpreter.glyphs
+
+
+def group_lines(glyphs):
+    """Group glyphs into lines, top to bottom, each sorted left to right.
+
+    Yields (y, size, glyphs) for each line.
+    """
+    line = []
+    for glyph in sorted(glyphs, key=lambda g: (-g[1], g[0])):
+        if line and abs(glyph[1] - baseline) > BASELINE * max(
+                size, glyph[4]):
+            yield baseline, size, sorted(line)
+            line = []
+        if not line or glyph[4] > size:
+            # the largest glyphs' baseline is the line's
+            baseline = glyph[1]
+            size = glyph[4]
+        line.append(glyph)
+    if line:
+        yield baseline, size, sorted(line)
+
+
+def line_text(glyphs):
+    """The text of a line of glyphs, and the x position of each column."""
+    text = []
+    starts = []
+    end = None
+    for x, y, glyph_end, glyph, size in glyphs:
+        if end is not None:
+            if x - end < -SPACE_GAP * size and text and glyph == text[-1]:
+                # the same glyph overprinted, e.g. for a bold effect
+                continue
+            if (x - end > SPACE_GAP * size and text[-1] != ' '
+                    and glyph != ' '):
+                spaces = max(1, round((x - end) / (SPACE_WIDTH * size)))
+                text.extend(' ' * spaces)
+                starts.extend([end] * spaces)
+        for char in glyph:
+            text.append(char)
+            starts.append(x)
+        end = max(glyph_end, end if end is not None else glyph_end)
+    return ''.join(text), starts
+
+
+def column(starts, x, size):
+    """The column of the character in a line nearest to x."""
+    i = bisect.bisect_left(starts, x)
+    if i == len(starts):
+        if not starts:
+            return 0
+        return len(starts) - 1 + round(
+            (x - starts[-1]) / (SPACE_WIDTH * size))
+    if i and x - starts[i - 1] < starts[i] - x:
+        return i - 1
+    return i
+
+
+def align_chords(chords, chord_starts, lyric_starts, size):
+    """Lay out a chord line so each chord is over the lyric under it."""
+    out = ''
+    for match in re.finditer(r'\S+', chords):
+        col = column(lyric_starts, chord_starts[match.start()], size)
+        if out:
+            col = max(col, len(out) + 1)
+        out = out.ljust(col) + match.group()
+    return out
+
+
+def page_lines(glyphs, is_chord_line):
+    lines = []
+    last_y = None
+    for y, size, line in group_lines(glyphs):
+        text, starts = line_text(line)
+        if not text.strip():
+            continue
+        if last_y is not None and last_y - y > BLANK_LINE * size:
+            lines.append(('', [], y, size))
+        lines.append((text, starts, y, size))
+        last_y = y
+
+    if is_chord_line is not None:
+        for i, (text, starts, y, size) in enumerate(lines[:-1]):
+            lyrics, lyric_starts, _, _ = lines[i + 1]
+            if (lyrics and is_chord_line(text)
+                    and not is_chord_line(lyrics)):
+                lines[i] = (
+                    align_chords(text, starts, lyric_starts, size),
+                    starts, y, size)
+    return [line[0].rstrip() for line in lines]
+
+
+def extract_text(data, is_chord_line=None):
+    """Extract the text of the pdf in data, laid out like pdftotext's.
+
+    is_chord_line, if given, is called with the text of a line to tell if
+    it is a line of chords, which are aligned to the lyric line under them.
+    Raises PdfTextError if the pdf cannot be read.
+    """
+    from pdfrw import PdfReader
+    from pdfrw.errors import PdfParseError
+    try:
+        reader = PdfReader(fdata=data)
+        fonts = {}
+        lines = []
+        for page in reader.pages:
+            lines.extend(page_lines(page_glyphs(page, fonts), is_chord_line))
+    except (PdfParseError, pdfmeta.PdfMetaError, ValueError, TypeError,
+            IndexError, KeyError, AttributeError) as e:
+        raise PdfTextError(str(e)) from e
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,85 @@
+"""Profile each song's parse, and aggregate the hotspots across a set.
+
+Each song is parsed under its own cProfile, so a slow function can be
+traced back to the song that triggered it. Every song's stats, and the
+combined stats for the set, are written as .pstats files, which can be
+loaded into snakeviz or pstats.
+"""
+import io
+import re
+
+# cProfile and pstats are only imported when profiling, to keep them out of
+# every build's startup
+
+
+directory = None
+songs = []
+
+
+def enable(path):
+    """Profile every song parsed from now on, writing stats to path."""
+    global directory
+    directory = path
+    directory.mkdir(parents=True, exist_ok=True)
+    songs.clear()
+
+
+def disable():
+    global directory
+    directory = None
+
+
+def run(name, function, *args):
+    """Call function(*args), profiling it as the song name if enabled."""
+    if directory is None:
+        return function(*args)
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args)
+    finally:
+        path = directory / (safe_name(name) + '.pstats')
+        profiler.dump_stats(str(path))
+        songs.append((name, path))
+
+
+def safe_name(name):
+    return re.sub(r'[^\w.-]+', '_', name) or 'song'
+
+
+def hotspot(stats):
+    """The function with the most self time in stats, and that time."""
+    import pstats
+    function, (_, _, tottime, _, _) = max(
+        stats.stats.items(), key=lambda item: item[1][2])
+    return pstats.func_std_string(function), tottime
+
+
+def report(limit=15, out=None):
+    """Print each song's time and hotspot, then the set's top functions by
+    cumulative and self time. Returns the path of the set's stats."""
+    import pstats
+    if not songs:
+        return None
+    stream = io.StringIO()
+    combined = pstats.Stats(*(str(path) for _, path in songs), stream=stream)
+    path = directory / 'set.pstats'
+    combined.dump_stats(str(path))
+
+    print('{:>9}  {:<30} {}'.format('time', 'song', 'hotspot'), file=out)
+    timed = []
+    for name, song_path in songs:
+        stats = pstats.Stats(str(song_path)).strip_dirs()
+        timed.append((stats.total_tt, name, hotspot(stats)))
+    for total, name, (function, tottime) in sorted(timed, reverse=True):
+        print('{:>7.1f}ms  {:<30} {} ({:.1f}ms)'.format(
+            total * 1000, name, function, tottime * 1000), file=out)
+
+    combined.strip_dirs()
+    # rather than listing every song's file above the stats
+    combined.files = []
+    for order in ('cumulative', 'tottime'):
+        combined.sort_stats(order).print_stats(limit)
+    print(stream.getvalue(), file=out)
+    print('wrote profiles to {}'.format(directory), file=out)
+    return path
@@ -0,0 +1,50 @@
+"""Render a setlist into the html template.
+
+The template is split at its markers once, and the setlist json and the pdf
+assets container are streamed straight into the output file, so we only
+ever hold one of the (possibly very large) embedded pdfs in memory,
+decoded and compressed.
+"""
+import html
+import json
+import re
+
+import assets
+
+
+MARKERS = re.compile(r'(SETLIST|PDFDATA|TITLE)')
+SEPARATORS = (',', ':')
+
+
+def split_template(template):
+    """Split template into a list of alternating text and marker names."""
+    return MARKERS.split(template)
+
+
+def write_pdfdata(fp, pdfs):
+    """Pack (song_id, pdf bytes) pairs into an assets container json,
+    writing its data as it is encoded, then its table of contents."""
+    toc = {}
+    fp.write('{"codec":')
+    fp.write(json.dumps(assets.CODEC))
+    # base64 never needs escaping in json
+    fp.write(',"data":"')
+    for chunk in assets.pack(pdfs, toc):
+        fp.write(chunk)
+    fp.write('","toc":')
+    json.dump(toc, fp, separators=SEPARATORS)
+    fp.write('}')
+
+
+def render(parts, path, setlist, pdfs):
+    """Render the split template parts to path."""
+    with open(path, 'w') as fp:
+        for i, part in enumerate(parts):
+            if i % 2 == 0:
+                fp.write(part)
+            elif part == 'SETLIST':
+                json.dump(setlist, fp, separators=SEPARATORS)
+            elif part == 'PDFDATA':
+                write_pdfdata(fp, pdfs)
+            elif part == 'TITLE':
+                fp.write(html.escape(setlist['title'] or ''))
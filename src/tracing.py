@@ -0,0 +1,89 @@
+"""Opt-in tracing of build stages, written in Chrome's trace event format.
+
+Wrap a stage in a span, with any attributes worth recording:
+
+    with tracing.span('pdftotext', bytes=len(data)) as span:
+        ...
+        span.set(lines=len(lines))
+
+When tracing is off, span() returns a shared no-op span, so the cost is a
+function call. Load the output of write() in chrome://tracing or Perfetto.
+"""
+import json
+import os
+import threading
+import time
+
+
+enabled = False
+events = []
+
+
+class Span:
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.attrs['error'] = repr(exc)
+        events.append({
+            'name': self.name,
+            'ph': 'X',
+            'ts': self.start / 1000,
+            'dur': (end - self.start) / 1000,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': self.attrs,
+        })
+
+
+class NullSpan:
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+def span(name, **attrs):
+    """A context manager timing the stage name, if tracing is enabled."""
+    if not enabled:
+        return NULL_SPAN
+    return Span(name, attrs)
+
+
+def enable():
+    global enabled
+    enabled = True
+    events.clear()
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def write(path):
+    """Write the recorded spans to path as Chrome trace event JSON."""
+    with open(path, 'w') as fp:
+        json.dump({
+            'traceEvents': events,
+            'displayTimeUnit': 'ms',
+        }, fp, default=str)
@@ -0,0 +1,151 @@
+"""Precompute each song's chords in all 12 keys.
+
+Every distinct chord in a song is transposed once into each key, spelt with
+that key's sharps or flats, so changing key, or playing with a capo, on the
+tablet is a table lookup rather than rewriting every chord. A capo on fret
+N in key K uses the chord shapes of the key N semitones below K.
+"""
+import functools
+import itertools
+import re
+
+import keys
+import parse
+
+
+# the key names used for each pitch class, as in keys.KEYS
+MAJOR_KEYS = keys.MAJOR_KEYS
+MINOR_KEYS = keys.MINOR_KEYS
+SHARPS = 'C C# D D# E F F# G G# A A# B'.split()
+FLATS = 'C Db D Eb E F Gb G Ab A Bb B'.split()
+# C has neither, so uses the usual borrowed chords, e.g. Bb and D/F#
+NATURALS = 'C C# D Eb E F F# G Ab A Bb B'.split()
+CHORD = re.compile(r'\[(.*?)\]')
+# the tonic of a key, which may be written freely, e.g. G major, Bb (Capo 1)
+# or G/B
+KEY = re.compile(r'([A-G][#b♯♭]?)(m)?(?!\w)')
+
+
+def key_spelling(key):
+    """The name of each pitch class in the major key.
+
+    Notes of the key's chords in parse.KEY_CHORDS are spelt as they are
+    there, and other notes with sharps in sharp keys and flats in flat keys.
+    """
+    roots = [chord.rstrip('m') for chord in parse.KEY_CHORDS[key].split()]
+    accidentals = {root[1:] for root in roots if root[1:]}
+    if 'b' in accidentals:
+        names = list(FLATS)
+    elif '#' in accidentals:
+        names = list(SHARPS)
+    else:
+        names = list(NATURALS)
+    for root in roots:
+        names[keys.pitch_class(root)] = root
+    return names
+
+
+SPELLINGS = {key: key_spelling(key) for key in MAJOR_KEYS}
+
+
+def parse_key(key):
+    """The pitch class of key's tonic, and whether it is minor, or None if
+    it is not a key."""
+    match = KEY.match(key.strip()) if key else None
+    if not match:
+        return None, False
+    return keys.pitch_class(match.group(1)), bool(match.group(2))
+
+
+@functools.lru_cache(maxsize=parse.CHORD_CACHE_SIZE)
+def transpose_chord(chord, semitones, key):
+    """Transpose the chord name by semitones, spelt for the major key.
+
+    Anything that is not a chord, or has no recognised root, is returned
+    unchanged.
+    """
+    parts = parse.classify_chord(chord)
+    root = parts and keys.pitch_class(parts.note)
+    if root is None:
+        return chord
+    names = SPELLINGS[key]
+    rest = ''.join(
+        value for name, value in parts._asdict().items()
+        if value and name not in ('note', 'bass'))
+    transposed = names[(root + semitones) % 12] + rest
+    bass = keys.pitch_class(parts.bass and parts.bass[1:])
+    if bass is not None:
+        transposed += '/' + names[(bass + semitones) % 12]
+    elif parts.bass:
+        transposed += parts.bass
+    return transposed
+
+
+def unique_chords(song):
+    """The distinct chords in song's sections, in order of appearance."""
+    text = '\n'.join(song['sections'].values())
+    return list(dict.fromkeys(CHORD.findall(text)))
+
+
+@functools.lru_cache(maxsize=24)
+def other_keys(tonic, minor):
+    """The names and spellings of the 11 other keys, from the key whose
+    tonic is the pitch class tonic."""
+    result = []
+    for semitones in range(1, 12):
+        pitch_class = (tonic + semitones) % 12
+        if minor:
+            # spelt as the relative major
+            spelling = MAJOR_KEYS[(pitch_class + 3) % 12]
+            result.append((MINOR_KEYS[pitch_class], spelling))
+        else:
+            result.append((MAJOR_KEYS[pitch_class], MAJOR_KEYS[pitch_class]))
+    return result
+
+
+@functools.lru_cache(maxsize=parse.CHORD_CACHE_SIZE)
+def transposed_chord(chord, tonic, minor):
+    """The chord in each of the other_keys(tonic, minor)."""
+    return tuple(
+        transpose_chord(chord, semitones, spelling)
+        for semitones, (_, spelling) in enumerate(
+            other_keys(tonic, minor), 1))
+
+
+def transpositions(song):
+    """A table of the song's distinct chords in every key.
+
+    Maps each key name to the chords in that key, in the same order, with
+    the song's own key first and its chords as written. Returns None if
+    the song has no key.
+    """
+    tonic, minor = parse_key(song['key'])
+    if tonic is None:
+        return None
+    chords = unique_chords(song)
+    table = {song['key']: chords}
+    # each chord is transposed into every key at once, and cached, as the
+    # same chords in the same keys turn up in most songs
+    rows = zip(*(transposed_chord(chord, tonic, minor) for chord in chords))
+    for (name, _), row in itertools.zip_longest(
+            other_keys(tonic, minor), rows, fillvalue=()):
+        table[name] = list(row)
+    return table
+
+
+def transposition_tables(songs):
+    """Each song's table of chords in every key, or None if it has no key,
+    or one that cannot be parsed."""
+    return [transpositions(song) for song in songs]
+
+
+def add_transpositions(songs):
+    """Add each song's table of chords in every key, if it has a key."""
+    songs = list(songs)
+    set_transpositions(songs, transposition_tables(songs))
+
+
+def set_transpositions(songs, tables):
+    for song, table in zip(songs, tables):
+        if table:
+            song['transpositions'] = table
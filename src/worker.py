@@ -0,0 +1,300 @@
+"""A long running worker, building sets as emails arrive.
+
+Raw emails are dropped into a spool directory, standing in for SES and S3,
+and moved into a durable SQLite queue. A pool of worker processes, which
+import and compile everything once at startup, builds each into a staging
+directory, which is then swapped into the output directory. Failed builds
+are retried with exponential backoff.
+
+Run with --stats to see the queue depth and recent job latencies.
+"""
+import argparse
+import concurrent.futures
+import importlib
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import sqlite3
+import time
+
+import batch
+import build
+
+
+logger = logging.getLogger('setalight.worker')
+
+parser = argparse.ArgumentParser()
+parser.add_argument('queue', type=Path, help='SQLite database of jobs')
+parser.add_argument('output', type=Path,
+                    help='directory to publish each set in')
+parser.add_argument(
+    '--spool', type=Path, default=None,
+    help='directory to take new .eml files from (default: OUTPUT/.spool)',
+)
+parser.add_argument(
+    '--jobs', '-j', type=int, default=os.cpu_count(),
+    help='number of worker processes (default: number of cpus)',
+)
+parser.add_argument(
+    '--retries', type=int, default=3,
+    help='times to retry a failed build before giving up',
+)
+parser.add_argument(
+    '--backoff', type=float, default=5.0,
+    help='seconds before the first retry, doubling each time',
+)
+parser.add_argument(
+    '--poll', type=float, default=0.5,
+    help='seconds between checking the spool directory',
+)
+parser.add_argument(
+    '--once', default=False, action='store_true',
+    help='exit once the queue is empty, rather than waiting for more',
+)
+parser.add_argument(
+    '--stats', default=False, action='store_true',
+    help='print queue depth and job latencies, then exit',
+)
+parser.add_argument(
+    'options', nargs=argparse.REMAINDER,
+    help='options passed to build for each set, e.g. --template',
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    data BLOB NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    enqueued REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    seconds REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, not_before);
+"""
+
+# modules parse imports lazily, which workers should load up front
+PRELOAD = ['chardet', 'keys', 'pdfmeta', 'pdfrw', 'pdftitle']
+
+# how many recently finished jobs to report latencies for
+RECENT = 100
+
+
+class Queue:
+    """A durable queue of raw emails to build."""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(str(path), isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def put(self, name, data):
+        cursor = self.db.execute(
+            'INSERT INTO jobs (name, data, enqueued) VALUES (?, ?, ?)',
+            (name, data, time.time()))
+        return cursor.lastrowid
+
+    def recover(self):
+        """Requeue jobs left running by a worker that died."""
+        self.db.execute(
+            "UPDATE jobs SET state = 'queued' WHERE state = 'running'")
+
+    def claim(self):
+        """Mark the next due job as running, returning (id, name, data)."""
+        now = time.time()
+        with self.db:
+            self.db.execute('BEGIN IMMEDIATE')
+            job = self.db.execute(
+                "SELECT id, name, data FROM jobs"
+                " WHERE state = 'queued' AND not_before <= ?"
+                " ORDER BY not_before, id LIMIT 1", (now,)).fetchone()
+            if job:
+                self.db.execute(
+                    "UPDATE jobs SET state = 'running', started = ?,"
+                    " attempts = attempts + 1 WHERE id = ?", (now, job[0]))
+        return job
+
+    def finish(self, id, seconds):
+        self.db.execute(
+            "UPDATE jobs SET state = 'done', finished = ?, seconds = ?,"
+            " error = NULL, data = x'' WHERE id = ?",
+            (time.time(), seconds, id))
+
+    def fail(self, id, error, retries, backoff):
+        """Requeue a failed job after a backoff, unless out of retries.
+
+        Returns the delay before the retry, or None if it has failed.
+        """
+        attempts, = self.db.execute(
+            'SELECT attempts FROM jobs WHERE id = ?', (id,)).fetchone()
+        if attempts > retries:
+            self.db.execute(
+                "UPDATE jobs SET state = 'failed', finished = ?, error = ?"
+                " WHERE id = ?", (time.time(), error, id))
+            return None
+        delay = backoff * 2 ** (attempts - 1)
+        self.db.execute(
+            "UPDATE jobs SET state = 'queued', not_before = ?, error = ?"
+            " WHERE id = ?", (time.time() + delay, error, id))
+        return delay
+
+    def depth(self):
+        return self.db.execute(
+            "SELECT count(*) FROM jobs WHERE state IN ('queued', 'running')"
+        ).fetchone()[0]
+
+    def stats(self):
+        counts = dict(self.db.execute(
+            'SELECT state, count(*) FROM jobs GROUP BY state'))
+        recent = self.db.execute(
+            "SELECT finished - enqueued, seconds FROM jobs"
+            " WHERE state = 'done' ORDER BY finished DESC LIMIT ?",
+            (RECENT,)).fetchall()
+        return {
+            'depth': counts.get('queued', 0) + counts.get('running', 0),
+            'states': counts,
+            'latency': percentiles([latency for latency, _ in recent]),
+            'build': percentiles([seconds for _, seconds in recent]),
+        }
+
+
+def percentiles(values):
+    """The median, 95th percentile and max of values, in seconds."""
+    if not values:
+        return None
+    values = sorted(values)
+
+    def at(fraction):
+        return round(values[min(len(values) - 1,
+                                int(fraction * len(values)))], 3)
+
+    return {'p50': at(0.5), 'p95': at(0.95), 'max': round(values[-1], 3)}
+
+
+def spool(queue, spool_dir):
+    """Move any emails in spool_dir into the queue."""
+    for path in sorted(spool_dir.glob('*.eml')):
+        data = path.read_bytes()
+        queue.put(batch.message_name(data, path.stem), data)
+        path.unlink()
+        logger.info('queued {}'.format(path.name))
+
+
+def warm():
+    """Exercise the parser once in each worker process, so that the first
+    real set does not pay for any lazy imports or compilation."""
+    for module in PRELOAD:
+        importlib.import_module(module)
+    song = build.parse.parse_bytes('warm.cho', b'Warm\n\n[G]la [C]la [D]la')
+    build.parse.add_inferred_keys([song])
+
+
+def publish(args, job, name):
+    """Swap the staged build of job into the output as name."""
+    staged = args.output / '.staging' / job
+    target = args.output / name
+    old = args.output / '.staging' / (job + '.old')
+    if target.exists():
+        os.replace(str(target), str(old))
+    os.replace(str(staged), str(target))
+    shutil.rmtree(str(old), ignore_errors=True)
+    return target
+
+
+def job_name(id):
+    return 'job-{}'.format(id)
+
+
+def serve(args, queue):
+    """Build queued jobs until stopped, or the queue is empty with --once."""
+    running = {}
+    executor = concurrent.futures.ProcessPoolExecutor(
+        args.jobs, initializer=warm)
+    try:
+        while True:
+            if args.spool.is_dir():
+                spool(queue, args.spool)
+            while len(running) < args.jobs:
+                job = queue.claim()
+                if job is None:
+                    break
+                id, name, data = job
+                future = executor.submit(
+                    batch.build_message, name, data,
+                    args.output / '.staging' / job_name(id), args.options)
+                running[future] = (id, name, time.perf_counter())
+
+            if not running:
+                if args.once and queue.depth() == 0:
+                    return
+                time.sleep(args.poll)
+                continue
+
+            done, _ = concurrent.futures.wait(
+                running, timeout=args.poll,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                id, name, start = running.pop(future)
+                try:
+                    result = future.result()
+                except concurrent.futures.process.BrokenProcessPool:
+                    result = {'error': 'worker process died'}
+                    broken = True
+                finish_job(args, queue, id, name, result,
+                           time.perf_counter() - start)
+            if broken:
+                executor.shutdown(wait=False)
+                executor = concurrent.futures.ProcessPoolExecutor(
+                    args.jobs, initializer=warm)
+    finally:
+        executor.shutdown()
+
+
+def finish_job(args, queue, id, name, result, seconds):
+    if result['error'] is None:
+        target = publish(args, job_name(id), name)
+        queue.finish(id, seconds)
+        logger.info('built {} into {} in {:.0f}ms, {} queued'.format(
+            name, target, seconds * 1000, queue.depth()))
+        return
+    shutil.rmtree(
+        str(args.output / '.staging' / job_name(id)), ignore_errors=True)
+    delay = queue.fail(id, result['error'], args.retries, args.backoff)
+    if delay is None:
+        logger.error('{} failed: {}'.format(name, result['error']))
+    else:
+        logger.warning('{} failed, retrying in {:.0f}s: {}'.format(
+            name, delay, result['error']))
+
+
+def main(args):
+    if args.spool is None:
+        args.spool = args.output / '.spool'
+    queue = Queue(args.queue)
+    try:
+        if args.stats:
+            print(json.dumps(queue.stats(), indent=4))
+            return
+        args.options = batch.shared_cache(args.options, args.output)
+        args.spool.mkdir(parents=True, exist_ok=True)
+        (args.output / '.staging').mkdir(parents=True, exist_ok=True)
+        queue.recover()
+        serve(args, queue)
+    finally:
+        queue.close()
+
+
+if __name__ == '__main__':
+    build.logger.setLevel(logging.INFO)
+    logger.setLevel(logging.INFO)
+    main(parser.parse_args())
@@ -0,0 +1,60 @@
+import base64
+
+import assets
+
+
+def test_pack_roundtrip():
+    pdfs = {
+        'one': b'%PDF-1.4 one' * 100,
+        'two': b'%PDF-1.4 two',
+        'three': b'%PDF-1.4 three, a different length',
+    }
+    container = assets.container(pdfs.items())
+
+    assert container['codec'] == 'deflate'
+    for song_id, pdf in pdfs.items():
+        assert assets.unpack(container, song_id) == pdf
+
+
+def test_pack_entries_decode_independently():
+    container = assets.container({'a': b'a' * 7, 'b': b'b' * 11}.items())
+    for offset, length, size in container['toc'].values():
+        assert offset % 4 == 0
+        assert length % 4 == 0
+        chunk = container['data'][offset:offset + length]
+        assert len(base64.b64decode(chunk)) >= size
+
+
+def test_pack_deduplicates():
+    pdf = b'%PDF-1.4 same song attached twice' * 10
+    container = assets.container([('pdf', pdf), ('copy', pdf)])
+
+    assert container['toc']['pdf'] == container['toc']['copy']
+    assert len(container['data']) == container['toc']['pdf'][1]
+
+
+def test_pack_one_pdf_at_a_time():
+    toc = {}
+    read = []
+
+    def pdfs():
+        for song_id in 'ab':
+            read.append(song_id)
+            yield song_id, song_id.encode('ascii') * 1000
+
+    chunks = assets.pack(pdfs(), toc)
+    next(chunks)
+    assert read == ['a']
+    list(chunks)
+    assert read == ['a', 'b']
+    assert list(toc) == ['a', 'b']
+
+
+def test_pack_in_chunks(monkeypatch):
+    pdfs = {'a': bytes(range(256)) * 40, 'b': b'%PDF-1.4 b'}
+    data = ''.join(assets.pack(pdfs.items(), {}))
+    monkeypatch.setattr(assets, 'CHUNK_SIZE', 9)
+    chunks = list(assets.pack(pdfs.items(), {}))
+    assert len(chunks) > 2
+    assert max(map(len, chunks)) == 12
+    assert ''.join(chunks) == data
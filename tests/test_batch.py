@@ -0,0 +1,85 @@
+import argparse
+from email.message import EmailMessage
+import mailbox
+
+import pytest
+
+import batch
+from test_build import AMAZING_GRACE, HOW_GREAT
+
+
+def make_message(message_id, songs):
+    msg = EmailMessage()
+    msg['Subject'] = 'Sunday {}'.format(message_id)
+    msg['From'] = 'leader@example.com'
+    if message_id:
+        msg['Message-Id'] = message_id
+    msg.set_content('See attached')
+    for filename, text in songs:
+        msg.add_attachment(
+            text.encode('utf8'), maintype='text', subtype='plain',
+            filename=filename)
+    return msg
+
+
+MESSAGES = [
+    ('<one@example.com>', [('amazing-grace.cho', AMAZING_GRACE)]),
+    ('<two@example.com>', [
+        ('amazing-grace.cho', AMAZING_GRACE), ('how-great.txt', HOW_GREAT),
+    ]),
+    ('<empty@example.com>', []),
+    (None, [('how-great.txt', HOW_GREAT)]),
+]
+
+
+@pytest.fixture(params=['mbox', 'maildir'])
+def archive(request, tmp_path):
+    if request.param == 'mbox':
+        path = tmp_path / 'sets.mbox'
+        box = mailbox.mbox(str(path))
+    else:
+        path = tmp_path / 'sets'
+        box = mailbox.Maildir(str(path))
+    for message_id, songs in MESSAGES:
+        box.add(make_message(message_id, songs))
+    box.close()
+    return path
+
+
+def make_args(archive, output, jobs=1):
+    return argparse.Namespace(
+        archive=archive, output=output, jobs=jobs, options=['--debug'])
+
+
+def test_set_name():
+    assert batch.set_name('<abc.123@mail.example.com>', 7) == \
+        'abc.123@mail.example.com'
+    assert batch.set_name('<../../etc/passwd>', 7) == 'etc_passwd'
+    assert batch.set_name(None, 7) == 'message-7'
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_build_archive(archive, tmp_path, jobs):
+    output = tmp_path / 'out'
+    results = batch.build_archive(make_args(archive, output, jobs))
+
+    results = {result['name']: result for result in results}
+    assert len(results) == 4
+    assert results['one@example.com']['songs'] == 1
+    assert results['two@example.com']['songs'] == 2
+    assert results['empty@example.com']['error'] == \
+        'Could not find any songs'
+    [unnamed] = [name for name in results if name.startswith('message-')]
+    assert results[unnamed]['songs'] == 1
+    assert (output / 'two@example.com' / 'how-great.txt').exists()
+
+
+def test_main_summary(archive, tmp_path, capsys):
+    args = make_args(archive, tmp_path / 'out')
+    assert batch.main(args) == 1
+
+    out = capsys.readouterr().out
+    assert 'two@example.com  2 songs' in out
+    assert 'empty@example.com  FAILED: Could not find any songs' in out
+    assert out.splitlines()[-1].startswith('built 3 sets, 1 failed, in ')
+    assert (tmp_path / 'out' / '.cache').is_dir()
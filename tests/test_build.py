@@ -0,0 +1,271 @@
+import argparse
+import asyncio
+import json
+from email.message import EmailMessage
+
+import pytest
+
+import build
+
+
+AMAZING_GRACE = """\
+Amazing Grace
+John Newton
+Key - G
+
+Verse 1
+[G]Amazing grace how [C]sweet the [G]sound
+That saved a wretch like [D]me
+
+Chorus
+[G]My chains are [Em]gone
+"""
+
+HOW_GREAT = """\
+{title: How Great Thou Art}
+{key: A}
+
+{comment: Verse 1}
+[A]O Lord my God, when [D]I in awesome [A]wonder
+"""
+
+
+@pytest.fixture
+def song_dir(tmp_path):
+    input_dir = tmp_path / 'input'
+    input_dir.mkdir()
+    (input_dir / '1-amazing-grace.cho').write_text(AMAZING_GRACE)
+    (input_dir / '2-how-great.txt').write_text(HOW_GREAT)
+    (input_dir / 'notes.docx').write_bytes(b'ignored')
+    return input_dir
+
+
+def make_args(input_dir, build_dir, **kwargs):
+    args = dict(
+        input=input_dir, build=build_dir, debug=False, jobs=0,
+        in_memory=False, use_cache=False, cache=None, use_manifest=False,
+        profile=False,
+    )
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+def test_load_songs_async_matches_serial(song_dir, tmp_path):
+    serial_args = make_args(song_dir, tmp_path / 'serial')
+    serial_args.build.mkdir()
+    async_args = make_args(song_dir, tmp_path / 'async', jobs=2)
+    async_args.build.mkdir()
+
+    serial_raw, serial_songs = build.load_songs(serial_args)
+    async_raw, async_songs = asyncio.run(build.load_songs_async(async_args))
+
+    assert [name for name, _ in serial_raw['attachments']] == [
+        '1-amazing-grace.cho', '2-how-great.txt',
+    ]
+    assert async_raw['attachments'] == serial_raw['attachments']
+    assert async_songs == serial_songs
+
+
+# what the stubbed pdftotext converts each pdf to
+PDF_SHEETS = {
+    b'%PDF grace': 'Grace Alone\n\nVerse 1\nG      C\nGrace alone\n',
+    b'%PDF glory': 'Glory\n\nChorus\nD\nGlory to God\n',
+    b'%PDF peace': 'Peace\n\nVerse 1\nA\nPeace be still\n',
+}
+
+
+class FakeProcess:
+    running = 0
+    most = 0
+
+    async def communicate(self, data):
+        FakeProcess.running += 1
+        FakeProcess.most = max(FakeProcess.most, FakeProcess.running)
+        await asyncio.sleep(0.01)
+        FakeProcess.running -= 1
+        return PDF_SHEETS[data].encode('utf8'), None
+
+
+def test_load_songs_async_pdfs(tmp_path, monkeypatch):
+    input_dir = tmp_path / 'input'
+    input_dir.mkdir()
+    for name, data in zip(('a.pdf', 'b.pdf', 'c.pdf'), PDF_SHEETS):
+        (input_dir / name).write_bytes(data)
+
+    def run(command, input, stdout, timeout):
+        return argparse.Namespace(stdout=PDF_SHEETS[input].encode('utf8'))
+
+    async def create_subprocess_exec(*command, stdin, stdout):
+        assert list(command) == build.parse.PDFTOTEXT
+        return FakeProcess()
+
+    parse = build.parse
+    monkeypatch.setattr(parse, 'read_pdf_metadata', lambda song, data: None)
+    monkeypatch.setattr(parse, 'extract_pdf_text', lambda data: None)
+    monkeypatch.setattr(parse.subprocess, 'run', run)
+    monkeypatch.setattr(
+        asyncio, 'create_subprocess_exec', create_subprocess_exec)
+
+    serial_args = make_args(input_dir, tmp_path / 'serial')
+    serial_args.build.mkdir()
+    async_args = make_args(input_dir, tmp_path / 'async', jobs=2)
+    async_args.build.mkdir()
+
+    _, serial_songs = build.load_songs(serial_args)
+    _, async_songs = asyncio.run(build.load_songs_async(async_args))
+
+    assert [list(song['sections']) for song in async_songs] == [
+        ['Verse 1'], ['Chorus'], ['Verse 1'],
+    ]
+    assert async_songs == serial_songs
+    # the conversions overlapped, but no more than jobs at once
+    assert FakeProcess.most == 2
+
+
+def test_load_songs_in_memory(song_dir, tmp_path):
+    args = make_args(song_dir, tmp_path / 'build', in_memory=True)
+    args.build.mkdir()
+
+    raw, songs = build.load_songs(args)
+
+    assert [song['title'] for song in songs] == [
+        'Amazing Grace', 'How Great Thou Art',
+    ]
+    assert list(args.build.iterdir()) == []
+
+
+def test_load_songs_cached(song_dir, tmp_path):
+    args = make_args(song_dir, tmp_path / 'build', use_cache=True)
+    args.build.mkdir()
+    cache = build.get_cache(args)
+
+    _, first = build.load_songs(args, cache)
+    assert (cache.hits, cache.misses) == (0, 2)
+    _, second = build.load_songs(args, cache)
+    assert (cache.hits, cache.misses) == (2, 2)
+    assert second == first
+
+
+def test_load_songs_incremental(song_dir, tmp_path, monkeypatch):
+    args = make_args(song_dir, tmp_path / 'build', use_manifest=True)
+    args.build.mkdir()
+    parsed = []
+    parse_bytes = build.parse.parse_bytes
+
+    def counting_parse_bytes(filename, data):
+        parsed.append(filename)
+        return parse_bytes(filename, data)
+
+    monkeypatch.setattr(build.parse, 'parse_bytes', counting_parse_bytes)
+
+    raw, first = build.load_songs_incremental(args, build.get_manifest(args))
+    assert parsed == ['1-amazing-grace.cho', '2-how-great.txt']
+
+    # nothing changed, nothing parsed, even with a fresh manifest
+    parsed.clear()
+    raw, second = build.load_songs_incremental(args, build.get_manifest(args))
+    assert parsed == []
+    assert second == first
+
+    # a new file is parsed and spliced into the order
+    parsed.clear()
+    (song_dir / '1a-new.cho').write_text('New Song\n\n[A]la la')
+    raw, third = build.load_songs_incremental(args, build.get_manifest(args))
+    assert parsed == ['1a-new.cho']
+    assert [name for name, _ in raw['attachments']] == [
+        '1-amazing-grace.cho', '1a-new.cho', '2-how-great.txt',
+    ]
+    assert third[0] == first[0]
+    assert third[1]['title'] == 'New Song'
+
+
+def test_load_songs_incremental_not_a_song(song_dir, tmp_path, monkeypatch):
+    args = make_args(song_dir, tmp_path / 'build', use_manifest=True)
+    args.build.mkdir()
+    parsed = []
+
+    def not_a_song(filename, data):
+        parsed.append(filename)
+        return None
+
+    monkeypatch.setattr(build.parse, 'parse_bytes', not_a_song)
+
+    _, first = build.load_songs_incremental(args, build.get_manifest(args))
+    assert first == [None, None]
+    assert len(parsed) == 2
+
+    # files that are not songs are not parsed again either
+    parsed.clear()
+    _, second = build.load_songs_incremental(args, build.get_manifest(args))
+    assert second == [None, None]
+    assert parsed == []
+
+
+def test_extract_email_skips_other_attachments(tmp_path, monkeypatch):
+    msg = EmailMessage()
+    msg['Subject'] = 'Sunday'
+    msg['Message-Id'] = '<set@example.com>'
+    msg.set_content('See attached\n\nSent from my phone')
+    msg.add_attachment(
+        AMAZING_GRACE.encode('utf8'), maintype='text', subtype='plain',
+        filename='1-amazing-grace.cho')
+    msg.add_attachment(
+        b'\xff\xd8' * 1000, maintype='image', subtype='jpeg',
+        filename='photo.jpg')
+    msg.add_attachment(
+        b'%PDF-1.4 grace', maintype='application', subtype='pdf',
+        filename='2-grace.pdf')
+    msg.add_attachment(
+        b'PK', maintype='application', subtype='octet-stream',
+        filename='notes.docx')
+    email_path = tmp_path / 'set.eml'
+    email_path.write_bytes(msg.as_bytes())
+    build_dir = tmp_path / 'build'
+    build_dir.mkdir()
+
+    decoded = []
+    decode = build.mime.Part.decode
+
+    def recording_decode(part, tee=None):
+        decoded.append(part.get_filename())
+        return decode(part, tee)
+
+    monkeypatch.setattr(build.mime.Part, 'decode', recording_decode)
+
+    raw = build.extract_email(email_path, build_dir)
+
+    assert raw['id'] == '<set@example.com>'
+    assert raw['subject'] == 'Sunday'
+    assert raw['text'] == ['See attached']
+    assert raw['attachments'] == [
+        ('1-amazing-grace.cho', AMAZING_GRACE.encode('utf8')),
+        ('2-grace.pdf', b'%PDF-1.4 grace'),
+    ]
+    assert decoded == [None, '1-amazing-grace.cho', '2-grace.pdf']
+    assert sorted(p.name for p in build_dir.iterdir()) == [
+        '1-amazing-grace.cho', '2-grace.pdf',
+    ]
+    assert (build_dir / '2-grace.pdf').read_bytes() == b'%PDF-1.4 grace'
+
+
+def test_main_trace(song_dir, tmp_path, capsys):
+    trace_path = tmp_path / 'trace.json'
+    args = build.parser.parse_args([
+        str(song_dir), str(tmp_path / 'build'), '--debug', '--no-cache',
+        '--trace', str(trace_path),
+    ])
+    try:
+        build.main(args)
+    finally:
+        build.tracing.disable()
+        build.tracing.events.clear()
+
+    events = json.loads(trace_path.read_text())['traceEvents']
+    names = [event['name'] for event in events]
+    assert names.count('parse') == 2
+    assert names.count('parse_onsong') == 2
+    assert {'load_songs', 'infer_keys'} <= set(names)
+    parsed = [event['args'] for event in events if event['name'] == 'parse']
+    assert parsed[0]['filename'] == '1-amazing-grace.cho'
+    assert parsed[0]['type'] == 'onsong'
+    assert parsed[1]['song'] == 'How Great Thou Art'
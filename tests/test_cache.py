@@ -0,0 +1,45 @@
+from collections import OrderedDict
+
+import parse
+from cache import ParseCache
+
+
+def make_song():
+    song = parse.new_song()
+    song['title'] = 'Amazing Grace'
+    song['type'] = 'pdf-failed'
+    song['pdf'] = 'JVBERi0xLjQK'
+    song['sections']['VERSE 1'] = '[G]Amazing grace'
+    song['sections']['CHORUS'] = '[C]My chains are gone'
+    return song
+
+
+def test_cache_roundtrip(tmp_path):
+    cache = ParseCache(tmp_path)
+    song = make_song()
+
+    assert cache.get(b'data', '.pdf') is None
+    cache.put(b'data', '.pdf', song)
+    cached = cache.get(b'data', '.pdf')
+
+    assert cached == song
+    assert isinstance(cached['sections'], OrderedDict)
+    assert list(cached['sections']) == ['VERSE 1', 'CHORUS']
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_keyed_by_content_and_type(tmp_path):
+    cache = ParseCache(tmp_path)
+    cache.put(b'data', '.pdf', make_song())
+
+    assert cache.get(b'other', '.pdf') is None
+    assert cache.get(b'data', '.cho') is None
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_cache_invalidated_by_parser_version(tmp_path, monkeypatch):
+    cache = ParseCache(tmp_path)
+    cache.put(b'data', '.pdf', make_song())
+    monkeypatch.setattr(parse, 'VERSION', parse.VERSION + 1)
+
+    assert cache.get(b'data', '.pdf') is None
@@ -0,0 +1,107 @@
+import threading
+
+import pytest
+
+import build
+import deadline
+from test_build import AMAZING_GRACE
+
+
+@pytest.fixture(autouse=True)
+def no_deadline():
+    yield
+    deadline.stop()
+
+
+@pytest.mark.parametrize('text,seconds', [
+    ('10s', 10), ('500ms', 0.5), ('2m', 120), ('1.5', 1.5), (' 3 s ', 3),
+])
+def test_parse_duration(text, seconds):
+    assert deadline.parse_duration(text) == seconds
+
+
+def test_parse_duration_invalid():
+    with pytest.raises(ValueError):
+        deadline.parse_duration('soon')
+
+
+def test_without_deadline_steps_run_at_once():
+    calls = []
+    deadline.defer(calls.append, 'deferred')
+    assert calls == ['deferred']
+    assert deadline.optional('pdftitle', str.upper, 'grace') == 'GRACE'
+    assert deadline.remaining() is None
+    assert deadline.timeout('pdftotext') is None
+
+
+def test_deferred_steps_run_in_order():
+    deadline.start(10)
+    calls = []
+    deadline.defer(calls.append, 1)
+    deadline.defer(calls.append, 2)
+    assert calls == []
+    deadline.run_deferred()
+    assert calls == [1, 2]
+    assert deadline.optional('pdftitle', str.upper, 'grace') == 'GRACE'
+    assert deadline.report() == []
+
+
+def test_optional_step_skipped_when_budget_spent():
+    deadline.start(0)
+    song = {'id': '22025'}
+    assert deadline.optional('pdftitle', str.upper, 'grace', song=song) is None
+    assert deadline.is_degraded(song)
+    assert not deadline.is_degraded({'id': '22025'})
+    assert deadline.report() == [
+        {'step': 'pdftitle', 'song': '22025', 'reason': 'deadline'}]
+
+
+def test_optional_step_timeout(monkeypatch):
+    monkeypatch.setitem(deadline.TIMEOUTS, 'slow', 0.01)
+    release = threading.Event()
+    deadline.start(10)
+    try:
+        assert deadline.optional('slow', release.wait, 5) is None
+    finally:
+        release.set()
+    assert deadline.report() == [
+        {'step': 'slow', 'song': None, 'reason': 'timeout'}]
+
+
+def test_optional_step_errors_are_raised():
+    deadline.start(10)
+    with pytest.raises(ValueError):
+        deadline.optional('pdftitle', int, 'grace')
+
+
+def test_degraded_songs_are_not_cached(tmp_path):
+    cache = build.ParseCache(tmp_path)
+    deadline.start(10)
+    song = build.parse.parse_bytes('grace.cho', b'Grace\n\n[G]la')
+    deadline.skip('pdftitle', song)
+    build.cache_song(cache, b'grace', '.cho', song)
+    assert cache.get(b'grace', '.cho') is None
+
+
+def test_build_records_skipped_steps(tmp_path, capsys):
+    song_dir = tmp_path / 'input'
+    song_dir.mkdir()
+    (song_dir / 'amazing-grace.cho').write_text(AMAZING_GRACE)
+    args = build.parser.parse_args([
+        str(song_dir), str(tmp_path / 'build'), '--debug', '--no-cache',
+        '--deadline', '0s',
+    ])
+    args.build.mkdir()
+    setlist = build.build(args)
+    assert setlist['degraded'] == [
+        {'step': 'infer_keys', 'song': None, 'reason': 'deadline'},
+        {'step': 'transpose', 'song': None, 'reason': 'deadline'},
+    ]
+    # the mandatory steps still ran
+    grace = setlist['songs']['amazing-grace']
+    assert grace['sections'] and 'inferred_key' not in grace
+
+    args.deadline = None
+    setlist = build.build(args)
+    assert 'degraded' not in setlist
+    assert setlist['songs']['amazing-grace']['inferred_key'] == 'G'
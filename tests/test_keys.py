@@ -0,0 +1,58 @@
+import pytest
+
+import keys
+import parse
+
+
+def chords(names):
+    return [parse.classify_chord(n) for n in names.split()]
+
+
+@pytest.mark.parametrize('names,key', [
+    ('G C D Em G D', 'G'),
+    ('A D E F#m A E', 'A'),
+    ('Eb Ab Bb Cm Eb', 'Eb'),
+    ('Am Dm E Am Dm E7 Am', 'Am'),
+    # extended chords count towards their key
+    ('Gmaj7 Cadd9 Dsus4 Em7 G/B', 'G'),
+])
+def test_infer_keys(names, key):
+    [(inferred, confidence)] = keys.infer_keys([chords(names)])
+    assert inferred == key
+    assert 0 < confidence <= 1
+
+
+def test_infer_keys_batch():
+    result = keys.infer_keys([
+        chords('G C D Em'),
+        [],
+        chords('D G A Bm'),
+    ])
+    assert [k for k, _ in result] == ['G', None, 'D']
+    assert result[1] == (None, 0.0)
+
+
+@pytest.mark.parametrize('name,pitch_classes', [
+    ('C', {0, 4, 7}),
+    ('Am', {9, 0, 4}),
+    ('G7', {7, 11, 2, 5}),
+    ('Fmaj7', {5, 9, 0, 4}),
+    ('Dsus4', {2, 7, 9}),
+    ('Bdim', {11, 2, 5}),
+    ('C/E', {0, 4, 7}),
+    ('D/F#', {2, 6, 9}),
+    ('E5', {4, 11}),
+])
+def test_chord_vector(name, pitch_classes):
+    vector = keys.chord_vector(parse.classify_chord(name))
+    assert set(vector.nonzero()[0]) == pitch_classes
+
+
+def test_add_inferred_key():
+    song = parse.new_song()
+    song['sections']['VERSE 1'] = (
+        '[G]Amazing [C]grace how [D]sweet the [G]sound')
+    parse.add_inferred_key(song)
+    assert song['key'] == 'G'
+    assert song['inferred_key'] == 'G'
+    assert song['inferred_key_confidence'] > 0.5
@@ -0,0 +1,120 @@
+import pytest
+
+import build
+import parse
+from library import Library, song_lyrics
+from test_build import make_args
+
+AMAZING_GRACE = b"""\
+Amazing Grace
+John Newton
+Key: G
+
+Verse 1:
+[G]Amazing grace how [C]sweet the [G]sound
+
+CCLI Song # 22025
+"""
+
+HOW_GREAT = b"""\
+How Great Thou Art
+Stuart Hine
+Key: A
+
+Verse 1:
+[A]O Lord my God, when [D]I in awesome [A]wonder
+[A]Consider all the [D]works Thy hands have [A]made
+
+CCLI Song # 14181
+"""
+
+
+def make_song(data, filename):
+    song = parse.parse_onsong_bytes(data)
+    build.add_song({}, [], song, filename, 0)
+    return song
+
+
+@pytest.fixture
+def library(tmp_path):
+    library = Library(tmp_path / 'library.db')
+    library.put([
+        make_song(AMAZING_GRACE, 'grace.onsong'),
+        make_song(HOW_GREAT, 'great.onsong'),
+    ])
+    yield library
+    library.close()
+
+
+def test_song_lyrics():
+    song = make_song(HOW_GREAT, 'great.onsong')
+    assert song_lyrics(song) == (
+        'O Lord my God, when I in awesome wonder\n'
+        'Consider all the works Thy hands have made')
+
+
+def test_get(library):
+    song = library.get(22025)
+    assert song['title'] == 'Amazing Grace'
+    assert list(song['sections']) == ['Verse 1:']
+    assert library.get('99999') is None
+
+
+def test_put_replaces(library):
+    song = library.get('22025')
+    song['key'] = 'A'
+    library.put([song])
+    assert library.get('22025')['key'] == 'A'
+    assert [s['title'] for s in library.search('grace')] == ['Amazing Grace']
+
+
+def test_put_skips_songs_without_ccli(library):
+    for i, data in enumerate((b'Grace\n\n[G]Unique words', b'[G]Unique')):
+        song = parse.parse_onsong_bytes(data)
+        build.add_song({}, [], song, 'song.onsong', i)
+        library.put([song])
+    assert library.search('unique') == []
+    assert len(library.search()) == 2
+
+
+def test_search(library):
+    assert [s['title'] for s in library.search('sweet')] == ['Amazing Grace']
+    assert library.search('grace', key='A') == []
+    assert [s['title'] for s in library.search(key='A')] == [
+        'How Great Thou Art']
+    assert [s['title'] for s in library.search('hine')] == [
+        'How Great Thou Art']
+    assert library.search('"unbalanced') == []
+
+
+def test_referenced(library):
+    texts = [
+        'This week: Amazing Grace (CCLI Song # 22025), ccli no. 14181',
+        None,
+        'CCLI 22025 again, and CCLI 123456 which we do not know',
+    ]
+    songs = library.referenced(texts)
+    assert [s['id'] for s in songs] == ['22025', '14181']
+    assert library.referenced(texts, exclude=['22025'])[0]['id'] == '14181'
+
+
+def test_build_setlist_adds_referenced_songs(library, tmp_path):
+    args = make_args(tmp_path, tmp_path / 'build', debug=True)
+    song = make_song(AMAZING_GRACE, 'grace.onsong')
+    raw_setlist = {
+        'attachments': [('grace.onsong', AMAZING_GRACE)],
+        'text': 'Amazing Grace then How Great Thou Art (CCLI #14181)',
+    }
+    setlist = build.build_setlist(args, raw_setlist, [song], library)
+    assert setlist['order'] == ['22025', '14181']
+    assert setlist['songs']['14181']['file'] == 'great.onsong'
+
+
+def test_build_setlist_saves_songs(tmp_path):
+    library = Library(tmp_path / 'library.db')
+    args = make_args(tmp_path, tmp_path / 'build', debug=True)
+    song = make_song(HOW_GREAT, 'great.onsong')
+    raw_setlist = {'attachments': [('great.onsong', HOW_GREAT)]}
+    build.build_setlist(args, raw_setlist, [song], library)
+    assert library.get('14181')['title'] == 'How Great Thou Art'
+    library.close()
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from manifest import MISS, Manifest
+
+
+@pytest.fixture
+def song_file(tmp_path):
+    path = tmp_path / 'grace.cho'
+    path.write_bytes(b'Grace\n\n[G]la')
+    return path
+
+
+def new_song(title):
+    return {'title': title, 'sections': {'Verse 1': '[G]la'}}
+
+
+def test_songs_kept_beside_manifest(tmp_path, song_file):
+    path = tmp_path / '.manifest.json'
+    manifest = Manifest(path)
+    data = song_file.read_bytes()
+    manifest.update(song_file.name, song_file.stat(), data, new_song('Grace'))
+    manifest.save()
+
+    entry = json.loads(path.read_text())['inputs'][song_file.name]
+    assert set(entry) == {'mtime', 'size', 'hash'}
+    song_paths = list((tmp_path / '.manifest').glob('*/*.json'))
+    assert [p.stem for p in song_paths] == [entry['hash']]
+
+    manifest = Manifest(path)
+    assert manifest.get(song_file.name, song_file.stat()) == new_song('Grace')
+
+
+def test_save_only_writes_changes(tmp_path, song_file):
+    path = tmp_path / '.manifest.json'
+    manifest = Manifest(path)
+    data = song_file.read_bytes()
+    manifest.update(song_file.name, song_file.stat(), data, new_song('Grace'))
+    manifest.save()
+    path.write_text(path.read_text() + ' ')
+
+    # nothing changed, so nothing is written
+    assert manifest.get(song_file.name, song_file.stat())
+    manifest.save()
+    assert path.read_text().endswith(' ')
+
+    # a removed input is forgotten, with its song
+    manifest.save()
+    assert json.loads(path.read_text())['inputs'] == {}
+    assert list((tmp_path / '.manifest').glob('*/*.json')) == []
+
+
+def test_changed_input_replaces_song(tmp_path, song_file):
+    path = tmp_path / '.manifest.json'
+    manifest = Manifest(path)
+    manifest.update(
+        song_file.name, song_file.stat(), song_file.read_bytes(),
+        new_song('Grace'))
+    manifest.save()
+
+    song_file.write_bytes(b'Amazing Grace\n\n[G]la la')
+    assert manifest.get(song_file.name, song_file.stat()) is MISS
+    data = song_file.read_bytes()
+    manifest.update(
+        song_file.name, song_file.stat(), data, new_song('Amazing Grace'))
+    manifest.save()
+
+    assert len(list((tmp_path / '.manifest').glob('*/*.json'))) == 1
+    manifest = Manifest(path)
+    assert manifest.get(song_file.name, song_file.stat())['title'] == (
+        'Amazing Grace')
+
+
+def test_other_version_discarded(tmp_path, song_file):
+    path = tmp_path / '.manifest.json'
+    manifest = Manifest(path)
+    manifest.update(
+        song_file.name, song_file.stat(), song_file.read_bytes(),
+        new_song('Grace'))
+    manifest.save()
+    path.write_text(json.dumps({'version': -1, 'inputs': {}}))
+
+    manifest = Manifest(path)
+    assert manifest.get(song_file.name, song_file.stat()) is MISS
+    assert not (tmp_path / '.manifest').exists()
+
+
+def test_not_a_song_is_a_hit(tmp_path, song_file):
+    path = tmp_path / '.manifest.json'
+    manifest = Manifest(path)
+    data = song_file.read_bytes()
+    manifest.update(song_file.name, song_file.stat(), data, None)
+    manifest.save()
+
+    manifest = Manifest(path)
+    assert manifest.get(song_file.name, song_file.stat()) is None
+    assert manifest.get(song_file.name, song_file.stat(), data) is None
+
+    # but a missing song file is a miss
+    for song_path in (tmp_path / '.manifest').glob('*/*.json'):
+        song_path.unlink()
+    manifest = Manifest(path)
+    assert manifest.get(song_file.name, song_file.stat()) is MISS
@@ -0,0 +1,101 @@
+from email.message import EmailMessage
+import email
+import email.policy
+import io
+
+import pytest
+
+import mime
+
+
+def make_message():
+    msg = EmailMessage()
+    msg['Subject'] = 'Sunday'
+    msg['Message-Id'] = '<set@example.com>'
+    msg.set_content('Hi all,\n\nsee attached\n')
+    msg.add_alternative('<p>Hi all, see attached</p>', subtype='html')
+    msg.add_attachment(
+        b'%PDF-1.4\n' + bytes(range(256)) * 40, maintype='application',
+        subtype='pdf', filename='song.pdf')
+    msg.add_attachment(
+        'Amazing Grace\n\n[G]Amazing grace caf\xe9 ' + 'x' * 100 + '\n',
+        filename='song.txt', cte='quoted-printable')
+    msg.add_attachment(
+        b'\xff\xd8' + b'\x00' * 10000, maintype='image', subtype='jpeg',
+        filename='photo.jpg')
+
+    forwarded = EmailMessage()
+    forwarded['Subject'] = 'Fwd'
+    forwarded.set_content('forwarded')
+    forwarded.add_attachment(
+        b'{title: Nested}\n', maintype='text', subtype='plain',
+        filename='nested.cho', cte='7bit')
+    msg.add_attachment(forwarded)
+    return msg
+
+
+def expected_parts(msg):
+    return [
+        (part.get_filename(), part.get_content_type(),
+         part.get_payload(decode=True))
+        for part in msg.walk()
+        if not part.is_multipart()
+    ]
+
+
+@pytest.mark.parametrize('linesep', ['\n', '\r\n'])
+def test_parse_matches_email(linesep):
+    data = make_message().as_bytes(policy=email.policy.default.clone(
+        linesep=linesep))
+
+    headers, parts = mime.parse(io.BytesIO(data))
+    result = [
+        (part.get_filename(), part.get_content_type(), part.decode())
+        for part in parts
+    ]
+
+    assert headers['Message-Id'] == '<set@example.com>'
+    assert result == expected_parts(email.message_from_bytes(data))
+    assert [filename for filename, _, _ in result] == [
+        None, None, 'song.pdf', 'song.txt', 'photo.jpg', None, 'nested.cho',
+    ]
+
+
+def test_parse_skips_undecoded_parts():
+    data = make_message().as_bytes()
+
+    headers, parts = mime.parse(io.BytesIO(data))
+    decoded = {}
+    for part in parts:
+        if part.get_filename() in ('song.pdf', 'nested.cho'):
+            decoded[part.get_filename()] = part.decode()
+
+    assert decoded['song.pdf'].startswith(b'%PDF-1.4\n')
+    assert decoded['nested.cho'] == b'{title: Nested}\n'
+
+
+def test_decode_tee():
+    data = make_message().as_bytes()
+    headers, parts = mime.parse(io.BytesIO(data))
+    for part in parts:
+        if part.get_filename() == 'song.pdf':
+            out = io.BytesIO()
+            assert part.decode(out) is None
+    assert out.getvalue() == b'%PDF-1.4\n' + bytes(range(256)) * 40
+
+
+def test_long_lines(monkeypatch):
+    monkeypatch.setattr(mime, 'LINE_LIMIT', 72)
+    msg = make_message()
+    msg.add_attachment(
+        b'a' * 1000, maintype='text', subtype='plain', filename='long.txt',
+        cte='8bit')
+    data = msg.as_bytes()
+
+    headers, parts = mime.parse(io.BytesIO(data))
+    result = [part.decode() for part in parts]
+
+    assert result == [
+        payload for _, _, payload in
+        expected_parts(email.message_from_bytes(data))
+    ]
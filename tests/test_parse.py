@@ -1,3 +1,6 @@
+from concurrent.futures import ThreadPoolExecutor
+import sys
+
 import pytest
 import parse
 
@@ -335,3 +338,152 @@ def chordpro_line_testcases():
 @pytest.mark.parametrize('chords,lyrics,expected', chordpro_line_testcases())
 def test_chordpro_line(chords, lyrics, expected):
     assert parse.chordpro_line(chords, lyrics) == expected
+
+
+def test_classify_chord():
+    chord = parse.classify_chord('Abm7/Eb')
+    assert chord.note == 'Ab'
+    assert chord.third == 'm'
+    assert chord.number == '7'
+    assert chord.bass == '/Eb'
+    assert parse.classify_chord('way') is None
+
+
+def test_classify_chord_cached():
+    parse._classify_chord.cache_clear()
+    token = ''.join(['F', '#m'])
+    parse.classify_chord(token)
+    parse.classify_chord('F#m')
+    info = parse._classify_chord.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+    assert '50.0% hit rate' in parse.chord_cache_info()
+
+
+SONG_TEXT = 'Café Song\n\n[G]Amazing grace – how [C]sweet\n'
+
+
+@pytest.mark.parametrize('encoding, detected, how', [
+    ('utf8', 'utf8', 'utf8'),
+    ('utf-8-sig', 'utf-8-sig', 'bom'),
+    ('utf-16', 'utf-16', 'bom'),
+    ('utf-32', 'utf-32', 'bom'),
+    ('cp1252', None, 'chardet'),
+])
+def test_detect_encoding(encoding, detected, how):
+    raw = SONG_TEXT.encode(encoding)
+    result, result_how = parse.detect_encoding(raw)
+
+    assert result_how == how
+    if detected:
+        assert result == detected
+    assert raw.decode(result) == SONG_TEXT
+
+
+def test_detect_encoding_ascii_sample(monkeypatch):
+    monkeypatch.setattr(parse, 'CHARDET_SAMPLE', 10)
+    raw = ('a' * 20 + 'café').encode('cp1252')
+    assert parse.detect_encoding(raw) == ('cp1252', 'chardet')
+
+
+def test_parse_onsong_counts_encodings(monkeypatch):
+    monkeypatch.setattr(parse, 'ENCODING_COUNTS', parse.Counter())
+    parse.parse_onsong_bytes(SONG_TEXT.encode('utf8'))
+    parse.parse_onsong_bytes(SONG_TEXT.encode('utf-16'))
+    song = parse.parse_onsong_bytes(SONG_TEXT.encode('cp1252'))
+
+    assert song['title'] == 'Café Song'
+    assert parse.encoding_info() == \
+        'encodings: 1 by bom, 1 by utf8, 1 by chardet'
+
+
+def test_parse_onsong_in_threads(monkeypatch):
+    monkeypatch.setattr(parse, 'ENCODING_COUNTS', parse.Counter())
+    songs = [
+        ('Key - {}\n{}'.format(key, SONG_TEXT)).encode('utf8')
+        for key in 'ABCDEFG' * 20
+    ]
+    # switch threads as often as possible, to shake out shared state
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(8) as pool:
+            parsed = list(pool.map(parse.parse_onsong_bytes, songs))
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert parsed == [parse.parse_onsong_bytes(raw) for raw in songs]
+    assert [song['key'] for song in parsed] == list('ABCDEFG' * 20)
+    assert parse.ENCODING_COUNTS['utf8'] == 2 * len(songs)
+
+
+@pytest.mark.parametrize('line,kind,text', [
+    ('   ', 'blank', ''),
+    ('CCLI Song # 22025', 'ccli', '22025'),
+    ('Page 2 of 3', 'page', 'Page 2 of 3'),
+    ('Chorus 2 ', 'section', 'Chorus 2'),
+    ('G   D/F#  Em', 'chord', 'G   D/F#  Em'),
+    ('    7', 'superscript', '    7'),
+    ('Amazing grace ', 'lyric', 'Amazing grace'),
+])
+def test_lex_layout_lines(line, kind, text):
+    [(token_kind, _, token_text, _, _)] = parse.lex_lines([line])
+    assert (token_kind, token_text) == (kind, text)
+
+
+@pytest.mark.parametrize('line,kind,text,name', [
+    ('{comment: Verse 1}', 'section', 'Verse 1', 'comment'),
+    ('{title: Amazing Grace}', 'directive', 'Amazing Grace', 'title'),
+    ('{comment: CCLI Song # 22025}', 'ccli', '22025', 'comment'),
+    ('Page one', 'lyric', 'Page one', None),
+    ('G D Em', 'lyric', 'G D Em', None),
+])
+def test_lex_onsong_lines(line, kind, text, name):
+    [token] = parse.lex_lines([line], layout=False)
+    assert (token[0], token[2], token[3]) == (kind, text, name)
+
+
+def test_lex_lines_is_lazy():
+    lines = iter(['Verse 1', 'la', 'CCLI Song # 22025', 'legal'])
+    tokens = parse.lex_lines(lines)
+    assert [next(tokens)[0] for _ in range(3)] == [
+        'section', 'lyric', 'ccli']
+    assert list(lines) == ['legal']
+
+
+def test_parse_sections_from_generator():
+    def lines():
+        yield 'Verse 1'
+        yield 'G        C'
+        yield 'Amazing grace'
+        yield 'CCLI Song # 22025'
+
+    song = parse.new_song()
+    parse.parse_sections(song, parse.lex_lines(lines()))
+    assert song['sections'] == {'Verse 1': '[G]Amazing g[C]race'}
+    assert song['ccli'] == '22025'
+
+
+def test_onsong_body_directives_kept():
+    song = parse.parse_onsong_bytes(
+        b'Grace\n\nChorus\n{key: A}\n[A]la\n{comment: Verse 2}\nlo\n')
+    assert song['sections'] == {'Chorus': '{key: A}\n[A]la', 'Verse 2': 'lo'}
+
+
+def test_onsong_ccli_comment_ends_body():
+    song = parse.parse_onsong_bytes(
+        b'{title: Grace}\n{copyright: Public Domain CCLI # 22}\n\n'
+        b'{comment: Verse 1}\n[G]la\n{comment: CCLI Song # 22025}\n'
+        b'Public Domain\n')
+    assert song['sections'] == {'Verse 1': '[G]la'}
+    assert song['ccli'] == '22025'
+    assert song['legal'] == 'Public Domain'
+
+
+def test_onsong_ccli_before_section():
+    # a line that both names a section and has a CCLI number is taken as
+    # the CCLI line, ending the body, where it once started a section
+    song = parse.parse_onsong_bytes(
+        b'Grace\n\nVerse 1\n[G]la\nTag: CCLI Song # 22025\nPublic Domain\n')
+    assert song['sections'] == {'Verse 1': '[G]la'}
+    assert song['ccli'] == '22025'
+    assert song['legal'] == 'Public Domain'
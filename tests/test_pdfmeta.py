@@ -0,0 +1,76 @@
+import io
+
+from pdfrw import PdfDict, PdfName, PdfString, PdfWriter
+from pdfrw.objects import IndirectPdfDict
+import pytest
+
+import pdfmeta
+
+
+def make_pdf(pages=3, **info):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.addpage(PdfDict(Type=PdfName.Page, MediaBox=[0, 0, 612, 792]))
+    if info:
+        writer.trailer.Info = IndirectPdfDict(**{
+            k: PdfString.encode(v) for k, v in info.items()
+        })
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize('info', [
+    {'Title': 'Amazing Grace', 'Author': 'John Newton'},
+    {'Title': 'Amazing (Grace) \\ back', 'Creator': 'SongSelect'},
+    {'Author': 'Jöhn Newton ✝', 'Producer': 'iText'},
+])
+def test_read_info_matches_pdfrw(info):
+    data = make_pdf(**info)
+    assert pdfmeta.read_trailer_info(data) == info
+    assert pdfmeta.read_info(data) == pdfmeta.read_pdfrw_info(data)
+
+
+def test_read_info_no_info():
+    assert pdfmeta.read_info(make_pdf()) is None
+
+
+def test_read_info_file(tmp_path):
+    path = tmp_path / 'song.pdf'
+    path.write_bytes(make_pdf(Title='Amazing Grace'))
+    assert pdfmeta.read_info_file(path) == {'Title': 'Amazing Grace'}
+
+
+def test_parse_literal_string_escapes():
+    parser = pdfmeta.Parser(b'(a\\(b\\)\\101 \\\n(c))', 0)
+    assert parser.parse() == b'a(b)A (c)'
+
+
+def test_decode_utf16_hex_string():
+    value = pdfmeta.Parser(b'<FEFF00480069>', 0).parse()
+    assert pdfmeta.decode_text(value) == 'Hi'
+
+
+def test_read_info_falls_back_to_pdfrw_for_xref_streams(monkeypatch):
+    data = make_pdf(Title='Amazing Grace')
+    # point startxref at something that is not an xref table
+    data = data.replace(b'startxref\n', b'startxref\n1')
+    monkeypatch.setattr(pdfmeta, 'read_pdfrw_info', lambda d: 'fallback')
+    assert pdfmeta.read_info(data) == 'fallback'
+
+
+@pytest.mark.parametrize('old,new', [
+    # a garbage trailer
+    (b'trailer', b'trailer null %'),
+    # a truncated one
+    (b'trailer', b'trailer\n<< /Size'),
+    # an Info that is not a reference, or not a dict
+    (b'/Info', b'/Info (x) /Other'),
+    (b' 0 obj\n<<', b' 0 obj\n[ 1 ] <<'),
+])
+def test_read_info_falls_back_to_pdfrw_for_bad_trailers(
+        monkeypatch, old, new):
+    data = make_pdf(Title='Amazing Grace')
+    data = data[:data.rindex(old)] + new + data[data.rindex(old) + len(old):]
+    monkeypatch.setattr(pdfmeta, 'read_pdfrw_info', lambda d: 'fallback')
+    assert pdfmeta.read_info(data) == 'fallback'
@@ -0,0 +1,136 @@
+import io
+import zlib
+
+from pdfrw import PdfArray, PdfDict, PdfName, PdfWriter
+import pytest
+
+import parse
+import pdftext
+
+HELVETICA = PdfDict(
+    Type=PdfName.Font,
+    Subtype=PdfName.Type1,
+    BaseFont=PdfName.Helvetica,
+    FirstChar=32,
+    LastChar=126,
+    Widths=PdfArray(pdftext.HELVETICA_WIDTHS[c] for c in range(32, 127)),
+)
+
+
+def make_pdf(*pages, compress=False, **fonts):
+    writer = PdfWriter()
+    for page in pages:
+        content = PdfDict()
+        if compress:
+            content.Filter = PdfName.FlateDecode
+            content.stream = zlib.compress(page.encode()).decode('latin-1')
+        else:
+            content.stream = page
+        writer.addpage(PdfDict(
+            Type=PdfName.Page,
+            MediaBox=[0, 0, 612, 792],
+            Contents=content,
+            Resources=PdfDict(Font=PdfDict(F1=HELVETICA, **fonts)),
+        ))
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def text_width(text, size=12):
+    return sum(pdftext.HELVETICA_WIDTHS[ord(c)] for c in text) * size / 1000
+
+
+def is_chord_text(text):
+    return parse.is_chord_line(parse.tokenise_chords(text))
+
+
+def test_extract_lines():
+    data = make_pdf(
+        'BT /F1 12 Tf 72 720 Td (Amazing Grace) Tj 0 -14 Td (John) Tj '
+        '[(New) 20 (ton)] TJ ET')
+    assert pdftext.extract_text(data) == 'Amazing Grace\nJohnNewton\n'
+
+
+def test_gaps_become_spaces():
+    data = make_pdf(
+        'BT /F1 12 Tf 72 720 Td (Key) Tj 60 0 Td (G) Tj ET', compress=True)
+    text = pdftext.extract_text(data)
+    assert text.startswith('Key ') and text.rstrip().endswith(' G')
+
+
+def test_lines_ordered_by_baseline_and_blank_lines():
+    data = make_pdf(
+        'BT /F1 12 Tf 72 600 Td (second) Tj ET '
+        'BT /F1 12 Tf 72 720 Td (first) Tj ET')
+    assert pdftext.extract_text(data) == 'first\n\nsecond\n'
+
+
+def test_chords_aligned_by_position():
+    lyrics = 'Amazing grace how sweet'
+    # proportional widths put the chord over 'how', at column 14, though
+    # a fixed width layout would put it nearer column 16
+    x = 72 + text_width('Amazing grace ')
+    data = make_pdf(
+        'BT /F1 12 Tf 72 720 Td (G) Tj ET '
+        'BT /F1 12 Tf {} 720 Td (C) Tj ET '
+        'BT /F1 12 Tf 72 706 Td ({}) Tj ET'.format(x, lyrics))
+    text = pdftext.extract_text(data, is_chord_text)
+    assert text == 'G             C\n' + lyrics + '\n'
+    chords, lyrics = text.split('\n')[:2]
+    assert parse.chordpro_line(chords, lyrics) == (
+        '[G]Amazing grace [C]how sweet')
+
+
+def test_superscript_stays_with_chord():
+    data = make_pdf(
+        'BT /F1 12 Tf 72 720 Td (A) Tj /F1 8 Tf 3 Ts (6) Tj 0 Ts '
+        '/F1 12 Tf (/B) Tj ET '
+        'BT /F1 12 Tf 72 706 Td (Holy) Tj ET')
+    assert pdftext.extract_text(data, is_chord_text) == 'A6/B\nHoly\n'
+
+
+def test_type0_font_with_tounicode():
+    cmap = PdfDict(stream=(
+        'begincmap\n1 beginbfchar\n<0003> <0020>\nendbfchar\n'
+        '1 beginbfrange\n<0024> <0026> <0041>\nendbfrange\nendcmap'))
+    font = PdfDict(
+        Type=PdfName.Font,
+        Subtype=PdfName.Type0,
+        BaseFont=PdfName.Arial,
+        Encoding=PdfName('Identity-H'),
+        ToUnicode=cmap,
+        DescendantFonts=PdfArray([PdfDict(
+            Type=PdfName.Font,
+            Subtype=PdfName.CIDFontType2,
+            DW=1000,
+            W=PdfArray([3, PdfArray([278]), 36, 38, 667]),
+        )]),
+    )
+    data = make_pdf(
+        'BT /F2 12 Tf 72 720 Td <002400250003002600260025> Tj ET', F2=font)
+    assert pdftext.extract_text(data) == 'AB CCB\n'
+
+
+def test_unsupported_filter():
+    data = make_pdf('BT /F1 12 Tf 72 720 Td (Grace) Tj ET')
+    data = data.replace(b'/Length', b'/Filter /LZWDecode /Length')
+    with pytest.raises(pdftext.PdfTextError):
+        pdftext.extract_text(data)
+
+
+def test_convert_pdf_falls_back_to_pdftotext(monkeypatch):
+    calls = []
+
+    def run(command, input, stdout, timeout):
+        calls.append(command)
+        return type('Proc', (), {'stdout': b'fallback\n'})
+
+    monkeypatch.setattr(parse.subprocess, 'run', run)
+    monkeypatch.setattr(parse, 'read_pdf_metadata', lambda song, data: None)
+    data = make_pdf('BT /F1 12 Tf 72 720 Td (Grace) Tj ET')
+    assert parse.convert_pdf(parse.new_song(), data) == 'Grace\n'
+    assert not calls
+    data = data.replace(b'/Length', b'/Filter /LZWDecode /Length')
+    assert parse.convert_pdf(parse.new_song(), data) == 'fallback\n'
+    assert calls == [parse.PDFTOTEXT]
@@ -0,0 +1,42 @@
+import io
+
+import pytest
+
+import profiling
+
+
+def slow(n):
+    return sum(i * i for i in range(n))
+
+
+@pytest.fixture
+def profile_dir(tmp_path):
+    profiling.enable(tmp_path / 'profile')
+    yield tmp_path / 'profile'
+    profiling.disable()
+
+
+def test_run_disabled():
+    assert profiling.run('song.cho', slow, 10) == 285
+
+
+def test_run_and_report(profile_dir):
+    assert profiling.run('1 amazing/grace.cho', slow, 10) == 285
+    assert profiling.run('2-how-great.pdf', slow, 100000) == slow(100000)
+
+    assert sorted(p.name for p in profile_dir.iterdir()) == [
+        '1_amazing_grace.cho.pstats', '2-how-great.pdf.pstats',
+    ]
+
+    out = io.StringIO()
+    path = profiling.report(out=out)
+    report = out.getvalue()
+
+    assert path == profile_dir / 'set.pstats'
+    assert path.exists()
+    # the slowest song comes first, with its hotspot
+    lines = report.splitlines()
+    assert '2-how-great.pdf' in lines[1]
+    assert '<genexpr>' in lines[1]
+    assert 'Ordered by: cumulative time' in report
+    assert 'Ordered by: internal time' in report
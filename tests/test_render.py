@@ -0,0 +1,43 @@
+import json
+import re
+
+import assets
+import render
+
+
+TEMPLATE = """<title>TITLE</title>
+<script id="setlist" type="application/json">
+SETLIST
+</script>
+<script id="pdfdata" type="application/json">
+PDFDATA
+</script>
+"""
+
+
+def test_split_template():
+    parts = render.split_template(TEMPLATE)
+    assert parts[1::2] == ['TITLE', 'SETLIST', 'PDFDATA']
+    assert ''.join(parts) == TEMPLATE
+
+
+def test_render(tmp_path, monkeypatch):
+    monkeypatch.setattr(assets, 'CHUNK_SIZE', 3)
+    setlist = {
+        'title': 'Sunday <AM>',
+        'order': ['1', '2'],
+        # markers inside the data must not be replaced
+        'songs': {'1': {'title': 'TITLE'}, '2': {'title': 'PDFDATA'}},
+    }
+    pdfs = {'2': b'%PDF-1.4 a song', '1': b'%PDF-1.4'}
+    path = tmp_path / 'index.html'
+
+    render.render(
+        render.split_template(TEMPLATE), path, setlist, iter(pdfs.items()))
+
+    output = path.read_text()
+    assert '<title>Sunday &lt;AM&gt;</title>' in output
+    scripts = re.findall(r'<script[^>]*>\n(.*)\n</script>', output)
+    container = json.loads(scripts[1])
+    assert json.loads(scripts[0]) == setlist
+    assert container == assets.container(pdfs.items())
@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture
+def enabled():
+    tracing.enable()
+    yield
+    tracing.disable()
+    tracing.events.clear()
+
+
+def test_span_disabled():
+    recorded = len(tracing.events)
+    with tracing.span('stage', bytes=10) as span:
+        span.set(lines=2)
+    assert span is tracing.NULL_SPAN
+    assert len(tracing.events) == recorded
+
+
+def test_span_enabled(enabled):
+    with tracing.span('outer', filename='a.pdf') as outer:
+        with tracing.span('inner'):
+            pass
+        outer.set(type='pdf')
+
+    inner, outer = tracing.events
+    assert inner['name'] == 'inner'
+    assert outer['name'] == 'outer'
+    assert outer['ph'] == 'X'
+    assert outer['args'] == {'filename': 'a.pdf', 'type': 'pdf'}
+    assert outer['ts'] <= inner['ts']
+    assert outer['dur'] >= inner['dur']
+
+
+def test_span_error(enabled):
+    with pytest.raises(ValueError):
+        with tracing.span('stage'):
+            raise ValueError('bad')
+    assert tracing.events[0]['args'] == {'error': "ValueError('bad')"}
+
+
+def test_write(enabled, tmp_path):
+    with tracing.span('stage', path=tmp_path):
+        pass
+    tracing.write(tmp_path / 'trace.json')
+
+    trace = json.loads((tmp_path / 'trace.json').read_text())
+    assert [e['name'] for e in trace['traceEvents']] == ['stage']
+    assert trace['traceEvents'][0]['args'] == {'path': str(tmp_path)}
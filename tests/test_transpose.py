@@ -0,0 +1,98 @@
+from collections import OrderedDict
+import os
+import subprocess
+import sys
+
+import pytest
+
+import transpose
+
+
+def make_song(key, *sections):
+    return {
+        'key': key,
+        'sections': OrderedDict(
+            ('Verse {}'.format(i), section)
+            for i, section in enumerate(sections, 1)),
+    }
+
+
+@pytest.mark.parametrize('chord,semitones,key,expected', [
+    ('G', 2, 'A', 'A'),
+    ('D/F#', 1, 'Ab', 'Eb/G'),
+    ('Em7', 3, 'Bb', 'Gm7'),
+    ('Cadd9', 6, 'Db', 'Gbadd9'),
+    ('Bbsus4', 2, 'C', 'Csus4'),
+    ('Am', 1, 'Bb', 'Bbm'),
+    ('G#m7b5', 0, 'E', 'G#m7b5'),
+    # borrowed chords in C are spelt as usual
+    ('F', 5, 'C', 'Bb'),
+    ('E', 2, 'C', 'F#'),
+    ('N.C.', 3, 'C', 'N.C.'),
+    ('x2', 3, 'C', 'x2'),
+])
+def test_transpose_chord(chord, semitones, key, expected):
+    assert transpose.transpose_chord(chord, semitones, key) == expected
+
+
+def test_spellings():
+    assert transpose.SPELLINGS['F'][10] == 'Bb'
+    assert transpose.SPELLINGS['E'][8] == 'G#'
+    assert transpose.SPELLINGS['Db'][6] == 'Gb'
+
+
+def test_transpositions():
+    song = make_song('G', '[G]Amazing [D/F#]grace', '[Em7]how [G]sweet [C]')
+    table = transpose.transpositions(song)
+    assert list(table) == [
+        'G', 'Ab', 'A', 'Bb', 'B', 'C', 'Db', 'D', 'Eb', 'E', 'F', 'F#']
+    assert table['G'] == ['G', 'D/F#', 'Em7', 'C']
+    assert table['Ab'] == ['Ab', 'Eb/G', 'Fm7', 'Db']
+    assert table['E'] == ['E', 'B/D#', 'C#m7', 'A']
+
+
+def test_transpositions_minor():
+    song = make_song('Em', '[Em]O [C]come [D]O [B7]come')
+    table = transpose.transpositions(song)
+    assert 'Fm' in table and 'F' not in table
+    # spelt as in Ab, Fm's relative major
+    assert table['Fm'] == ['Fm', 'Db', 'Eb', 'C7']
+    assert table['C#m'] == ['C#m', 'A', 'B', 'G#7']
+
+
+def test_add_transpositions_skips_songs_without_keys():
+    songs = [make_song(None, '[G]Amazing'), make_song('D', '[D]Grace')]
+    transpose.add_transpositions(songs)
+    assert 'transpositions' not in songs[0]
+    assert songs[1]['transpositions']['D'] == ['D']
+    assert songs[1]['transpositions']['Eb'] == ['Eb']
+
+
+@pytest.mark.parametrize('key,expected', [
+    ('G', (7, False)),
+    ('F#m', (6, True)),
+    ('C#', (1, False)),
+    ('G major', (7, False)),
+    ('Bb (Capo 1)', (10, False)),
+    ('G/B', (7, False)),
+    ('Gm7', (None, False)),
+    ('Capo 2', (None, False)),
+    ('', (None, False)),
+])
+def test_parse_key(key, expected):
+    assert transpose.parse_key(key) == expected
+
+
+def test_tables_skip_unparsable_keys():
+    songs = [make_song('Capo 2', '[G]Amazing'), make_song('G major', '[G]la')]
+    tables = transpose.transposition_tables(songs)
+    assert tables[0] is None
+    assert tables[1]['G major'] == ['G']
+    assert tables[1]['A'] == ['A']
+
+
+def test_import_does_not_load_numpy():
+    # transpose runs on every build, so must not pull in numpy via keys
+    check = 'import sys, transpose; sys.exit("numpy" in sys.modules)'
+    subprocess.run(
+        [sys.executable, '-c', check], env=dict(os.environ), check=True)
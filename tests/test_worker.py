@@ -0,0 +1,100 @@
+import argparse
+
+import pytest
+
+import worker
+from test_batch import make_message
+from test_build import AMAZING_GRACE
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = worker.Queue(tmp_path / 'queue.db')
+    yield queue
+    queue.close()
+
+
+def make_args(tmp_path, **kwargs):
+    args = dict(
+        queue=tmp_path / 'queue.db', output=tmp_path / 'out',
+        spool=tmp_path / 'spool', jobs=2, retries=1, backoff=0.0,
+        poll=0.01, once=True, stats=False, options=['--debug'],
+    )
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+def test_queue_claim_and_retry(queue):
+    first = queue.put('first', b'one')
+    second = queue.put('second', b'two')
+
+    assert queue.claim() == (first, 'first', b'one')
+    assert queue.fail(first, 'oops', retries=1, backoff=60) == 60
+    # the first is backing off, so the second goes next
+    assert queue.claim() == (second, 'second', b'two')
+    assert queue.claim() is None
+    assert queue.depth() == 2
+
+    queue.finish(second, 0.5)
+    stats = queue.stats()
+    assert stats['depth'] == 1
+    assert stats['states'] == {'queued': 1, 'done': 1}
+    assert stats['build'] == {'p50': 0.5, 'p95': 0.5, 'max': 0.5}
+
+
+def test_queue_gives_up(queue):
+    id = queue.put('job', b'data')
+    queue.claim()
+    assert queue.fail(id, 'oops', retries=1, backoff=0) == 0
+    queue.claim()
+    assert queue.fail(id, 'oops', retries=1, backoff=0) is None
+    assert queue.claim() is None
+    assert queue.stats()['states'] == {'failed': 1}
+
+
+def test_queue_recover(queue):
+    queue.put('job', b'data')
+    queue.claim()
+    queue.recover()
+    assert queue.claim()[1] == 'job'
+
+
+def test_percentiles():
+    assert worker.percentiles([]) is None
+    assert worker.percentiles(list(range(100, 0, -1))) == {
+        'p50': 51, 'p95': 96, 'max': 100,
+    }
+
+
+def test_main_builds_spooled_emails(tmp_path):
+    args = make_args(tmp_path)
+    args.spool.mkdir()
+    good = make_message('<good@example.com>', [('grace.cho', AMAZING_GRACE)])
+    bad = make_message('<bad@example.com>', [])
+    (args.spool / '1.eml').write_bytes(bytes(good))
+    (args.spool / '2.eml').write_bytes(bytes(bad))
+
+    worker.main(args)
+
+    assert list(args.spool.iterdir()) == []
+    assert (args.output / 'good@example.com' / 'grace.cho').exists()
+    assert not (args.output / 'bad@example.com').exists()
+    assert list((args.output / '.staging').iterdir()) == []
+
+    queue = worker.Queue(args.queue)
+    stats = queue.stats()
+    assert stats['states'] == {'done': 1, 'failed': 1}
+    assert stats['latency']['max'] > 0
+    queue.close()
+
+
+def test_publish_replaces_previous_build(tmp_path):
+    args = make_args(tmp_path)
+    for contents in ('old', 'new'):
+        staged = args.output / '.staging' / 'job-1'
+        staged.mkdir(parents=True)
+        (staged / 'index.html').write_text(contents)
+        worker.publish(args, 'job-1', 'set')
+
+    assert (args.output / 'set' / 'index.html').read_text() == 'new'
+    assert list((args.output / '.staging').iterdir()) == []